@@ -0,0 +1,314 @@
+"""
+Microbenchmarks for the SVG processing hot paths of `wagtail_svgmap`.
+
+Synthetic SVG documents are generated deterministically: flat maps (all elements are children of the root)
+and nested maps (elements within nested groups), with a varying number of elements, a varying proportion of
+which are linked.
+
+Usage (from the repository root):
+
+    python benchmarks/svg_bench.py                  # Run the quick suite and print the results
+    python benchmarks/svg_bench.py --suite full     # Include the 200k-element maps
+    python benchmarks/svg_bench.py --save           # Store the results as the baseline
+    python benchmarks/svg_bench.py --compare        # Compare against the baseline; exits with 1 on regressions
+    python benchmarks/svg_bench.py -k wrap          # Only run benchmarks whose names contain `wrap`
+    python benchmarks/svg_bench.py --backend etree lxml  # Run the tree benchmarks with both XML backends
+
+Timings depend on the hardware (and the Python version), so each result is also stored relative to a reference
+workload timed in the same run (parsing a map with the standard library's `ElementTree`, which none of the code
+benchmarked here affects); `--compare` compares those relative timings.  They only cancel out so much, though,
+so for reliable comparisons, regenerate the baseline locally (`--save`, on the revision to compare against).
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+from six import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wagtail_svgmap.pipeline import Pipeline  # noqa: E402
+from wagtail_svgmap.streaming import compile_svg, stream_wrap_elements_in_links  # noqa: E402
+from wagtail_svgmap.svg import (  # noqa: E402
+    find_ids, fix_dimensions, fixup_unqualified_attributes, get_dimensions, serialize_svg, SVG_NAMESPACE,
+    wrap_elements_in_links
+)
+from wagtail_svgmap.xml_backends import ET, get_backend  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SUITES = {
+    'quick': {'sizes': (100, 1000, 10000), 'shapes': ('flat', 'nested'), 'link_ratios': (0.01, 1.0)},
+    'full': {'sizes': (100, 1000, 10000, 200000), 'shapes': ('flat', 'nested'), 'link_ratios': (0.01, 1.0)},
+}
+
+#: Nesting factor for nested maps: every group contains this many elements/groups.
+NESTING_FANOUT = 4
+
+
+def generate_svg(n_elements, shape='flat', seed=42):
+    """
+    Generate a synthetic SVG map.
+
+    :param n_elements: Number of `<path>` elements (each with an ID) in the map.
+    :param shape: `flat` or `nested`.
+    :param seed: Random seed for the path data.
+    :return: The SVG document, and the list of element IDs in it.
+    :rtype: tuple[bytes, list[str]]
+    """
+    rng = random.Random(seed)
+    ids = ['p%d' % i for i in range(n_elements)]
+
+    def path(element_id):
+        points = ' '.join('L%d %d' % (rng.randint(0, 1000), rng.randint(0, 1000)) for i in range(8))
+        return '<path id="%s" class="region" d="M0 0 %s z"/>' % (element_id, points)
+
+    def nest(element_ids, depth):
+        if len(element_ids) <= NESTING_FANOUT:
+            return ''.join(path(element_id) for element_id in element_ids)
+        chunk_size = -(-len(element_ids) // NESTING_FANOUT)  # (Ceiling division.)
+        return ''.join(
+            '<g id="g%d-%d">\n%s</g>\n' % (depth, i, nest(element_ids[i:i + chunk_size], depth + 1))
+            for i in range(0, len(element_ids), chunk_size)
+        )
+
+    if shape == 'flat':
+        body = '\n'.join(path(element_id) for element_id in ids)
+    elif shape == 'nested':
+        body = nest(ids, 0)
+    else:
+        raise ValueError('unknown shape %r' % shape)
+    svg = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        'width="1000" height="1000">\n%s\n</svg>' % body
+    )
+    return (svg.encode('UTF-8'), ids)
+
+
+def generate_links(ids, ratio):
+    """
+    Generate an ID-to-URL map linking the given proportion of the IDs (evenly spread).
+
+    :rtype: dict[str, str]
+    """
+    n_links = max(1, int(len(ids) * ratio))
+    step = len(ids) / float(n_links)
+    return {ids[int(i * step)]: '/page/%d/' % i for i in range(n_links)}
+
+
+def _temp_file(data):
+    # A real file, so `find_ids` gets to use its `mmap` fast path.
+    temp_file = tempfile.TemporaryFile()
+    temp_file.write(data)
+    temp_file.seek(0)
+    return temp_file
+
+
+#: The XML backend the trees are parsed with (see `--backend`).
+_backend_name = 'etree'
+
+
+def _parse(data):
+    return get_backend(_backend_name).parse(BytesIO(data))
+
+
+def _wrapped(data, links):
+    tree = wrap_elements_in_links(_parse(data), links)
+    fix_dimensions(tree)
+    return tree
+
+
+def _stream(data, links):
+    stream_wrap_elements_in_links(BytesIO(data), BytesIO(), links, root_transform=fix_dimensions)
+
+
+#: Benchmarks: (name, whether it depends on the links, setup function, benchmarked function).
+#: The setup function is passed the SVG data and links, and returns the arguments for the benchmarked function;
+#: it's run (untimed) before each repetition, since some of the functions modify trees in-place.
+BENCHMARKS = [
+    ('find_ids', False, lambda data, links: (_temp_file(data),), lambda stream: list(find_ids(stream))),
+    ('find_ids_stream', False, lambda data, links: (BytesIO(data),), lambda stream: list(find_ids(stream))),
+    ('wrap_elements_in_links', True, lambda data, links: (_parse(data), links), wrap_elements_in_links),
+    ('fixup_unqualified_attributes', False, lambda data, links: (_parse(data), SVG_NAMESPACE),
+     fixup_unqualified_attributes),
+    ('serialize_svg', True, lambda data, links: (_wrapped(data, links),), serialize_svg),
+    ('fix_dimensions', False, lambda data, links: (_parse(data),), fix_dimensions),
+    ('get_dimensions', False, lambda data, links: (_wrapped(data, {}),), get_dimensions),
+    ('stream_wrap_elements_in_links', True, lambda data, links: (data, links), _stream),
+    ('pipeline', False, lambda data, links: (Pipeline(), BytesIO(data)), lambda pipeline, stream: pipeline.run(stream)),
+    ('compiled_render', True, lambda data, links: (compile_svg(BytesIO(data), root_transform=fix_dimensions), links),
+     lambda compiled, links: compiled.render(links)),
+]
+
+#: The benchmarks of functions processing parsed trees, which are run with each of the `--backend`s.
+TREE_BENCHMARKS = {'wrap_elements_in_links', 'fixup_unqualified_attributes', 'serialize_svg', 'fix_dimensions',
+                   'get_dimensions'}
+
+
+def time_call(setup, func, repeat):
+    """
+    Time a function call, returning the best time of `repeat` runs (after a fresh setup for each).
+
+    :rtype: float
+    """
+    best = None
+    for i in range(repeat):
+        args = setup()
+        start = timeit.default_timer()
+        func(*args)
+        elapsed = timeit.default_timer() - start
+        best = (elapsed if best is None else min(best, elapsed))
+    return best
+
+
+def time_reference(repeat=10):
+    """
+    Time the reference workload (see the module docstring), to normalize the other timings by.
+
+    :rtype: float
+    """
+    data = generate_svg(10000)[0]
+    return time_call(lambda: (data,), ET.fromstring, repeat)
+
+
+def iterate_cases(suite):
+    for shape in suite['shapes']:
+        for size in suite['sizes']:
+            data, ids = generate_svg(size, shape)
+            for ratio in suite['link_ratios']:
+                yield ('%s-%d-%d%%' % (shape, size, ratio * 100), data, ids, generate_links(ids, ratio), ratio)
+
+
+def iterate_benchmarks(backends):
+    for name, uses_links, setup, func in BENCHMARKS:
+        for backend_name in (backends if name in TREE_BENCHMARKS else ('etree',)):
+            yield (name, backend_name, uses_links, setup, func)
+
+
+def run(suite, keyword=None, repeat=None, backends=('etree',)):
+    """
+    Run the benchmarks.
+
+    :return: Mapping of benchmark keys (`function/case`, suffixed with `@backend` for other backends than `etree`)
+             to result dicts.
+    :rtype: dict[str, dict]
+    """
+    global _backend_name
+    results = {}
+    reference = time_reference()
+    print('%-60s %10.3f ms' % ('(reference)', reference * 1000))
+    for case, data, ids, links, ratio in iterate_cases(suite):
+        for name, backend_name, uses_links, setup, func in iterate_benchmarks(backends):
+            if not uses_links and ratio != suite['link_ratios'][0]:  # No point repeating these per ratio
+                continue
+            key = '%s/%s' % (name, (case if uses_links else case.rsplit('-', 1)[0]))
+            if backend_name != 'etree':
+                key += '@%s' % backend_name
+            if keyword and keyword not in key:
+                continue
+            _backend_name = backend_name
+            n_repeat = repeat or max(3, min(10, 20000 // len(ids)))
+            elapsed = time_call(lambda: setup(data, links), func, n_repeat)
+            results[key] = {
+                'seconds': elapsed,
+                'relative': elapsed / reference,
+                'elements_per_second': len(ids) / elapsed if elapsed else None,
+                'megabytes_per_second': len(data) / 1e6 / elapsed if elapsed else None,
+            }
+            print(format_result(key, results[key]))
+            sys.stdout.flush()
+    return results
+
+
+def format_result(key, result, baseline=None):
+    line = '%-60s %10.3f ms %14.0f elem/s %9.1f MB/s' % (
+        key,
+        result['seconds'] * 1000,
+        result['elements_per_second'] or 0,
+        result['megabytes_per_second'] or 0,
+    )
+    if baseline:
+        line += ' %+7.1f%%' % ((get_ratio(result, baseline) - 1) * 100)
+    return line
+
+
+def get_ratio(result, baseline):
+    """
+    Get the ratio of a timing to its baseline; relative to the reference workload if both have been timed so.
+
+    :rtype: float
+    """
+    if result.get('relative') and baseline.get('relative'):
+        return result['relative'] / baseline['relative']
+    return result['seconds'] / baseline['seconds']
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results to a baseline.
+
+    :return: List of keys of the benchmarks that regressed by more than `threshold` (a fraction).
+    :rtype: list[str]
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        if not baseline[key].get('relative'):
+            print('(No relative timing in the baseline for %s; comparing absolute timings.)' % key)
+        print(format_result(key, result, baseline[key]))
+        if get_ratio(result, baseline[key]) > 1 + threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Microbenchmarks for wagtail_svgmap.')
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('-k', dest='keyword', help='only run benchmarks whose key contains this')
+    parser.add_argument('--repeat', type=int, help='repetitions per benchmark (default: scaled by size)')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results to the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold (default: %(default)s)')
+    parser.add_argument('--backend', nargs='+', default=['etree'], choices=('etree', 'lxml'), dest='backends',
+                        help='the XML backends to run the tree benchmarks with (default: etree)')
+    args = parser.parse_args(argv)
+
+    results = run(SUITES[args.suite], keyword=args.keyword, repeat=args.repeat, backends=args.backends)
+
+    if args.compare:
+        with open(args.baseline) as infp:
+            baseline = json.load(infp)['results']
+        print('\nCompared to %s:' % args.baseline)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n%d regression(s) over %d%%:' % (len(regressions), args.threshold * 100))
+            for key in regressions:
+                print('  %s' % key)
+            return 1
+
+    if args.save:
+        baseline = {}
+        if os.path.isfile(args.baseline):  # Merge, so partial (`-k`) runs don't drop other results
+            with open(args.baseline) as infp:
+                baseline = json.load(infp)['results']
+        baseline.update(results)
+        with open(args.baseline, 'w') as outfp:
+            json.dump({
+                'python': sys.version.split()[0],
+                'results': baseline,
+            }, outfp, indent=2, sort_keys=True)
+        print('\nSaved %d results to %s' % (len(results), args.baseline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
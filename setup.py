@@ -8,5 +8,9 @@ setup(
     packages=find_packages('.', include=('wagtail_svgmap*')),
     include_package_data=True,
     install_requires=['wagtail>=1.5.3'],
+    extras_require={
+        'brotli': ['brotli'],
+        'lxml': ['lxml'],
+    },
     zip_safe=False,
 )
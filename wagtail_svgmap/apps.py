@@ -1,5 +1,6 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class WagtailSvgmapConfig(AppConfig):
@@ -7,6 +8,18 @@ class WagtailSvgmapConfig(AppConfig):
     verbose_name = 'Wagtail-Svgmap'
 
     def ready(self):
-        from .signal_handlers import handle_recache_imagemap
-        post_save.connect(handle_recache_imagemap, sender='wagtailcore.Page')
-        post_save.connect(handle_recache_imagemap, sender='wagtaildocs.Document')
+        from .recache import discard_rolled_back
+        from .signal_handlers import (
+            Document, handle_page_pre_save, handle_recache_imagemap, handle_region_delete, Page, Site
+        )
+        # Signals are sent for the concrete class of an instance, so the handlers are connected for each of the
+        # page (and document) classes, rather than for all senders (i.e. every model saved anywhere).
+        for model in self.apps.get_models():
+            if issubclass(model, Page):
+                pre_save.connect(handle_page_pre_save, sender=model)
+                post_save.connect(handle_recache_imagemap, sender=model)
+            elif issubclass(model, (Document, Site)):
+                post_save.connect(handle_recache_imagemap, sender=model)
+        post_delete.connect(handle_recache_imagemap, sender='wagtailcore.Site')
+        post_delete.connect(handle_region_delete, sender='wagtail_svgmap.Region')
+        request_finished.connect(discard_rolled_back, dispatch_uid='wagtail_svgmap.recache.discard_rolled_back')
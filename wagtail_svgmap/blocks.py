@@ -1,9 +1,14 @@
 from __future__ import absolute_import, unicode_literals
 
+import hashlib
+import re
+
 from django.conf import settings
 from django.forms import Select
 from django.forms.utils import flatatt
-from django.utils.html import escape, mark_safe
+from django.utils.encoding import force_bytes
+from django.utils.html import escape, escapejs, mark_safe
+from django.utils.translation import get_language
 from django.utils.translation import ugettext_lazy as _
 
 try:
@@ -12,6 +17,111 @@ except ImportError:
     from wagtail.wagtailcore import blocks
 
 from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.render_cache import get_render_cache
+
+ROOT_ID_RE = re.compile(r'^<svg\b[^>]*?\sid="([^"]*)"')
+
+#: Loads the SVG of a lazy image map container (see `ImageMapBlock.lazy`) once it nears the viewport.
+LAZY_LOAD_SCRIPT = (
+    'window.wagtailSvgmapLoad=window.wagtailSvgmapLoad||function(id){'
+    'var el=document.getElementById(id);'
+    'function load(){'
+    'var xhr=new XMLHttpRequest();'
+    'xhr.open("GET",el.getAttribute("data-svgmap-src"));'
+    'xhr.onload=function(){if(xhr.status==200){el.innerHTML=xhr.responseText;}};'
+    'xhr.send();'
+    '}'
+    'if(!window.IntersectionObserver){load();return;}'
+    'var observer=new IntersectionObserver(function(entries){'
+    'if(entries[0].isIntersecting){observer.disconnect();load();}'
+    '},{rootMargin:"%s"});'
+    'observer.observe(el);'
+    '};'
+)
+
+
+class PageRenderContext(object):
+    """
+    Keeps track of what the `ImageMapBlock`s on a page (i.e. rendered for the same request) have emitted,
+    so that repeated image maps (and styles) aren't emitted over and over again.
+    """
+
+    def __init__(self):
+        self.occurrences = {}  # image map ID -> number of occurrences so far
+        self.svg_ids = {}  # image map ID -> ID of the root element of its first occurrence
+        self.emitted = set()
+
+    @classmethod
+    def get(cls, context):
+        """
+        Get the page render context for a template context (from its request).
+
+        :return: The page render context, or None if there's no request to scope it to.
+        :rtype: PageRenderContext|None
+        """
+        request = (context.get('request') if context else None)
+        if request is None:
+            return None
+        page_context = getattr(request, '_wagtail_svgmap_render_context', None)
+        if page_context is None:
+            page_context = request._wagtail_svgmap_render_context = cls()
+        return page_context
+
+    def add_occurrence(self, image_map_id):
+        """
+        Count an occurrence of an image map.
+
+        :return: The number of the previous occurrences of the image map.
+        :rtype: int
+        """
+        n = self.occurrences.get(image_map_id, 0)
+        self.occurrences[image_map_id] = n + 1
+        return n
+
+    def emit_once(self, markup):
+        """
+        Mark a piece of shared markup (e.g. a style) emitted.
+
+        :return: False if the markup was already emitted.
+        :rtype: bool
+        """
+        if markup in self.emitted:
+            return False
+        self.emitted.add(markup)
+        return True
+
+
+def identify_svg(svg, svg_id):
+    """
+    Make sure the root element of rendered SVG markup has an ID, so it can be referenced.
+
+    :param svg: The SVG markup.
+    :type svg: str
+    :param svg_id: The ID to give the root element, unless it has one already.
+    :type svg_id: str
+    :return: The markup and the ID of the root element (None if the markup doesn't start with the root element)
+    :rtype: tuple[str, str|None]
+    """
+    if not svg.startswith('<svg'):  # pragma: no cover
+        return (svg, None)
+    match = ROOT_ID_RE.match(svg)
+    if match:
+        return (svg, match.group(1))
+    return ('<svg id="%s"%s' % (svg_id, svg[len('<svg'):]), svg_id)
+
+
+def find_svg_id(html):
+    """
+    Find the ID of the first SVG root element in (e.g. block) markup.
+
+    :param html: The markup.
+    :type html: str
+    :return: The ID, or None if there is no SVG root element with an ID.
+    :rtype: str|None
+    """
+    start = html.find('<svg')
+    match = (ROOT_ID_RE.match(html[start:]) if start >= 0 else None)
+    return (match.group(1) if match else None)
 
 
 class _ImageMapChoiceBlock(blocks.ChooserBlock):
@@ -22,6 +132,33 @@ class _ImageMapChoiceBlock(blocks.ChooserBlock):
     target_model = ImageMap
     widget = Select
 
+    #: The fields of image maps needed for rendering them (see `ImageMapBlock.render`), including the rendered SVG
+    #: from the artifacts (see `ImageMap.artifacts`); the rest (e.g. the SVG file) are only loaded if need be.
+    RENDER_FIELDS = (
+        'pk', 'title', '_render_digest', '_width_cache', '_height_cache', '_has_variants',
+        'artifacts_row__render_cache',
+    )
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        return self.get_queryset().filter(pk=value).first()
+
+    def bulk_to_python(self, values):
+        """
+        Get the image maps for a list of primary keys, in a single query.
+
+        :return: The image maps, in the same order as the values, with None for missing ones.
+        :rtype: list[ImageMap|None]
+        """
+        pk_field = self.target_model._meta.pk
+        pks = [(pk_field.to_python(value) if value is not None else None) for value in values]
+        image_maps = self.get_queryset().in_bulk({pk for pk in pks if pk is not None})
+        return [image_maps.get(pk) for pk in pks]
+
+    def get_queryset(self):
+        return self.target_model.objects.select_related('artifacts_row').only(*self.RENDER_FIELDS)
+
     def value_for_form(self, value):
         if hasattr(value, 'pk'):
             return value.pk
@@ -39,8 +176,35 @@ class ImageMapBlock(blocks.StructBlock):
     map = _ImageMapChoiceBlock(required=True, label=_('Image map'))
     css_class = blocks.CharBlock(required=False, label=_('CSS class'))
 
-    # Feel free to override this in an `ImageMapBlock` subclass of your own!
+    # Feel free to override these in an `ImageMapBlock` subclass of your own!
     ie_compatibility = getattr(settings, 'WAGTAIL_SVGMAP_IE_COMPAT', True)
+    # The class of the container elements (besides the block's CSS class), which the IE compatibility style
+    # is scoped to.
+    container_class = 'wagtail-svgmap'
+    # Whether to inline the SVG markup, or to reference the standalone SVG (see `ImageMap.svg_url`)
+    # with an `<object>`, so browsers and CDNs can cache it separately from the pages.
+    inline = getattr(settings, 'WAGTAIL_SVGMAP_INLINE', True)
+    # Whether to only render the (aspect ratio preserving) container, and have the SVG fetched (from `svg_url`)
+    # and inlined into it as it nears the viewport (within `lazy_margin`).
+    lazy = getattr(settings, 'WAGTAIL_SVGMAP_LAZY', False)
+    lazy_margin = '200px'
+    # Whether to cache the rendered markup of the blocks (in the render cache, see `wagtail_svgmap.render_cache`),
+    # keyed by the render digest of the map, the block options and values, and the state of the page rendered.
+    fragment_cache = getattr(settings, 'WAGTAIL_SVGMAP_FRAGMENT_CACHE', True)
+
+    def bulk_to_python(self, values):
+        """
+        Convert the values of many image map blocks (e.g. in a StreamField) at once, with a single query
+        for all of their image maps.
+        """
+        values = list(values)
+        image_maps = self.child_blocks['map'].bulk_to_python([value.get('map') for value in values])
+        struct_values = []
+        for value, image_map in zip(values, image_maps):
+            struct_value = self.to_python(dict(value, map=None))  # (Not querying for the map.)
+            struct_value['map'] = image_map
+            struct_values.append(struct_value)
+        return struct_values
 
     def render(self, value, context=None):
         if not value:  # pragma: no cover
@@ -51,20 +215,182 @@ class ImageMapBlock(blocks.StructBlock):
             return ''
         assert isinstance(image_map, ImageMap)
 
+        page_context = PageRenderContext.get(context)
+        container_id, occurrence, reference_id = self._place_on_page(value, page_context)
+        site = language = None
+        if not reference_id and image_map._has_variants:  # (Also for the standalone SVGs, see `get_svg_url`.)
+            request = (context.get('request') if context else None)
+            site = getattr(request, 'site', None)
+            language = get_language()
+        style, script = self._get_shared_markup(page_context)
+        render_options = dict(
+            container_id=container_id,
+            page_context=page_context,
+            reference_id=reference_id,
+            site=site,
+            language=language,
+            style=style,
+            script=script,
+        )
+
+        fragment = None
+        if self.fragment_cache:
+            render_cache = get_render_cache()
+            digest = image_map.rendered_svg_digest
+            fragment_key = self._get_fragment_key(value, **render_options)
+            fragment = render_cache.get(image_map.pk, digest, fragment_key)
+        if fragment is None:
+            fragment = self.render_fragment(value, **render_options)
+            if self.fragment_cache:
+                render_cache.set(image_map.pk, digest, fragment, fragment_key)
+
+        if page_context and self.inline and not self.lazy and not occurrence:
+            page_context.svg_ids[image_map.pk] = find_svg_id(fragment)
+
+        return mark_safe(fragment)
+
+    def _place_on_page(self, value, page_context):
+        """
+        Figure out the container ID of an image map block, and whether it can reference an earlier occurrence.
+
+        Within a page, repeated maps get container IDs of their own, and (if inlined) reference the SVG
+        of the first occurrence.
+
+        :param value: The block value.
+        :type value: wagtail.core.blocks.StructValue
+        :param page_context: The page render context, if any.
+        :type page_context: PageRenderContext|None
+        :return: The container ID, the number of the earlier occurrences of the map on the page,
+                 and the ID of the SVG to reference (if any).
+        :rtype: tuple[str, int, str|None]
+        """
+        image_map = value['map']
+        occurrence = (page_context.add_occurrence(image_map.pk) if page_context else 0)
+        container_id = self.get_container_id(value)
+        if not occurrence:
+            return (container_id, 0, None)
+        reference_id = (page_context.svg_ids.get(image_map.pk) if (self.inline and not self.lazy) else None)
+        return ('%s-%d' % (container_id, occurrence + 1), occurrence, reference_id)
+
+    def _get_shared_markup(self, page_context):
+        """
+        Get the IE compatibility style and the lazy loading script to emit along with a block.
+
+        The shared markup is only emitted by the first block on the page needing it.
+
+        :param page_context: The page render context, if any.
+        :type page_context: PageRenderContext|None
+        :return: The style (None if not needed), and the script (None if not lazy, empty if emitted earlier).
+        :rtype: tuple[str|None, str|None]
+        """
+        style = None
+        if self.ie_compatibility:  # pragma: no branch
+            selector = '.%s' % self.container_class
+            if self.inline:
+                style = '%s svg{position:absolute;top:0;left:0}' % selector
+            else:
+                style = '%s object{position:absolute;top:0;left:0;width:100%%;height:100%%}' % selector
+            if page_context and not page_context.emit_once(style):
+                style = None
+        script = None
+        if self.inline and self.lazy:
+            script = LAZY_LOAD_SCRIPT % escapejs(self.lazy_margin)
+            if page_context and not page_context.emit_once(script):
+                script = ''
+        return (style, script)
+
+    def _get_fragment_key(self, value, container_id, page_context, reference_id, site, language, style, script):
+        """
+        Get the render cache key of the markup of an image map block (see `render_fragment`).
+
+        The key covers the block options and values, and all of the arguments of `render_fragment`;
+        the render digest of the map is a part of the key anyway.
+
+        :rtype: tuple[str, str]
+        """
+        fragment_options = (
+            type(self).__module__, type(self).__name__, self.ie_compatibility, self.inline, self.lazy,
+            self.lazy_margin, self.container_class, [(name, val) for (name, val) in value.items() if name != 'map'],
+            container_id, bool(page_context), reference_id, (site.pk if site else None), language, style, script,
+        )
+        return ('fragment', hashlib.sha1(force_bytes(repr(fragment_options))).hexdigest())
+
+    def render_fragment(self, value, container_id, page_context, reference_id, site, language, style, script):
+        """
+        Render the markup of an image map block (cached by `render`, keyed by all of the arguments).
+
+        :param value: The block value.
+        :type value: wagtail.core.blocks.StructValue
+        :param container_id: The ID of the container element.
+        :type container_id: str
+        :param page_context: The page render context, if any.
+        :type page_context: PageRenderContext|None
+        :param reference_id: The ID of the SVG rendered earlier on the page to reference, if any.
+        :type reference_id: str|None
+        :param site: The site to render the variant of, if any (see `ImageMap.get_rendered_svg`).
+        :type site: wagtail.core.models.Site|None
+        :param language: The active language.
+        :type language: str|None
+        :param style: The IE compatibility style to emit, if any.
+        :type style: str|None
+        :param script: The lazy loading script to emit, if lazy (empty if emitted earlier on the page).
+        :type script: str|None
+        :return: HTML markup
+        :rtype: str
+        """
+        image_map = value['map']
         attrs = self.get_container_attrs(value)
-        assert 'id' in attrs  # required for the inline style
+        attrs['id'] = container_id
+
+        if script is not None:
+            # The standalone variant for the current site, just like the inlined one (see below).
+            svg_url = image_map.get_svg_url(site=site, language=language)
+            attrs['data-svgmap-src'] = svg_url
+            svg = '<noscript><object data="%s" type="image/svg+xml"></object></noscript>' % escape(svg_url)
+        elif not self.inline:
+            svg_url = image_map.get_svg_url(site=site, language=language)
+            svg = '<object data="%s" type="image/svg+xml"></object>' % escape(svg_url)
+        elif reference_id:
+            svg = self.render_reference(image_map, reference_id)
+        else:
+            # The variant with local links for the current site (see `ImageMap.get_rendered_svg`).
+            svg = image_map.get_rendered_svg(site=site, language=language)
+            if page_context:
+                svg = identify_svg(svg, '%s-svg' % container_id)[0]
 
         wrapper = '<div%(attrs)s>%(svg)s</div>' % {
             'attrs': flatatt({k: v for (k, v) in attrs.items() if (k and v)}),
-            'svg': image_map.rendered_svg,
+            'svg': svg,
         }
 
-        if self.ie_compatibility:  # pragma: no branch
-            wrapper += '<style>%(style)s</style>' % {
-                'style': '#%s svg{position:absolute;top:0;left:0}' % attrs['id'],
+        if style:
+            wrapper += '<style>%(style)s</style>' % {'style': style}
+
+        if script is not None:
+            wrapper += '<script>%(script)swagtailSvgmapLoad("%(id)s")</script>' % {
+                'script': script,
+                'id': escapejs(container_id),
             }
 
-        return mark_safe(wrapper)
+        return wrapper
+
+    def render_reference(self, image_map, svg_id):
+        """
+        Render an SVG referencing an image map rendered earlier on the page.
+
+        :param image_map: The image map.
+        :type image_map: ImageMap
+        :param svg_id: The ID of the root element of the earlier rendered SVG.
+        :type svg_id: str
+        :return: SVG markup
+        :rtype: str
+        """
+        width, height = image_map.size
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" viewBox="0 0 %g %g">'
+            '<use xlink:href="#%s" href="#%s" width="100%%" height="100%%"/>'
+            '</svg>'
+        ) % (width, height, escape(svg_id), escape(svg_id))
 
     def compute_wrapper_style(self, image_map):
         if not self.ie_compatibility:  # pragma: no cover
@@ -88,13 +414,17 @@ class ImageMapBlock(blocks.StructBlock):
         ]).replace(' ', '')
         return style
 
+    def get_container_id(self, value):
+        return 'image-map-%s' % value['map'].pk
+
     def get_container_attrs(self, value):
         image_map = value['map']
         style = self.compute_wrapper_style(image_map)
+        css_classes = [css_class for css_class in (self.container_class, value['css_class']) if css_class]
 
         return {
-            'id': ('image-map-%s' % image_map.pk),
-            'class': escape(value['css_class'] or ''),
+            'id': self.get_container_id(value),
+            'class': escape(' '.join(css_classes)),
             'style': style,
         }
 
@@ -0,0 +1,127 @@
+"""
+Precompression of rendered image maps, and content negotiation for the precompressed variants.
+
+Gzip is always available; Brotli is available when the `brotli` library is installed.
+"""
+import gzip
+import hashlib
+import re
+
+from six import BytesIO
+
+try:  # pragma: no cover
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+#: Compression level for gzip, when rerendering inline (e.g. when a region is saved); a moderate one, as
+#: the best ones take long on large maps for little gain.
+GZIP_LEVEL = 6
+
+#: Compression quality for Brotli (see above).
+BROTLI_QUALITY = 5
+
+#: Compression level for gzip, when rerendering in the background (see `ImageMap.recache_svg`).
+GZIP_MAX_LEVEL = 9
+
+#: Compression quality for Brotli (see above).
+BROTLI_MAX_QUALITY = 11
+
+_ACCEPT_ENCODING_RE = re.compile(r'^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def compress_gzip(data, level=GZIP_LEVEL):
+    """
+    Gzip the data (deterministically, so the same input always yields the same output).
+
+    :type data: bytes
+    :param level: The compression level.
+    :type level: int
+    :rtype: bytes
+    """
+    bio = BytesIO()
+    with gzip.GzipFile(fileobj=bio, mode='wb', compresslevel=level, mtime=0) as gzip_file:
+        gzip_file.write(data)
+    return bio.getvalue()
+
+
+def compress_brotli(data, quality=BROTLI_QUALITY):
+    """
+    Brotli-compress the data.
+
+    :type data: bytes
+    :param quality: The compression quality.
+    :type quality: int
+    :return: The compressed data, or None if Brotli is not available.
+    :rtype: bytes|None
+    """
+    if brotli is None:  # pragma: no cover
+        return None
+    return brotli.compress(data, quality=quality)
+
+
+def get_digest(data):
+    """
+    Get a hex digest of the data (e.g. for ETags).
+
+    :type data: bytes
+    :rtype: str
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_stream_digest(stream, chunk_size=64 * 1024):
+    """
+    Get a hex digest of the data read from a stream (see `get_digest`), without reading it all into memory.
+
+    :param stream: Binary stream (read to the end).
+    :param chunk_size: The size of the reads.
+    :type chunk_size: int
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_accept_encoding(accept_encoding):
+    """
+    Parse an `Accept-Encoding` header into a mapping of (lower-case) codings to their quality values.
+
+    :type accept_encoding: str
+    :rtype: dict[str, float]
+    """
+    qualities = {}
+    for coding in (accept_encoding or '').split(','):
+        match = _ACCEPT_ENCODING_RE.match(coding)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:  # pragma: no cover
+            quality = 0
+        qualities[match.group(1).lower()] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding, available):
+    """
+    Choose the best of the available content codings acceptable according to an `Accept-Encoding` header.
+
+    :param accept_encoding: The value of the `Accept-Encoding` header.
+    :type accept_encoding: str
+    :param available: Available codings (e.g. `br`, `gzip`), in order of preference.
+    :type available: Iterable[str]
+    :return: The coding to use, or None if the content should be sent as-is (`identity`).
+    :rtype: str|None
+    """
+    qualities = parse_accept_encoding(accept_encoding)
+    best = None
+    best_quality = 0
+    for coding in available:
+        quality = qualities.get(coding, qualities.get('*', 0))
+        if quality > best_quality:
+            best = coding
+            best_quality = quality
+    return best
@@ -0,0 +1,206 @@
+"""
+Executors for rerendering image maps (see `wagtail_svgmap.recache`).
+
+The executor is chosen with the `WAGTAIL_SVGMAP_RECACHE_EXECUTOR` setting:
+
+* `sync` (the default): rerender right away, in the thread that committed the change.
+* `thread`: rerender in a pool of background threads (`WAGTAIL_SVGMAP_RECACHE_WORKERS` of them) within the process,
+  so requests don't wait for it.
+* The dotted path of a `RecacheExecutor` subclass of your own, e.g. to hand the jobs to an external task queue:
+  implement `dispatch` to enqueue a task, and call `run_recache` in that task.  (Jobs are only deduplicated
+  by executors that run them with `run` within the process; see `RecacheExecutor.deduplicate`.)
+
+Asynchronous executors keep track of the jobs on the image maps themselves (see `ImageMap.render_state`);
+while a job is pending, the last good render is served.
+"""
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils.module_loading import import_string
+
+from wagtail_svgmap import log
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    ThreadPoolExecutor = None
+
+#: Render states of image maps.
+RENDER_READY = ''
+RENDER_PENDING = 'pending'
+RENDER_FAILED = 'failed'
+
+
+def run_recache(image_map_id, using=DEFAULT_DB_ALIAS, max_compression=True):
+    """
+    Rerender an image map (the job run by the executors).
+
+    :param image_map_id: The ID of the image map.
+    :type image_map_id: int
+    :param using: The database alias.
+    :type using: str
+    :param max_compression: Precompress the rendered SVG at the maximum quality? Only worth it in the background.
+    :type max_compression: bool
+    :return: True if the image map was rerendered successfully.
+    :rtype: bool
+    """
+    from wagtail_svgmap.models import ImageMap
+    image_map = ImageMap.objects.using(using).filter(pk=image_map_id).first()
+    if image_map is None:  # Deleted since
+        return False
+    try:
+        if image_map.recache_svg(save=True, max_compression=max_compression):  # pragma: no branch
+            log.info('Recached image map %s', image_map_id)
+    except Exception:
+        log.exception('Recaching image map %s failed', image_map_id)
+        _set_render_state(image_map_id, using, RENDER_FAILED)
+        return False
+    if image_map.render_state != RENDER_READY:
+        _set_render_state(image_map_id, using, RENDER_READY)
+    return True
+
+
+def _set_render_state(image_map_id, using, state):
+    from wagtail_svgmap.models import ImageMap
+    ImageMap.objects.using(using).filter(pk=image_map_id).update(_render_state=state)
+
+
+class RecacheExecutor(object):
+    """
+    Base class for recache executors.
+
+    If `deduplicate` is set, jobs are deduplicated per image map: a map that's already waiting for its job
+    to start isn't queued again.
+    """
+
+    #: Whether the jobs are run in the background (and tracked on the image maps).
+    asynchronous = True
+
+    #: Whether to deduplicate the jobs; only for executors whose jobs are run with `run` within this process,
+    #: as that's what tells a job has started.  (Were the jobs of e.g. an external task queue deduplicated,
+    #: the image maps would never be queued again.)
+    deduplicate = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queued = set()
+
+    def submit(self, image_map_id, using=DEFAULT_DB_ALIAS):
+        """
+        Submit a job to rerender an image map.
+
+        :param image_map_id: The ID of the image map.
+        :type image_map_id: int
+        :param using: The database alias.
+        :type using: str
+        :return: False if a job for the image map was already queued (see `deduplicate`).
+        :rtype: bool
+        """
+        key = (using, image_map_id)
+        if self.deduplicate:
+            with self._lock:
+                if key in self._queued:
+                    return False
+                self._queued.add(key)
+        if self.asynchronous:
+            _set_render_state(image_map_id, using, RENDER_PENDING)
+        self.dispatch(key)
+        return True
+
+    def dispatch(self, key):
+        """
+        Get a job run (eventually); implementations should call `run` with the key.
+
+        :param key: The database alias and the ID of the image map.
+        :type key: tuple[str, int]
+        """
+        raise NotImplementedError('Recache executors must implement `dispatch`')  # pragma: no cover
+
+    def run(self, key):
+        """
+        Run a job.
+
+        :param key: The database alias and the ID of the image map.
+        :type key: tuple[str, int]
+        :return: True if the image map was rerendered successfully.
+        :rtype: bool
+        """
+        with self._lock:  # The job is started, so any further changes need a job of their own
+            self._queued.discard(key)
+        # (Jobs run right away are run within requests, so they don't take the time to compress the best.)
+        return run_recache(key[1], using=key[0], max_compression=self.asynchronous)
+
+
+class SyncRecacheExecutor(RecacheExecutor):
+    """
+    Runs the jobs right away.
+    """
+
+    asynchronous = False
+    deduplicate = True
+
+    def dispatch(self, key):
+        self.run(key)
+
+
+class ThreadPoolRecacheExecutor(RecacheExecutor):
+    """
+    Runs the jobs in a pool of background threads.
+    """
+
+    deduplicate = True
+
+    def __init__(self, max_workers=None):
+        """
+        Construct a thread pool executor.
+
+        :param max_workers: The number of threads; defaults to the `WAGTAIL_SVGMAP_RECACHE_WORKERS` setting (or 2).
+        :type max_workers: int|None
+        """
+        super(ThreadPoolRecacheExecutor, self).__init__()
+        if ThreadPoolExecutor is None:  # pragma: no cover
+            raise ImproperlyConfigured('The thread pool recache executor requires `concurrent.futures`.')
+        max_workers = (max_workers or getattr(settings, 'WAGTAIL_SVGMAP_RECACHE_WORKERS', 2))
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def dispatch(self, key):
+        return self.pool.submit(self._run_in_thread, key)
+
+    def _run_in_thread(self, key):
+        try:
+            return self.run(key)
+        finally:
+            connections.close_all()  # The thread's connections would otherwise linger
+
+
+EXECUTORS = {
+    'sync': SyncRecacheExecutor,
+    'thread': ThreadPoolRecacheExecutor,
+}
+
+_executor_cache = {}
+
+
+def get_executor(name=None):
+    """
+    Get a recache executor instance.
+
+    :param name: An executor name or class path; if not set, the configured executor is returned.
+    :type name: str|None
+    :rtype: RecacheExecutor
+    """
+    if not name:
+        name = getattr(settings, 'WAGTAIL_SVGMAP_RECACHE_EXECUTOR', 'sync')
+    executor = _executor_cache.get(name)
+    if executor is None:
+        if name in EXECUTORS:
+            executor_class = EXECUTORS[name]
+        else:
+            try:
+                executor_class = import_string(name)
+            except ImportError as ie:
+                raise ImproperlyConfigured('Invalid wagtail_svgmap recache executor %r: %s' % (name, ie))
+        executor = _executor_cache[name] = executor_class()
+    return executor
@@ -0,0 +1,170 @@
+"""
+Link URL resolution for rendering image maps.
+
+`LinkResolver` computes the URLs of the links of all of the regions of a map in one go, instead of going through
+`Page.url` (and its site root path lookup and URL reversal) for each region separately.
+
+Page URLs depend on the site they're linked from (links within a site are local, others absolute), and on the
+language, if the page URLs are in `i18n_patterns`.  `get_variant_keys` tells which render variants of the image
+maps may thus be needed.
+
+When a page is moved or renamed, Wagtail updates the URL paths of its descendants only after the page itself
+has been saved (and its `post_save` signal sent).  The signal handlers use `moved_url_path` to account for that,
+so any links to the descendants rendered in the meantime get their new URLs.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.conf.urls.i18n import is_language_prefix_patterns_used
+from django.urls import reverse
+from django.utils import translation
+from django.utils.http import urlquote
+
+try:
+    from wagtail.core.models import Site
+except ImportError:
+    from wagtail.wagtailcore.models import Site
+
+_local = threading.local()
+
+# The characters `reverse` leaves unquoted in URLs.
+_URL_SAFE_CHARS = "/~:@!$&'()*+,;="
+
+
+@contextmanager
+def moved_url_path(old_url_path, new_url_path):
+    """
+    Treat page URL paths under `old_url_path` as if they were under `new_url_path` within the block.
+
+    :param old_url_path: The URL path of the moved (or renamed) page before the move.
+    :type old_url_path: str
+    :param new_url_path: The URL path of the page after the move.
+    :type new_url_path: str
+    """
+    moves = getattr(_local, 'moves', None)
+    if moves is None:
+        moves = _local.moves = []
+    moves.append((old_url_path, new_url_path))
+    try:
+        yield
+    finally:
+        moves.pop()
+
+
+def apply_url_path_moves(page):
+    """
+    Fix up the (in-memory) URL path of a page according to the active `moved_url_path` blocks, if any.
+
+    :param page: A page instance; its `url_path` is modified in-place.
+    :type page: wagtail.core.models.Page
+    :return: The page
+    """
+    for old_url_path, new_url_path in getattr(_local, 'moves', ()):
+        if page.url_path.startswith(old_url_path):
+            page.url_path = new_url_path + page.url_path[len(old_url_path):]
+    return page
+
+
+class LinkResolver(object):
+    """
+    Resolves the link URLs of regions (or other `LinkFields` objects) in bulk.
+
+    The URLs are the same as `LinkFields.link` would return (for the given site and language); the site root paths
+    are looked up and the page serving URL is reversed just once per resolver, though.  A resolver should not
+    outlive a single batch of work (e.g. rendering an image map), as it doesn't notice changes to the sites.
+    """
+
+    def __init__(self, site_id=None, language=None):
+        """
+        Construct a link resolver.
+
+        :param site_id: The ID of the site the links are rendered for; links to pages in it are local.
+                        If not set, links are local only if there's only one site.
+        :type site_id: int|None
+        :param language: The language to reverse URLs in; defaults to the `LANGUAGE_CODE` setting.
+        :type language: str|None
+        """
+        self.site_id = site_id
+        self.language = (language or settings.LANGUAGE_CODE)
+        self._site_root_paths = None  # (Looked up once there's a page to resolve.)
+        self._serve_prefix = None
+        self.append_slash = getattr(settings, 'WAGTAIL_APPEND_SLASH', True)
+
+    @property
+    def site_root_paths(self):
+        """
+        The (site ID, root URL path, root URL) tuples of the sites, most specific first.
+
+        :rtype: list[tuple[int, str, str]]
+        """
+        if self._site_root_paths is None:
+            self._site_root_paths = Site.get_site_root_paths()
+        return self._site_root_paths
+
+    def resolve(self, link_fields):
+        """
+        Get the link URL of an object.
+
+        :param link_fields: A region (with its `link_page` and `link_document` selected, for efficiency).
+        :type link_fields: wagtail_svgmap.mixins.LinkFields
+        :return: URL string (might be empty, or None for unroutable pages)
+        :rtype: str|None
+        """
+        if link_fields.link_page_id:
+            return self.get_page_url(link_fields.link_page)
+        elif link_fields.link_document_id:
+            with translation.override(self.language):
+                return link_fields.link_document.url
+        else:
+            return link_fields.link_external
+
+    def get_page_url(self, page):
+        """
+        Get the URL of a page, like `Page.url` does.
+
+        :param page: The page.
+        :type page: wagtail.core.models.Page
+        :return: The URL, or None if the page isn't routable.
+        :rtype: str|None
+        """
+        url_path = apply_url_path_moves(page).url_path
+        if self._serve_prefix is None:
+            with translation.override(self.language):
+                self._serve_prefix = reverse('wagtail_serve', args=('',))
+        for (site_id, root_path, root_url) in self.site_root_paths:
+            if url_path.startswith(root_path):
+                page_path = self._serve_prefix + urlquote(url_path[len(root_path):], safe=_URL_SAFE_CHARS)
+                if not self.append_slash and page_path != '/':
+                    page_path = page_path.rstrip('/')
+                if len(self.site_root_paths) == 1 or self.site_id == site_id:  # Local will do
+                    return page_path
+                return root_url + page_path
+        return None
+
+
+def uses_language_prefixes():
+    """
+    Figure out whether page URLs are language-prefixed (with `i18n_patterns`), i.e. whether they vary by language.
+
+    :rtype: bool
+    """
+    return bool(settings.USE_I18N and is_language_prefix_patterns_used(settings.ROOT_URLCONF)[0])
+
+
+def get_variant_keys():
+    """
+    Get the (site ID, language) pairs the links of image maps may need to be rendered differently for.
+
+    The language is None unless the URLs are language-prefixed (with `i18n_patterns`).
+    If there's just the one site and language, there's nothing to vary by, so the list is empty.
+
+    :rtype: list[tuple[int, str|None]]
+    """
+    languages = [None]
+    if uses_language_prefixes():
+        languages = [code for (code, name) in settings.LANGUAGES]
+    site_ids = [site_id for (site_id, root_path, root_url) in Site.get_site_root_paths()]
+    if len(site_ids) * len(languages) < 2:
+        return []
+    return [(site_id, language) for site_id in site_ids for language in languages]
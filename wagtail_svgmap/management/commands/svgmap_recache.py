@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+import datetime
+import multiprocessing
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from wagtail_svgmap import log
+
+
+def _init_worker():
+    # Workers that weren't forked from the parent process start out with a fresh interpreter.
+    if not apps.ready:
+        django.setup()
+    # The database connections inherited from the parent process can't be shared.
+    connections.close_all()
+
+
+def _recache_chunk(args):
+    """
+    Rebuild the caches of a chunk of image maps (run in the worker processes).
+
+    :param args: The database alias, the image map IDs and whether to only recache changed SVGs.
+    :return: The number of image maps processed, the number of changed ones, and the IDs of failed ones.
+    :rtype: tuple[int, int, list[int]]
+    """
+    # (Imported here, since with the `spawn` start method (the default on Windows and macOS),
+    # this module is imported by the worker processes before Django has been set up in them.)
+    from wagtail_svgmap.models import ImageMap
+    using, image_map_ids, changed_only = args
+    n_changed = 0
+    failed = []
+    queryset = ImageMap.objects.using(using).filter(pk__in=image_map_ids).order_by('pk')
+    for image_map in queryset.iterator():
+        try:
+            if image_map.rebuild_caches(changed_only=changed_only):
+                n_changed += 1
+        except Exception:
+            log.exception('Recaching image map %s failed', image_map.pk)
+            failed.append(image_map.pk)
+    return (len(image_map_ids), n_changed, failed)
+
+
+def parse_since(value):
+    """
+    Parse the `--since` option (an ISO 8601 date or date-time).
+
+    :rtype: datetime.datetime
+    """
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            if date is None:
+                raise ValueError('not an ISO 8601 date or date-time')
+            moment = datetime.datetime.combine(date, datetime.time())
+    except ValueError as ve:  # (Also raised for well-formed but invalid dates, e.g. month 13.)
+        raise CommandError('Invalid --since value %r (%s); use an ISO 8601 date or date-time.' % (value, ve))
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the caches (compiled template, element IDs, rendered SVG, etc.) of image maps.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ids', nargs='+', type=int, metavar='ID',
+            help='Only recache the image maps with these IDs.',
+        )
+        parser.add_argument(
+            '--since', type=parse_since, metavar='DATE',
+            help='Only recache the image maps modified since this (ISO 8601) date or date-time (or not known when).',
+        )
+        parser.add_argument(
+            '--changed-only', action='store_true',
+            help='Only recache the image maps whose SVG content has changed (according to its digest).',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='The number of worker processes; 1 to recache in this process. (Default: %(default)s)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50,
+            help='The number of image maps per job. (Default: %(default)s)',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='The database to use. (Default: %(default)s)',
+        )
+
+    def handle(self, ids, since, changed_only, processes, chunk_size, database, **options):
+        from wagtail_svgmap.models import ImageMap
+        queryset = ImageMap.objects.using(database).order_by('pk')
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        if since:
+            # (Image maps last saved before `modified_at` was added have none, so they might have been modified.)
+            queryset = queryset.filter(Q(modified_at__gte=since) | Q(modified_at__isnull=True))
+        image_map_ids = list(queryset.values_list('pk', flat=True).iterator())
+        n_total = len(image_map_ids)
+        chunks = [
+            (database, image_map_ids[i:i + chunk_size], changed_only)
+            for i in range(0, n_total, max(1, chunk_size))
+        ]
+
+        if processes > 1 and len(chunks) > 1:
+            connections.close_all()  # (So they aren't inherited by the workers.)
+            pool = multiprocessing.Pool(processes=min(processes, len(chunks)), initializer=_init_worker)
+            results = pool.imap_unordered(_recache_chunk, chunks)
+        else:
+            pool = None
+            results = (_recache_chunk(chunk) for chunk in chunks)
+
+        n_done = n_changed = 0
+        failed = []
+        try:
+            for n_chunk, n_chunk_changed, chunk_failed in results:
+                n_done += n_chunk
+                n_changed += n_chunk_changed
+                failed.extend(chunk_failed)
+                if options['verbosity'] >= 1:
+                    self.stdout.write('%d/%d image maps processed (%d changed, %d failed)' % (
+                        n_done, n_total, n_changed, len(failed),
+                    ))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        if failed:
+            raise CommandError('Recaching failed for image maps %s' % ', '.join(str(pk) for pk in sorted(failed)))
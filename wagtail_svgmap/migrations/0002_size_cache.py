@@ -3,13 +3,12 @@
 from __future__ import unicode_literals
 
 from django.db import migrations, models
-from django.db.models import Q
 
 
 def update_caches(apps, schema_editor):
-    from wagtail_svgmap.models import ImageMap
-    for image_map in ImageMap.objects.filter(Q(_width_cache=0) | Q(_height_cache=0)).iterator():
-        image_map.recache_svg(save=True)
+    # The size caches are filled in by `0013_fix_size_cache` instead: the current `ImageMap` model this used
+    # has since grown fields that don't exist at this point, so querying it here would fail.
+    pass
 
 
 class Migration(migrations.Migration):
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 00:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0002_size_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='_template_cache',
+            field=models.TextField(blank=True, db_column='template_cache', editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0003_template_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='_render_brotli_cache',
+            field=models.BinaryField(blank=True, db_column='render_brotli_cache', editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagemap',
+            name='_render_digest',
+            field=models.CharField(blank=True, db_column='render_digest', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='imagemap',
+            name='_render_gzip_cache',
+            field=models.BinaryField(blank=True, db_column='render_gzip_cache', editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CACHE_FIELDS = ('ids_cache', 'template_cache', 'render_cache', 'render_gzip_cache', 'render_brotli_cache')
+
+
+def move_caches_to_artifacts(apps, schema_editor):
+    ImageMap = apps.get_model('wagtail_svgmap', 'ImageMap')
+    ImageMapArtifacts = apps.get_model('wagtail_svgmap', 'ImageMapArtifacts')
+    values = ImageMap.objects.values_list('pk', *('_%s' % field for field in CACHE_FIELDS))
+    for row in values.iterator():
+        ImageMapArtifacts.objects.create(image_map_id=row[0], **dict(zip(CACHE_FIELDS, row[1:])))
+
+
+def move_caches_from_artifacts(apps, schema_editor):
+    ImageMap = apps.get_model('wagtail_svgmap', 'ImageMap')
+    ImageMapArtifacts = apps.get_model('wagtail_svgmap', 'ImageMapArtifacts')
+    for row in ImageMapArtifacts.objects.values_list('pk', *CACHE_FIELDS).iterator():
+        ImageMap.objects.filter(pk=row[0]).update(**{'_%s' % field: value for (field, value) in zip(CACHE_FIELDS, row[1:])})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0004_compressed_render_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMapArtifacts',
+            fields=[
+                ('image_map', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='wagtail_svgmap.ImageMap')),
+                ('ids_cache', models.TextField(blank=True, editable=False)),
+                ('template_cache', models.TextField(blank=True, editable=False)),
+                ('render_cache', models.TextField(blank=True, editable=False)),
+                ('render_gzip_cache', models.BinaryField(blank=True, editable=False, null=True)),
+                ('render_brotli_cache', models.BinaryField(blank=True, editable=False, null=True)),
+            ],
+        ),
+        migrations.RunPython(move_caches_to_artifacts, move_caches_from_artifacts),
+        migrations.RemoveField(
+            model_name='imagemap',
+            name='_ids_cache',
+        ),
+        migrations.RemoveField(
+            model_name='imagemap',
+            name='_render_brotli_cache',
+        ),
+        migrations.RemoveField(
+            model_name='imagemap',
+            name='_render_cache',
+        ),
+        migrations.RemoveField(
+            model_name='imagemap',
+            name='_render_gzip_cache',
+        ),
+        migrations.RemoveField(
+            model_name='imagemap',
+            name='_template_cache',
+        ),
+    ]
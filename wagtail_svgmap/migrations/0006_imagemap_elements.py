@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:12
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_ids_to_elements(apps, schema_editor):
+    # The tag names aren't known here; they're filled in when the maps are next compiled.
+    ImageMapArtifacts = apps.get_model('wagtail_svgmap', 'ImageMapArtifacts')
+    ImageMapElement = apps.get_model('wagtail_svgmap', 'ImageMapElement')
+    for image_map_id, ids_cache in ImageMapArtifacts.objects.values_list('pk', 'ids_cache').iterator():
+        ImageMapElement.objects.bulk_create(
+            ImageMapElement(image_map_id=image_map_id, element_id=element_id, order=order)
+            for (order, element_id) in enumerate(ids_cache.splitlines())
+        )
+
+
+def move_elements_to_ids(apps, schema_editor):
+    ImageMapArtifacts = apps.get_model('wagtail_svgmap', 'ImageMapArtifacts')
+    ImageMapElement = apps.get_model('wagtail_svgmap', 'ImageMapElement')
+    for artifacts in ImageMapArtifacts.objects.all():
+        element_ids = ImageMapElement.objects.filter(image_map_id=artifacts.pk).values_list('element_id', flat=True)
+        artifacts.ids_cache = '\n'.join(sorted(element_ids))
+        artifacts.save(update_fields=('ids_cache',))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0005_imagemap_artifacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMapElement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('element_id', models.CharField(db_index=True, max_length=255, verbose_name='element ID')),
+                ('tag', models.CharField(blank=True, max_length=64, verbose_name='tag name')),
+                ('order', models.PositiveIntegerField(verbose_name='document order')),
+                ('image_map', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='elements', to='wagtail_svgmap.ImageMap')),
+            ],
+            options={
+                'ordering': ('image_map', 'order'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagemapelement',
+            unique_together={('image_map', 'element_id')},
+        ),
+        migrations.RunPython(move_ids_to_elements, move_elements_to_ids),
+        migrations.RemoveField(
+            model_name='imagemapartifacts',
+            name='ids_cache',
+        ),
+    ]
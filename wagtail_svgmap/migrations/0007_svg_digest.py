@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def flag_orphaned_regions(apps, schema_editor):
+    # (Not using `Exists`/`OuterRef` subqueries, which require Django 1.11.)
+    db_alias = schema_editor.connection.alias
+    ImageMapElement = apps.get_model('wagtail_svgmap', 'ImageMapElement')
+    Region = apps.get_model('wagtail_svgmap', 'Region')
+    elements = set(ImageMapElement.objects.using(db_alias).values_list('image_map_id', 'element_id').iterator())
+    orphaned = [
+        pk
+        for (pk, image_map_id, element_id)
+        in Region.objects.using(db_alias).values_list('pk', 'image_map_id', 'element_id').iterator()
+        if (image_map_id, element_id) not in elements
+    ]
+    if orphaned:
+        Region.objects.using(db_alias).filter(pk__in=orphaned).update(orphaned=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0006_imagemap_elements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='_svg_digest',
+            field=models.CharField(blank=True, db_column='svg_digest', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='region',
+            name='orphaned',
+            field=models.BooleanField(default=False, editable=False, verbose_name='orphaned'),
+        ),
+        migrations.RunPython(flag_orphaned_regions, migrations.RunPython.noop),
+    ]
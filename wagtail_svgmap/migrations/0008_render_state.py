@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0007_svg_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='_render_state',
+            field=models.CharField(blank=True, choices=[('', 'ready'), ('pending', 'pending'), ('failed', 'failed')], db_column='render_state', default='', editable=False, max_length=16),
+        ),
+    ]
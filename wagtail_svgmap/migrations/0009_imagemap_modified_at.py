@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0008_render_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, null=True, verbose_name='modified at'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0009_imagemap_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='region',
+            name='resolved_url',
+            field=models.TextField(blank=True, editable=False, verbose_name='resolved URL'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0028_merge'),
+        ('wagtail_svgmap', '0010_region_resolved_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageMapVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(blank=True, max_length=16)),
+                ('render_cache', models.TextField(blank=True, editable=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='imagemap',
+            name='_has_variants',
+            field=models.BooleanField(db_column='has_variants', default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='imagemapvariant',
+            name='image_map',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='wagtail_svgmap.ImageMap'),
+        ),
+        migrations.AddField(
+            model_name='imagemapvariant',
+            name='site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.Site'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagemapvariant',
+            unique_together={('image_map', 'site', 'language')},
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 01:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0011_render_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagemap',
+            name='_rendered_at',
+            field=models.DateTimeField(db_column='rendered_at', editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from contextlib import closing
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def fix_size_caches(apps, schema_editor):
+    """
+    Fill in the dimensions of the image maps `0002_size_cache` left without any.
+
+    The historical model is used (along with the `svg` module's functions), so this keeps working however
+    the real `ImageMap` model evolves.  Maps whose SVGs can't be read or have no dimensions are logged and skipped.
+    """
+    from wagtail_svgmap import log
+    from wagtail_svgmap.svg import ET, fix_dimensions, get_dimensions
+    ImageMap = apps.get_model('wagtail_svgmap', 'ImageMap')
+    queryset = ImageMap.objects.using(schema_editor.connection.alias).filter(Q(_width_cache=0) | Q(_height_cache=0))
+    for image_map in queryset.iterator():
+        try:
+            image_map.svg.open()
+            with closing(image_map.svg) as stream:
+                tree = ET.parse(stream)
+            fix_dimensions(tree)
+            dimensions = get_dimensions(tree)
+        except Exception:
+            log.warning('Skipped fixing the size cache of image map %s (%s)', image_map.pk, image_map.svg.name,
+                        exc_info=True)
+            continue
+        if not dimensions:
+            log.warning('Skipped fixing the size cache of image map %s (%s): no dimensions found',
+                        image_map.pk, image_map.svg.name)
+            continue
+        image_map._width_cache, image_map._height_cache = dimensions
+        image_map.save(update_fields=('_width_cache', '_height_cache'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0012_imagemap_rendered_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fix_size_caches,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.0.13 on 2026-10-18 14:05
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_svgmap', '0013_fix_size_cache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagemapartifacts',
+            name='image_map',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='artifacts_row', serialize=False, to='wagtail_svgmap.ImageMap'),
+        ),
+    ]
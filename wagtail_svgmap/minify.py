@@ -0,0 +1,141 @@
+"""
+SVG minification for the rendered image maps.
+
+Uploaded SVGs tend to carry all sorts of things browsers don't need: editor metadata blocks,
+editor-specific (Inkscape, Illustrator, ...) elements and attributes, and indentation whitespace.
+A `Minifier` tells the streaming serializer (see `wagtail_svgmap.streaming`) what to leave out.
+
+Element IDs and the link wrapping are never affected by minification.
+"""
+import json
+
+from django.conf import settings
+
+from wagtail_svgmap.svg import SVG_NAMESPACE
+
+#: Namespaces used by SVG editors for their own bookkeeping.
+EDITOR_NAMESPACES = (
+    'http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd',
+    'http://www.inkscape.org/namespaces/inkscape',
+    'http://ns.adobe.com/AdobeIllustrator/10.0/',
+    'http://ns.adobe.com/AdobeSVGViewerExtensions/3.0/',
+    'http://ns.adobe.com/Extensibility/1.0/',
+    'http://ns.adobe.com/Flows/1.0/',
+    'http://ns.adobe.com/Graphs/1.0/',
+    'http://ns.adobe.com/ImageReplacement/1.0/',
+    'http://ns.adobe.com/SaveForWeb/1.0/',
+    'http://ns.adobe.com/Variables/1.0/',
+    'http://www.bohemiancoding.com/sketch/ns',
+    'http://www.serif.com/',
+)
+
+#: Elements whose whitespace-only text is significant (no matter `xml:space`).
+WHITESPACE_PRESERVING_TAGS = frozenset({
+    '{%s}%s' % (SVG_NAMESPACE, tag)
+    for tag in ('text', 'textPath', 'tref', 'tspan', 'title', 'desc', 'style', 'script')
+})
+
+_METADATA_TAG = '{%s}metadata' % SVG_NAMESPACE
+_XML_SPACE = 'http://www.w3.org/XML/1998/namespace}space'
+
+
+class Minifier(object):
+    """
+    Minification options, along with the logic to apply them to the events of the streaming serializer.
+
+    Tags are `ElementTree`-style (`{uri}local`); attribute lists are Expat-style flat lists (`uri}local`, value...).
+    """
+
+    def __init__(self, strip_whitespace=True, remove_metadata=True, remove_namespaces=EDITOR_NAMESPACES):
+        """
+        Construct a minifier.
+
+        :param strip_whitespace: Remove whitespace-only text between elements (outside text content elements)?
+        :type strip_whitespace: bool
+        :param remove_metadata: Remove `<metadata>` elements?
+        :type remove_metadata: bool
+        :param remove_namespaces: Remove elements and attributes in these namespaces.
+        :type remove_namespaces: Iterable[str]
+        """
+        self.strip_whitespace = bool(strip_whitespace)
+        self.remove_metadata = bool(remove_metadata)
+        self.remove_namespaces = frozenset(remove_namespaces or ())
+        self._skipped_tags = {}
+
+    @property
+    def key(self):
+        """
+        A string identifying the options of this minifier (to figure out whether cached output is outdated).
+
+        :rtype: str
+        """
+        return json.dumps([self.strip_whitespace, self.remove_metadata, sorted(self.remove_namespaces)])
+
+    def skip_element(self, tag):
+        """
+        Figure out whether the element (along with its children) should be left out.
+
+        :param tag: Qualified tag name.
+        :rtype: bool
+        """
+        skip = self._skipped_tags.get(tag)
+        if skip is None:
+            skip = self._skipped_tags[tag] = (
+                (self.remove_metadata and tag == _METADATA_TAG) or
+                (tag[:1] == '{' and tag[1:].split('}', 1)[0] in self.remove_namespaces)
+            )
+        return skip
+
+    def filter_attributes(self, attr_list):
+        """
+        Leave out the attributes in removed namespaces.
+
+        :param attr_list: Expat-style flat attribute list.
+        :type attr_list: list[str]
+        :return: Filtered attribute list (or the original, if nothing was removed).
+        :rtype: list[str]
+        """
+        if not self.remove_namespaces:
+            return attr_list
+        filtered = None
+        for i in range(0, len(attr_list), 2):
+            key = attr_list[i]
+            if '}' in key and key.split('}', 1)[0] in self.remove_namespaces:
+                if filtered is None:
+                    filtered = attr_list[:i]
+            elif filtered is not None:
+                filtered.extend(attr_list[i:i + 2])
+        return (attr_list if filtered is None else filtered)
+
+    def preserves_whitespace(self, tag, attr_list, inherited):
+        """
+        Figure out whether whitespace within the element is significant.
+
+        :param tag: Qualified tag name.
+        :param attr_list: Expat-style flat attribute list.
+        :param inherited: Whether whitespace is significant within the parent element.
+        :rtype: bool
+        """
+        if not self.strip_whitespace or tag in WHITESPACE_PRESERVING_TAGS:
+            return True
+        for i in range(0, len(attr_list), 2):
+            if attr_list[i] == _XML_SPACE:
+                return (attr_list[i + 1] == 'preserve')
+        return inherited
+
+
+def get_minifier():
+    """
+    Get the minifier configured by the `WAGTAIL_SVGMAP_MINIFY` setting.
+
+    The setting may be a boolean (to use the default options), or a dict of `Minifier` options.
+
+    :return: Minifier, or None if minification is disabled.
+    :rtype: Minifier|None
+    """
+    options = getattr(settings, 'WAGTAIL_SVGMAP_MINIFY', False)
+    if not options:
+        return None
+    if isinstance(options, dict):
+        return Minifier(**options)
+    return Minifier()
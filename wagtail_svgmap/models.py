@@ -1,24 +1,56 @@
 from __future__ import unicode_literals
 
-from contextlib import closing
+from collections import namedtuple
+from contextlib import contextmanager
 
-from django.db import models
+from django.db import models, transaction
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
+from six import BytesIO
 
 try:
     from wagtail.admin.edit_handlers import FieldPanel
 except ImportError:
     from wagtail.wagtailadmin.edit_handlers import FieldPanel
 from wagtail_svgmap import log
+from wagtail_svgmap.compression import (
+    BROTLI_MAX_QUALITY, compress_brotli, compress_gzip, get_digest, get_stream_digest, GZIP_MAX_LEVEL
+)
+from wagtail_svgmap.executors import RENDER_FAILED, RENDER_PENDING, RENDER_READY
+from wagtail_svgmap.links import get_variant_keys, LinkResolver, uses_language_prefixes
 from wagtail_svgmap.mixins import LinkFields
-from wagtail_svgmap.svg import find_ids, fix_dimensions, get_dimensions, Link, serialize_svg, wrap_elements_in_links
+from wagtail_svgmap.pipeline import get_pipeline
+from wagtail_svgmap.recache import get_pending, pop_pending, schedule_recache
+from wagtail_svgmap.render_cache import get_render_cache
+from wagtail_svgmap.streaming import CompiledSVG
+from wagtail_svgmap.svg import decode_buffer, find_elements, get_dimensions, Link, SERIALIZE_CHUNK_SIZE
+
+#: The number of characters of the render digest used to version the URLs of the SVGs.
+SVG_URL_VERSION_LENGTH = 16
+
+#: The element IDs added to and removed from an image map when its SVG was changed.
+IDDiff = namedtuple('IDDiff', ('added', 'removed'))
+
+
+class ImageMapQuerySet(models.QuerySet):
+    def with_element(self, *element_ids):
+        """
+        Filter image maps containing (any of) the given element IDs.
+
+        :param element_ids: Element IDs (without leading octothorpes).
+        :type element_ids: str
+        :rtype: ImageMapQuerySet
+        """
+        return self.filter(elements__element_id__in=element_ids).distinct()
 
 
 @python_2_unicode_compatible
 class ImageMap(models.Model):
     """
-    The main image map model. Caches the element IDs and prerendered linked SVG.
+    The main image map model. Caches the element IDs and prerendered linked SVG (see `ImageMapArtifacts`).
     """
 
     title = models.CharField(max_length=255, verbose_name=_('title'))
@@ -27,10 +59,26 @@ class ImageMap(models.Model):
         verbose_name=_('SVG file'),
         help_text=_('Choose a valid SVG file. The document must contain elements that have IDs.'),
     )
-    _ids_cache = models.TextField(editable=False, blank=True, db_column='ids_cache')
-    _render_cache = models.TextField(editable=False, blank=True, db_column='render_cache')
+    modified_at = models.DateTimeField(verbose_name=_('modified at'), auto_now=True, null=True, editable=False)
+    # (The heavier caches live in `ImageMapArtifacts`, so they're not loaded along with every image map.)
+    _svg_digest = models.CharField(editable=False, blank=True, max_length=64, db_column='svg_digest')
+    _render_digest = models.CharField(editable=False, blank=True, max_length=64, db_column='render_digest')
+    _rendered_at = models.DateTimeField(editable=False, null=True, db_column='rendered_at')
     _width_cache = models.FloatField(editable=False, default=0, db_column='width_cache')
     _height_cache = models.FloatField(editable=False, default=0, db_column='height_cache')
+    _render_state = models.CharField(
+        editable=False, blank=True, max_length=16, db_column='render_state', default=RENDER_READY,
+        choices=[(RENDER_READY, _('ready')), (RENDER_PENDING, _('pending')), (RENDER_FAILED, _('failed'))],
+    )
+    _has_variants = models.BooleanField(editable=False, default=False, db_column='has_variants')
+
+    #: The cache fields of the image map itself (see `ImageMapArtifacts` for the rest).
+    CACHE_FIELDS = ('_svg_digest', '_render_digest', '_rendered_at', '_width_cache', '_height_cache')
+
+    #: The `IDDiff` of the last save that changed the elements of this image map (if any).
+    last_id_diff = None
+
+    objects = ImageMapQuerySet.as_manager()
 
     @property
     def rendered_svg(self):
@@ -40,12 +88,168 @@ class ImageMap(models.Model):
         If for some reason the render cache is empty,
         this will always rerender the markup.
 
+        While the markup is being rerendered in the background (see `render_state`),
+        the last good render is returned.
+
+        :return: string of XML
+        :rtype: str
+        """
+        self._render_if_pending()
+        if not self.artifacts.render_cache:  # pragma: no cover
+            self.recache_svg()
+        return self.artifacts.render_cache
+
+    @property
+    def rendered_svg_variants(self):
+        """
+        Get the rendered SVG markup as bytes, in all of the available content codings.
+
+        :return: Mapping of content codings (`identity`, `gzip`, `br`) to the encoded (UTF-8) markup.
+        :rtype: dict[str, bytes]
+        """
+        variants = self.precompressed_svg_variants
+        variants['identity'] = force_bytes(self.rendered_svg)
+        return variants
+
+    @property
+    def precompressed_svg_variants(self):
+        """
+        Get the precompressed variants of the rendered SVG markup.
+
+        The precompressed variants are generated when the SVG is rendered,
+        so serving them costs no compression work.
+
+        :return: Mapping of content codings (`gzip`, `br`) to the compressed (UTF-8) markup.
+        :rtype: dict[str, bytes]
+        """
+        self._render_if_pending()
+        artifacts = self.artifacts
+        if not artifacts.render_cache or not self._render_digest:  # pragma: no cover
+            self.recache_svg()
+        variants = {}
+        for coding, data in (('br', artifacts.render_brotli_cache), ('gzip', artifacts.render_gzip_cache)):
+            if data:
+                variants[coding] = bytes(data)  # (Some database backends return buffers/memoryviews.)
+        return variants
+
+    def get_rendered_svg(self, site=None, language=None):
+        """
+        Get the rendered SVG markup for a site (and language), with the links to pages in that site being local.
+
+        The variants are rendered along with the main render (see `ImageMapVariant`), so this is just a lookup,
+        and the markup is cached by the render cache (see `wagtail_svgmap.render_cache`) besides.
+
+        :param site: The site the markup will be served on (e.g. `request.site`);
+                     if not set, `rendered_svg` is returned.
+        :type site: wagtail.core.models.Site|None
+        :param language: The active language (only matters if page URLs are language-prefixed).
+        :type language: str|None
         :return: string of XML
         :rtype: str
         """
-        if not self._render_cache:  # pragma: no cover
+        if not self.pk:  # pragma: no cover
+            return self.rendered_svg
+        digest = self.rendered_svg_digest
+        unsaved_variants = getattr(self, '_variants', None)  # (Pending changes are rendered, but not saved.)
+        has_variants = (self._has_variants if unsaved_variants is None else bool(unsaved_variants))
+        variant = ((site.pk, language or '') if (site is not None and has_variants) else None)
+        render_cache = get_render_cache()
+        markup = render_cache.get(self.pk, digest, variant)
+        if markup is None:
+            markup = self.rendered_svg
+            if variant:
+                variants = unsaved_variants
+                if variants is None:
+                    variants = {
+                        (site.pk, variant_language): variant_markup
+                        for (variant_language, variant_markup)
+                        in self.variants.filter(site_id=site.pk, language__in={variant[1], ''})
+                        .values_list('language', 'render_cache')
+                    }
+                markup = variants.get(variant, variants.get((site.pk, ''), markup))
+            render_cache.set(self.pk, digest, markup, variant)
+        return markup
+
+    def iter_rendered_svg(self, chunk_size=SERIALIZE_CHUNK_SIZE):
+        """
+        Get the rendered SVG markup as chunks of UTF-8 bytes (e.g. for a `StreamingHttpResponse`).
+
+        The markup is encoded a chunk at a time, so it's never held in memory as bytes as a whole.
+
+        :param chunk_size: The size (in characters) of the chunks.
+        :type chunk_size: int
+        :rtype: Iterator[bytes]
+        """
+        rendered_svg = self.rendered_svg
+        for offset in range(0, len(rendered_svg), chunk_size):
+            yield rendered_svg[offset:offset + chunk_size].encode('UTF-8')
+
+    @property
+    def rendered_svg_digest(self):
+        """
+        Get a digest (SHA-256, in hex) of the rendered SVG markup; useful for ETags.
+
+        :rtype: str
+        """
+        self._render_if_pending()
+        if not self._render_digest:  # pragma: no cover
             self.recache_svg()
-        return self._render_cache
+        return self._render_digest
+
+    @property
+    def rendered_at(self):
+        """
+        Get the time the rendered SVG markup last changed (e.g. for `Last-Modified` headers).
+
+        :rtype: datetime.datetime|None
+        """
+        self._render_if_pending()
+        return (self._rendered_at or self.modified_at)
+
+    @property
+    def svg_url(self):
+        """
+        Get the URL of the rendered SVG as a standalone document (see `wagtail_svgmap.views.serve_svg`).
+
+        The URL is versioned by the digest of the markup, so it may be cached indefinitely.
+        Requires `wagtail_svgmap.urls` to be included in the URLconf.
+
+        :rtype: str
+        """
+        return self.get_svg_url()
+
+    def get_svg_url(self, site=None, language=None):
+        """
+        Get the URL of the rendered SVG for a site (and language) as a standalone document (see `get_rendered_svg`).
+
+        If the map has no variants, that's just `svg_url`.
+
+        :param site: The site the SVG will be served on (e.g. `request.site`).
+        :type site: wagtail.core.models.Site|None
+        :param language: The active language (only matters if page URLs are language-prefixed).
+        :type language: str|None
+        :rtype: str
+        """
+        kwargs = {
+            'image_map_id': self.pk,
+            'version': self.rendered_svg_digest[:SVG_URL_VERSION_LENGTH],
+        }
+        if site is None or not self._has_variants:
+            return reverse('wagtail_svgmap_svg', kwargs=kwargs)
+        kwargs['site_id'] = site.pk
+        if language and uses_language_prefixes():
+            kwargs['language'] = language
+        return reverse('wagtail_svgmap_svg_variant', kwargs=kwargs)
+
+    @property
+    def render_state(self):
+        """
+        Get the state of background rerendering (see `wagtail_svgmap.executors`) of this image map.
+
+        :return: `RENDER_READY` (an empty string), `RENDER_PENDING` or `RENDER_FAILED`
+        :rtype: str
+        """
+        return self._render_state
 
     @property
     def original_svg(self):
@@ -58,20 +262,57 @@ class ImageMap(models.Model):
         with self._open_original() as infp:
             return infp.read()
 
+    @property
+    def compiled_svg(self):
+        """
+        Get the compiled form of the SVG, used to quickly render it with different links.
+
+        If for some reason the template cache is empty (or outdated, or compiled with
+        a different pipeline or different minification settings), the SVG is recompiled here.
+
+        :return: Compiled SVG
+        :rtype: wagtail_svgmap.streaming.CompiledSVG
+        """
+        pipeline = get_pipeline()
+        options_key = pipeline.key
+        artifacts = self.artifacts
+        cached = getattr(self, '_compiled_svg', None)
+        if cached and cached[0] == artifacts.template_cache and cached[1].options_key == options_key:
+            return cached[1]
+        compiled = (CompiledSVG.from_json(artifacts.template_cache) if artifacts.template_cache else None)
+        if not compiled or compiled.options_key != options_key:
+            self.recache_template(pipeline=pipeline)
+            compiled = CompiledSVG.from_json(artifacts.template_cache)
+        self._compiled_svg = (artifacts.template_cache, compiled)
+        return compiled
+
     @property
     def ids(self):
         """
         Get a set of element IDs discovered in the SVG file.
 
-        If for some reason the ID cache is empty,
-        it will always be recached here.
+        The set is memoized per instance, so it may be accessed freely.
 
         :return: set of ID strings (without leading octothorpes)
-        :rtype: set[str]
+        :rtype: frozenset[str]
+        """
+        ids = getattr(self, '_ids', None)
+        if ids is None:
+            ids = self._ids = frozenset(element_id for (element_id, tag) in self.element_list)
+        return ids
+
+    @property
+    def element_list(self):
+        """
+        Get the IDs and (namespace-agnostic) tag names of the elements discovered in the SVG file, in document order.
+
+        :return: List of (element ID, tag name) tuples
+        :rtype: list[tuple[str, str]]
         """
-        if not self._ids_cache:  # pragma: no cover
-            self.recache_ids()
-        return set(self._ids_cache.splitlines() if self._ids_cache else ())
+        elements = getattr(self, '_elements', None)
+        if elements is None:
+            elements = self._elements = (list(self.elements.values_list('element_id', 'tag')) if self.pk else [])
+        return elements
 
     @property
     def size(self):
@@ -85,82 +326,461 @@ class ImageMap(models.Model):
         """
         return (self._width_cache, self._height_cache)
 
+    @property
+    def artifacts(self):
+        """
+        Get the row of heavier caches (compiled template, rendered SVG, etc.) for this image map.
+
+        The row is loaded when first needed (with its rarely needed fields deferred), unless it was loaded
+        along with the image map (with `select_related('artifacts_row')`), and created if missing.
+
+        :rtype: ImageMapArtifacts
+        """
+        artifacts = getattr(self, '_artifacts', None)
+        if artifacts is None:
+            if type(self).artifacts_row.is_cached(self):
+                # (A missing row raises a `DoesNotExist`, which is an `AttributeError` too.)
+                artifacts = getattr(self, 'artifacts_row', None)
+            elif self.pk:
+                queryset = ImageMapArtifacts.objects.defer(*ImageMapArtifacts.DEFERRED_FIELDS)
+                artifacts = queryset.filter(pk=self.pk).first()
+            if artifacts is None:
+                artifacts = ImageMapArtifacts(image_map_id=self.pk)
+            self._artifacts = artifacts
+        return artifacts
+
+    def refresh_from_db(self, *args, **kwargs):
+        super(ImageMap, self).refresh_from_db(*args, **kwargs)
+        for attr in ('_artifacts', '_elements', '_ids', '_saved_elements', '_pending_generation'):
+            self.__dict__.pop(attr, None)
+
     def save(self, *args, **kwargs):
-        super(ImageMap, self).save(*args, **kwargs)
-        if self.recache_ids() | self.recache_svg():  # Using `|` for non-short-circuited or
-            self.save()
+        update_fields = kwargs.get('update_fields')
+        recache = (update_fields is None or 'svg' in update_fields)
+        if recache:
+            # The SVG is only parsed if its content changed (not e.g. if just the title did).
+            with self._open_original() as stream:
+                svg_digest = get_stream_digest(stream)
+            recache = (svg_digest != self._svg_digest or not self._render_digest)
+            self._svg_digest = svg_digest
+        if recache:
+            # All of the caches are refreshed from a single parse of the SVG (the IDs are collected while compiling
+            # the template, which the SVG is then rendered from) before anything is written, so the image map and
+            # its artifacts are both written just once.
+            changed = self.recache_template() | self.recache_svg()  # Using `|` for non-short-circuited or
+            self._render_state = RENDER_READY
+            if self.pk:
+                pop_pending(self.pk, kwargs.get('using') or self._state.db)  # (Rendered just now.)
+        if update_fields is not None and 'svg' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(self.CACHE_FIELDS) | {'_render_state'}
+        with transaction.atomic(using=kwargs.get('using')):
+            super(ImageMap, self).save(*args, **kwargs)
+            if recache and (changed or self.artifacts._state.adding):
+                self._save_artifacts()
+            self._save_link_caches()
+
+    def rebuild_caches(self, changed_only=False):
+        """
+        Rebuild all of the caches of the image map from its SVG (in a single parse), and save them.
+
+        Unlike `save`, this only writes the caches (not e.g. the title), and the rendered SVG is precompressed
+        at the maximum quality (even if it didn't change).
+
+        :param changed_only: Skip the image map if the content of its SVG hasn't changed (according to its digest).
+        :type changed_only: bool
+        :return: True if the caches changed.
+        :rtype: bool
+        """
+        with self._open_original() as stream:
+            svg_digest = get_stream_digest(stream)
+        if changed_only and svg_digest == self._svg_digest and self._render_digest:
+            return False
+        self._svg_digest = svg_digest
+        changed = self.recache_template() | self.recache_svg(max_compression=True)  # (Non-short-circuited or.)
+        recompressed = (changed or self._compress(max_compression=True))
+        self._render_state = RENDER_READY
+        with transaction.atomic(using=self._state.db):
+            if recompressed or self.artifacts._state.adding:
+                self._save_artifacts()
+            models.Model.save(self, update_fields=self.CACHE_FIELDS + ('_render_state',))
+            self._save_link_caches()
+        return changed
 
     def recache_ids(self, save=False):
         """
-        Refresh the ID cache.
+        Refresh the element table (only).
+
+        Local SVG files are quickly scanned for the elements without a full XML parse, where possible (see
+        `find_elements`).  Saving an image map doesn't need this, as the elements are collected while compiling
+        the template then anyway.
 
-        :param save: Save the ID cache to the database while at it?
+        :param save: Save the element table to the database while at it?
         :type save: bool
-        :return: True if the cache changed.
+        :return: True if the elements changed.
+        :rtype: bool
+        """
+        with self._open_original() as stream:
+            changed = self._set_elements(find_elements(stream, in_elements=get_pipeline().in_elements))
+        if changed and save:
+            self._save_elements()
+        return changed
+
+    def recache_template(self, save=False, pipeline=None):
+        """
+        Refresh the compiled SVG template cache (and the element table, which is refreshed in the same pass).
+
+        :param save: Save the caches to the database while at it?
+        :type save: bool
+        :param pipeline: The pipeline to compile the template with; defaults to the configured one.
+        :type pipeline: wagtail_svgmap.pipeline.Pipeline|None
+        :return: True if either cache changed.
         :rtype: bool
         """
-        old_ids_cache = self._ids_cache
+        artifacts = self.artifacts
+        old_values = (artifacts.template_cache, self.element_list)
         with self._open_original() as stream:
-            self._ids_cache = '\n'.join(sorted(set(find_ids(stream))))
-        changed = (self._ids_cache != old_ids_cache)
+            result = (pipeline or get_pipeline()).run(stream)
+        log.debug(
+            'compiled image map %s: %s',
+            self.pk,
+            ', '.join('%s %.1f ms' % (name, time * 1000) for (name, time) in sorted(result.timings.items())),
+        )
+        artifacts.template_cache = result.compiled.to_json()
+        changed = self._set_elements(result.results['elements'])
+        changed = (changed or artifacts.template_cache != old_values[0])
         if changed and save:  # pragma: no cover
-            models.Model.save(self, update_fields=('_ids_cache',))
+            self._save_artifacts()
         return changed
 
-    def recache_svg(self, save=False):
+    def _set_elements(self, found_elements):
+        """
+        Replace the (in-memory) element list.
+
+        :param found_elements: The (element ID, tag name) tuples found in the SVG, in document order.
+        :type found_elements: Iterable[tuple[str, str]]
+        :return: True if the elements changed.
+        :rtype: bool
+        """
+        old_elements = self.element_list
+        elements = []
+        seen_ids = set()
+        for element_id, tag in found_elements:
+            if element_id not in seen_ids:  # (IDs should be unique, but that's not for us to enforce.)
+                seen_ids.add(element_id)
+                elements.append((element_id, tag))
+        if elements == old_elements:
+            return False
+        if getattr(self, '_saved_elements', None) is None:
+            self._saved_elements = old_elements  # (Kept until saved, to figure out which IDs changed.)
+        self._elements = elements
+        self._ids = None
+        return True
+
+    def recache_svg(self, save=False, max_compression=False):
         """
         Refresh the rendered SVG cache.
 
         :param save: Save the SVG cache to the database while at it?
         :type save: bool
+        :param max_compression: Precompress the rendered SVG at the maximum quality, which takes a good while
+                                for large maps; best left to background jobs (see `wagtail_svgmap.executors`).
+        :type max_compression: bool
         :return: True if the cache changed.
         :rtype: bool
         """
-        old_values = (self._render_cache, self._width_cache, self._height_cache)
+        artifacts = self.artifacts
+        old_values = (artifacts.render_cache, self._width_cache, self._height_cache, artifacts.template_cache)
+        old_digest = self._render_digest
         new_values = self._render()
-        changed = (old_values != new_values)
-        (self._render_cache, self._width_cache, self._height_cache) = new_values
-        if changed and save:
-            models.Model.save(self, update_fields=(
-                '_render_cache',
-                '_width_cache',
-                '_height_cache',
-            ))
+        (artifacts.render_cache, self._width_cache, self._height_cache) = new_values
+        # Rendering may have had to recompile the template, so it's compared and saved too.
+        changed = (old_values != new_values + (artifacts.template_cache,))
+        if changed or not self._render_digest:
+            self._compress(max_compression=max_compression)
+            changed = True
+            if self.pk:
+                get_render_cache().invalidate(self.pk, old_digest)
+        if save:
+            if changed:
+                self._save_artifacts()
+                models.Model.save(self, update_fields=self.CACHE_FIELDS)
+            self._save_link_caches()
         return changed
 
+    def _render_if_pending(self):
+        # Changes to the regions are only rendered (and saved) at the end of the transaction (see
+        # `wagtail_svgmap.recache`); if the rendered SVG is needed before that, the changes are rendered in memory,
+        # so reading it never writes to the database.
+        generation = (get_pending(self.pk, self._state.db) if self.pk else None)
+        if generation is not None and generation != getattr(self, '_pending_generation', None):
+            self.recache_svg()
+            self._pending_generation = generation
+
+    def _save_artifacts(self):
+        artifacts = self.artifacts
+        artifacts.image_map_id = self.pk  # (In case the artifacts were created before this image map was saved.)
+        adding = artifacts._state.adding
+        artifacts.save(force_insert=adding)  # (Skipping the futile `UPDATE` for new rows.)
+        self._save_elements(adding=adding)
+
+    def _save_elements(self, adding=False):
+        saved_elements = getattr(self, '_saved_elements', None)
+        if saved_elements is None:
+            return
+        if not adding:
+            self.elements.all().delete()
+        ImageMapElement.objects.bulk_create(
+            ImageMapElement(image_map=self, element_id=element_id, tag=tag, order=order)
+            for (order, (element_id, tag)) in enumerate(self._elements)
+        )
+        self._saved_elements = None
+        if not adding:
+            self._update_regions(saved_elements)
+
+    def _save_link_caches(self):
+        self._save_resolved_urls()
+        self._save_variants()
+
+    def _save_resolved_urls(self):
+        # Record the link URLs the regions were last rendered with (see `handle_recache_imagemap`),
+        # grouping the regions by URL to do with as few updates as possible.
+        resolved_urls = getattr(self, '_resolved_urls', None)
+        if not resolved_urls:
+            return
+        regions_by_url = {}
+        for region_pk, url in resolved_urls.items():
+            regions_by_url.setdefault(url, []).append(region_pk)
+        for url, region_pks in regions_by_url.items():
+            Region.objects.using(self._state.db).filter(pk__in=region_pks).update(resolved_url=url)
+        self._resolved_urls = None
+
+    def _save_variants(self):
+        variants = getattr(self, '_variants', None)
+        if variants is None:  # Not rendered
+            return
+        self._variants = None
+        saved_variants = {}
+        if self._has_variants:
+            saved_variants = {
+                (site_id, language): render_cache
+                for (site_id, language, render_cache)
+                in self.variants.values_list('site_id', 'language', 'render_cache')
+            }
+        if variants == saved_variants:
+            return
+        with transaction.atomic(using=self._state.db):
+            if saved_variants:
+                self.variants.all().delete()
+            ImageMapVariant.objects.using(self._state.db).bulk_create(
+                ImageMapVariant(image_map=self, site_id=site_id, language=language, render_cache=render_cache)
+                for ((site_id, language), render_cache) in sorted(variants.items())
+            )
+            if self._has_variants != bool(variants):
+                self._has_variants = bool(variants)
+                ImageMap.objects.using(self._state.db).filter(pk=self.pk).update(_has_variants=self._has_variants)
+
+    def _update_regions(self, saved_elements):
+        """
+        Figure out which element IDs changed, and flag the regions whose elements are gone as orphaned
+        (or unflag those whose elements are back).
+
+        :param saved_elements: The elements as they were before the change.
+        :type saved_elements: list[tuple[str, str]]
+        """
+        old_ids = {element_id for (element_id, tag) in saved_elements}
+        diff = self.last_id_diff = IDDiff(added=(self.ids - old_ids), removed=frozenset(old_ids - self.ids))
+        if not (diff.added or diff.removed):
+            return
+        log.info('image map %s: %d element IDs added, %d removed', self.pk, len(diff.added), len(diff.removed))
+        # Image maps have far fewer regions than elements, so the regions are filtered here.
+        orphaned = []
+        restored = []
+        for pk, element_id, was_orphaned in self.regions.values_list('pk', 'element_id', 'orphaned'):
+            if element_id in diff.removed and not was_orphaned:
+                orphaned.append(pk)
+            elif element_id in diff.added and was_orphaned:
+                restored.append(pk)
+        if orphaned:
+            Region.objects.filter(pk__in=orphaned).update(orphaned=True)
+        if restored:
+            Region.objects.filter(pk__in=restored).update(orphaned=False)
+
+    def _compress(self, max_compression=False):
+        """
+        Precompress the rendered SVG.
+
+        :param max_compression: Compress at the maximum quality, even if this very markup was compressed already?
+        :type max_compression: bool
+        :return: True if the markup was compressed.
+        :rtype: bool
+        """
+        artifacts = self.artifacts
+        data = force_bytes(artifacts.render_cache)
+        digest = get_digest(data)
+        if digest == self._render_digest and not max_compression:  # Already compressed this very markup
+            return False
+        if max_compression:
+            artifacts.render_gzip_cache = compress_gzip(data, level=GZIP_MAX_LEVEL)
+            artifacts.render_brotli_cache = compress_brotli(data, quality=BROTLI_MAX_QUALITY)
+        else:
+            artifacts.render_gzip_cache = compress_gzip(data)
+            artifacts.render_brotli_cache = compress_brotli(data)
+        if digest != self._render_digest:
+            self._render_digest = digest
+            self._rendered_at = timezone.now()
+        return True
+
+    @contextmanager
     def _open_original(self):
         stream = self.svg
+        # A new upload is only written to the storage while saving (after it's been parsed), so it's left open.
+        committed = stream._committed
         stream.open()
         if stream.tell():  # pragma: no cover
             stream.seek(0)
-        return closing(stream)
+        try:
+            yield stream
+        finally:
+            if committed:
+                stream.close()
 
     def _render(self):
-        links = {
-            region.element_id: Link(url=region.link, target=region.target)
-            for region
-            in self.regions.select_related('link_page', 'link_document').all()
-        }
-        with self._open_original() as stream:
-            tree = wrap_elements_in_links(stream, links)
-            fix_dimensions(tree)
+        links = {}
+        resolved_urls = {}  # The regions whose link URLs changed since they were last rendered
+        resolver = LinkResolver()
+        regions = (list(self.regions.select_related('link_page', 'link_document')) if self.pk else [])
+        for region in regions:
+            url = (resolver.resolve(region) or '')  # (Unroutable pages have no URL; the field isn't nullable.)
+            if url:
+                links[region.element_id] = Link(url=url, target=region.target)
+            if url != region.resolved_url:
+                resolved_urls[region.pk] = url
+        self._resolved_urls = resolved_urls
+        compiled = self.compiled_svg
+        (rendered, root) = self._render_links(compiled, links)
 
         try:
-            width, height = get_dimensions(tree)
+            width, height = get_dimensions(root)
         except:  # pragma: no cover
             log.warn('unable to determine dimensions for %s' % self.pk, exc_info=True)
             width = height = 0
 
-        rendered = serialize_svg(tree, xml_declaration=False)
         for element_id, link in links.items():  # Sanity check
             if element_id in rendered:  # If the target element exists at all,
                 assert link.url in rendered  # The link URL should be there too
+        self._variants = self._render_variants(compiled, regions, links, rendered)
         return (rendered, width, height)
 
+    def _render_links(self, compiled, links):
+        rendered = compiled.render(links)
+        if rendered is not None:
+            return (rendered, compiled.get_root())
+        else:
+            # Some link (or the lack of links) couldn't be rendered from the compiled form, so do things the slow way.
+            output = BytesIO()
+            with self._open_original() as stream:
+                root = get_pipeline().stream_wrap_elements_in_links(stream, output, links, xml_declaration=False)
+            return (decode_buffer(output), root)
+
+    def _render_variants(self, compiled, regions, links, rendered):
+        """
+        Render the variants of the SVG for the sites (and languages) the links of the regions differ for.
+
+        :return: Mapping of (site ID, language) pairs to the markup, for the variants that differ from `rendered`.
+        :rtype: dict[tuple[int, str], str]
+        """
+        variants = {}
+        if not any(region.link_page_id or region.link_document_id for region in regions):
+            return variants  # External links are the same everywhere.
+        for site_id, language in get_variant_keys():
+            resolver = LinkResolver(site_id=site_id, language=language)
+            variant_links = {}
+            for region in regions:
+                url = resolver.resolve(region)
+                if url:
+                    variant_links[region.element_id] = Link(url=url, target=region.target)
+            if variant_links != links:
+                variant_rendered = self._render_links(compiled, variant_links)[0]
+                if variant_rendered != rendered:
+                    variants[(site_id, language or '')] = variant_rendered
+        return variants
+
     def __str__(self):  # pragma: no cover
         return self.title
 
 
+@python_2_unicode_compatible
+class ImageMapArtifacts(models.Model):
+    """
+    The heavier caches of an image map, kept in a table of their own.
+
+    Listing or choosing image maps never needs these, so they're only loaded when the rendered SVG
+    (or the element IDs, etc.) of a map are actually accessed; see `ImageMap.artifacts`.
+    """
+
+    #: Fields not loaded along with the rest of the row, since they're only needed when (re)rendering or serving
+    #: precompressed variants.
+    DEFERRED_FIELDS = ('template_cache', 'render_gzip_cache', 'render_brotli_cache')
+
+    image_map = models.OneToOneField(
+        to=ImageMap, primary_key=True, related_name='artifacts_row', on_delete=models.CASCADE,
+    )
+    template_cache = models.TextField(editable=False, blank=True)
+    render_cache = models.TextField(editable=False, blank=True)
+    render_gzip_cache = models.BinaryField(editable=False, blank=True, null=True)
+    render_brotli_cache = models.BinaryField(editable=False, blank=True, null=True)
+
+    def __str__(self):  # pragma: no cover
+        return 'artifacts of image map %s' % self.pk
+
+
+@python_2_unicode_compatible
+class ImageMapVariant(models.Model):
+    """
+    A variant of the rendered SVG of an image map for a site (and language), with the links to that site's pages
+    being local (see `wagtail_svgmap.links`).
+
+    Variants are only stored for the sites (and languages) their markup differs from the main render for.
+    """
+
+    image_map = models.ForeignKey(to=ImageMap, related_name='variants', on_delete=models.CASCADE)
+    site = models.ForeignKey(to='wagtailcore.Site', related_name='+', on_delete=models.CASCADE)
+    language = models.CharField(max_length=16, blank=True)
+    render_cache = models.TextField(editable=False, blank=True)
+
+    class Meta:
+        unique_together = [
+            ('image_map', 'site', 'language'),
+        ]
+
+    def __str__(self):  # pragma: no cover
+        return 'variant of image map %s for site %s %s' % (self.image_map_id, self.site_id, self.language)
+
+
+@python_2_unicode_compatible
+class ImageMapElement(models.Model):
+    """
+    An element (with an ID) in the SVG of an image map.
+
+    These are indexed by element ID, so e.g. the image maps containing a given element can be queried
+    (see `ImageMapQuerySet.with_element`).
+    """
+
+    image_map = models.ForeignKey(to=ImageMap, related_name='elements', on_delete=models.CASCADE)
+    element_id = models.CharField(verbose_name=_('element ID'), max_length=255, db_index=True)
+    tag = models.CharField(verbose_name=_('tag name'), max_length=64, blank=True)
+    order = models.PositiveIntegerField(verbose_name=_('document order'))
+
+    class Meta:
+        ordering = ('image_map', 'order')
+        unique_together = [
+            ('image_map', 'element_id'),
+        ]
+
+    def __str__(self):  # pragma: no cover
+        return '#%s' % self.element_id
+
+
 @python_2_unicode_compatible
 class Region(LinkFields, models.Model):
     """
@@ -173,6 +793,9 @@ class Region(LinkFields, models.Model):
         verbose_name=_('link target'), blank=True, max_length=64,
         help_text=_('Use _blank to open links in new windows.')
     )
+    orphaned = models.BooleanField(verbose_name=_('orphaned'), default=False, editable=False)
+    #: The link URL the region was last rendered with.
+    resolved_url = models.TextField(verbose_name=_('resolved URL'), blank=True, editable=False)
 
     class Meta:
         unique_together = [
@@ -186,8 +809,13 @@ class Region(LinkFields, models.Model):
         return text
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        # (Regions are orphaned when their element disappears from the SVG; see `ImageMap._update_regions`.)
+        self.orphaned = not ImageMapElement.objects.using(using or self._state.db).filter(
+            image_map_id=self.image_map_id,
+            element_id=self.element_id,
+        ).exists()
         super(Region, self).save(force_insert, force_update, using, update_fields)
-        self.image_map.recache_svg(save=True)
+        schedule_recache(self.image_map_id, using=self._state.db)
 
     panels = [
         FieldPanel('image_map'),
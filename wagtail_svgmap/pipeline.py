@@ -0,0 +1,255 @@
+"""
+Single-pass SVG processing pipelines.
+
+Compiling an image map's SVG (see `wagtail_svgmap.streaming.compile_svg`) takes a single pass over the document,
+in which link slots are cut and attributes are qualified.  A `Pipeline` runs a number of additional stages within
+that same pass, so e.g. collecting the element IDs doesn't need a pass of its own.
+
+Stages may be added with the `WAGTAIL_SVGMAP_PIPELINE_STAGES` setting (a list of dotted paths to `Stage`
+subclasses); they're run after the built-in ones.
+"""
+import json
+import timeit
+from collections import namedtuple
+
+import six
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from wagtail_svgmap.minify import get_minifier
+from wagtail_svgmap.streaming import compile_svg, stream_wrap_elements_in_links
+from wagtail_svgmap.svg import fix_dimensions, VISIBLE_SVG_TAGS
+
+#: The result of running a pipeline: the `CompiledSVG`, and dicts of stage results and timings (in seconds).
+#: The timings also include the time taken by the compiler itself (parsing, link slots, attributes) as `compile`.
+PipelineResult = namedtuple('PipelineResult', ('compiled', 'results', 'timings'))
+
+
+class Stage(object):
+    """
+    Base class for pipeline stages.
+
+    A new stage instance is created for each run of a pipeline, so stages may keep state.
+    """
+
+    #: The name of the stage (for results and timings).
+    name = None
+
+    #: Whether the `element` hook should be called; it's skipped altogether otherwise.
+    handles_elements = False
+
+    def __init__(self, pipeline):
+        """
+        Construct a stage.
+
+        :param pipeline: The pipeline being run.
+        :type pipeline: Pipeline
+        """
+        self.pipeline = pipeline
+
+    def transform_root(self, tree):
+        """
+        Observe or modify the (childless) root element before it's processed.
+
+        :param tree: An `ElementTree` containing the root element; its attributes may be modified in-place.
+        :type tree: xml.etree.ElementTree.ElementTree
+        """
+
+    def element(self, tag, attr_list):
+        """
+        Observe or modify a non-root element before it's processed.
+
+        :param tag: Qualified tag name.
+        :type tag: str
+        :param attr_list: Expat-style flat attribute list (`uri}local` names, values).
+        :type attr_list: list[str]
+        :return: The attribute list to use.
+        :rtype: list[str]
+        """
+        return attr_list
+
+    def finish(self, compiled):
+        """
+        Finish the stage.
+
+        :param compiled: The compiled SVG.
+        :type compiled: wagtail_svgmap.streaming.CompiledSVG
+        :return: The result of the stage, if any.
+        """
+        return None
+
+
+class CollectElementsStage(Stage):
+    """
+    Collects the IDs and (namespace-agnostic) tag names of the elements that could be linked, in document order.
+    """
+
+    name = 'elements'
+    handles_elements = True
+
+    def __init__(self, pipeline):
+        super(CollectElementsStage, self).__init__(pipeline)
+        self.elements = []
+        self.local_names = {}
+
+    def transform_root(self, tree):
+        root = tree.getroot()
+        self.element(root.tag, ['id', root.get('id')])
+
+    def element(self, tag, attr_list):
+        local_name = self.local_names.get(tag)
+        if local_name is None:
+            in_elements = self.pipeline.in_elements
+            local_name = tag.split('}')[-1]
+            local_name = self.local_names[tag] = (local_name if not in_elements or local_name in in_elements else '')
+        if local_name:
+            for i in range(0, len(attr_list), 2):
+                if attr_list[i] == 'id':
+                    if attr_list[i + 1]:
+                        self.elements.append((attr_list[i + 1], local_name))
+                    break
+        return attr_list
+
+    def finish(self, compiled):
+        return self.elements
+
+
+class CollectIDsStage(CollectElementsStage):
+    """
+    Collects the IDs of the elements that could be linked (the equivalent of `find_ids`).
+    """
+
+    name = 'ids'
+
+    def finish(self, compiled):
+        return [element_id for (element_id, tag) in self.elements]
+
+
+class FixDimensionsStage(Stage):
+    """
+    Replaces hard-coded dimensions with a viewbox (see `fix_dimensions`).
+    """
+
+    name = 'dimensions'
+
+    def transform_root(self, tree):
+        fix_dimensions(tree)
+
+
+DEFAULT_STAGES = (
+    CollectElementsStage,
+    FixDimensionsStage,
+)
+
+
+class Pipeline(object):
+    """
+    A set of stages run in the single pass of compiling an SVG.
+    """
+
+    def __init__(self, stages=DEFAULT_STAGES, in_elements=VISIBLE_SVG_TAGS, minifier=None):
+        """
+        Construct a pipeline.
+
+        :param stages: Stage classes, in order.
+        :type stages: Iterable[type]
+        :param in_elements: Set of namespace-agnostic element names to consider for linking.
+        :param minifier: Optional minifier (see `wagtail_svgmap.minify`).
+        :type minifier: wagtail_svgmap.minify.Minifier|None
+        """
+        self.stages = tuple(stages)
+        self.in_elements = in_elements
+        self.minifier = minifier
+
+    @property
+    def key(self):
+        """
+        A string identifying the stages and options of this pipeline (to tell whether compiled SVGs are outdated).
+
+        :rtype: str
+        """
+        return json.dumps([
+            (self.minifier.key if self.minifier else ''),
+            ['%s.%s' % (stage.__module__, stage.__name__) for stage in self.stages],
+        ])
+
+    def _get_transforms(self, stages, timings=None):
+        if timings is None:  # Nobody's interested in the timings, but it's simpler to collect them anyway
+            timings = dict.fromkeys((stage.name for stage in stages), 0)
+        element_stages = [stage for stage in stages if stage.handles_elements]
+        timer = timeit.default_timer
+
+        def root_transform(tree):
+            for stage in stages:
+                start = timer()
+                stage.transform_root(tree)
+                timings[stage.name] += timer() - start
+
+        def element_transform(tag, attr_list):
+            for stage in element_stages:
+                start = timer()
+                attr_list = stage.element(tag, attr_list)
+                timings[stage.name] += timer() - start
+            return attr_list
+
+        return (root_transform, (element_transform if element_stages else None))
+
+    def run(self, svg_stream):
+        """
+        Compile an SVG stream, running the stages of the pipeline.
+
+        :param svg_stream: The SVG stream to parse.
+        :rtype: PipelineResult
+        """
+        stages = [stage_class(self) for stage_class in self.stages]
+        timings = dict.fromkeys((stage.name for stage in stages), 0)
+        root_transform, element_transform = self._get_transforms(stages, timings)
+        start = timeit.default_timer()
+        compiled = compile_svg(
+            svg_stream,
+            in_elements=self.in_elements,
+            root_transform=root_transform,
+            minifier=self.minifier,
+            element_transform=element_transform,
+            options_key=self.key,
+        )
+        results = {}
+        for stage in stages:
+            stage_start = timeit.default_timer()
+            results[stage.name] = stage.finish(compiled)
+            timings[stage.name] += timeit.default_timer() - stage_start
+        timings['compile'] = timeit.default_timer() - start - sum(timings.values())
+        return PipelineResult(compiled, results, timings)
+
+    def stream_wrap_elements_in_links(self, svg_stream, out_stream, id_to_url_map, **kwargs):
+        """
+        Run the stages of the pipeline while streaming a linkified SVG (see `stream_wrap_elements_in_links`).
+
+        Stage results are not collected, and the stages see every element twice (once per read of the stream).
+
+        :return: An `ElementTree` containing the childless root element, as written.
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        root_transform, element_transform = self._get_transforms([stage_class(self) for stage_class in self.stages])
+        return stream_wrap_elements_in_links(
+            svg_stream,
+            out_stream,
+            id_to_url_map,
+            in_elements=self.in_elements,
+            root_transform=root_transform,
+            minifier=self.minifier,
+            element_transform=element_transform,
+            **kwargs
+        )
+
+
+def get_pipeline():
+    """
+    Get the pipeline configured by the settings (`WAGTAIL_SVGMAP_PIPELINE_STAGES`, `WAGTAIL_SVGMAP_MINIFY`).
+
+    :rtype: Pipeline
+    """
+    stages = list(DEFAULT_STAGES)
+    for stage in getattr(settings, 'WAGTAIL_SVGMAP_PIPELINE_STAGES', ()):
+        stages.append(import_string(stage) if isinstance(stage, six.string_types) else stage)
+    return Pipeline(stages, minifier=get_minifier())
@@ -0,0 +1,151 @@
+"""
+Coalesced recaching of rendered image maps.
+
+Changes to regions (and to the pages and documents they link to) don't rerender the affected image maps
+right away; instead, the maps are marked dirty, and each dirty map is rerendered just once (by the configured
+executor; see `wagtail_svgmap.executors`) when the transaction commits (or right away, outside transactions).
+If the rendered SVG of a dirty map is accessed before that, the changes are rendered in memory (but not saved),
+so the thread making the changes always sees them.  If the transaction (or a savepoint) is rolled back, the map
+is no longer dirty (as soon as that can be told; at the end of the request at the latest).
+
+The `batch` context manager defers the rerendering further, until the end of the block; useful for scripts
+and data migrations that change lots of regions without a transaction of their own.
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from wagtail_svgmap.executors import get_executor
+
+_local = threading.local()
+
+
+_generations = itertools.count(1)
+
+
+def _get_pending():
+    # Mapping of (database alias, image map ID) to (the `on_commit` callback, or None within a batch; generation).
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = {}
+    return pending
+
+
+def _is_registered(using, callback):
+    connection = transaction.get_connection(using)
+    return any(func is callback for (sids, func) in connection.run_on_commit)
+
+
+def schedule_recache(image_map_id, using=None):
+    """
+    Mark an image map dirty, to be rerendered once the current transaction (or batch) is over.
+
+    :param image_map_id: The ID of the image map.
+    :type image_map_id: int
+    :param using: The database alias the change was made in.
+    :type using: str|None
+    """
+    key = (using or DEFAULT_DB_ALIAS, image_map_id)
+    pending = _get_pending()
+    callback = pending.get(key, (None, None))[0]
+    register = False
+    if getattr(_local, 'batch_depth', 0):
+        callback = None  # (Registered at the end of the batch.)
+    elif callback is None or not _is_registered(key[0], callback):  # Not already to be rerendered on commit
+        callback = partial(_recache, key)
+        register = True
+    pending[key] = (callback, next(_generations))
+    if register:
+        transaction.on_commit(callback, using=key[0])
+
+
+def get_pending(image_map_id, using=None):
+    """
+    Figure out whether an image map is dirty.
+
+    :param image_map_id: The ID of the image map.
+    :type image_map_id: int
+    :param using: The database alias.
+    :type using: str|None
+    :return: None if the image map isn't dirty; otherwise a number that changes whenever the map is changed again.
+    :rtype: int|None
+    """
+    key = (using or DEFAULT_DB_ALIAS, image_map_id)
+    callback, generation = getattr(_local, 'pending', {}).get(key, (None, None))
+    if callback is not None and transaction.get_connection(key[0]).in_atomic_block:
+        if not _is_registered(key[0], callback):  # Rolled back (to a savepoint, or along with an earlier transaction)
+            del _local.pending[key]
+            return None
+    # (Outside transactions, the callback may just be about to run, so the map is considered dirty until then.)
+    return generation
+
+
+def pop_pending(image_map_id, using=None):
+    """
+    Unmark an image map as dirty.
+
+    :param image_map_id: The ID of the image map.
+    :type image_map_id: int
+    :param using: The database alias.
+    :type using: str|None
+    :return: Whether the image map was dirty (and should now be rerendered by the caller).
+    :rtype: bool
+    """
+    pending = getattr(_local, 'pending', None)
+    if not pending:
+        return False
+    key = (using or DEFAULT_DB_ALIAS, image_map_id)
+    return (pending.pop(key, None) is not None)
+
+
+def discard_rolled_back(**kwargs):
+    """
+    Forget about the dirty image maps (of this thread) whose changes were rolled back.
+
+    Connected to `request_finished`: by then, the transactions of the request are over, so the maps whose
+    `on_commit` callbacks are gone were either rerendered already or rolled back.
+    """
+    pending = _get_pending()
+    for key, (callback, generation) in list(pending.items()):
+        if callback is not None and not _is_registered(key[0], callback):
+            del pending[key]
+
+
+def flush():
+    """
+    Rerender all of the dirty image maps (of this thread) right now.
+    """
+    for key in list(_get_pending()):
+        _recache(key)
+
+
+@contextmanager
+def batch():
+    """
+    Defer rerendering the image maps changed within the block until the end of the block.
+
+    If the block is within a transaction, the image maps are rerendered when it commits.
+    Batches may be nested; the outermost one counts.
+    """
+    _local.batch_depth = getattr(_local, 'batch_depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.batch_depth -= 1
+        if not _local.batch_depth:
+            pending = _get_pending()
+            for key, (callback, generation) in list(pending.items()):
+                if callback is None:
+                    callback = partial(_recache, key)
+                    pending[key] = (callback, generation)
+                    transaction.on_commit(callback, using=key[0])
+
+
+def _recache(key):
+    using, image_map_id = key
+    if not pop_pending(image_map_id, using):  # Already rerendered
+        return
+    get_executor().submit(image_map_id, using=using)
@@ -0,0 +1,199 @@
+"""
+A tiered cache for the rendered SVG markup served by `ImageMapBlock` (see `ImageMap.get_rendered_svg`).
+
+1. A bounded, in-process LRU cache (`WAGTAIL_SVGMAP_RENDER_CACHE_SIZE` characters of markup in total; 0 disables it).
+2. A Django cache (the `WAGTAIL_SVGMAP_RENDER_CACHE_ALIAS` alias, if set), shared between processes.
+
+The markup of whole `ImageMapBlock`s is cached alongside (keyed by a hash of the block options and page state
+in place of the variant).
+
+Entries are keyed by the image map's ID and render digest (and the site and language of the variant), so once a map
+is rerendered, its new digest (read from the database along with the map) never matches the old entries; they're
+dropped by `recache_svg` (or left to age out of the other processes' caches).
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache(object):
+    """
+    A thread-safe least-recently-used cache of strings, bounded by the total length of the values.
+    """
+
+    def __init__(self, max_size):
+        """
+        Construct an LRU cache.
+
+        :param max_size: The maximum total length of the values.
+        :type max_size: int
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value  # (Re-inserted as the most recently used one.)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_size:  # Would just flush everything else
+            return
+        with self._lock:
+            old_value = self._entries.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                (evicted_key, evicted_value) = self._entries.popitem(last=False)
+                self.size -= len(evicted_value)
+
+    def delete_matching(self, predicate):
+        """
+        Delete the entries whose keys match a predicate.
+
+        :param predicate: Function of the key.
+        :type predicate: function
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self.size -= len(self._entries.pop(key))
+
+
+class RenderCache(object):
+    """
+    The tiered cache of rendered SVG markup, with hit and miss counters.
+    """
+
+    def __init__(self, max_size=0, alias=None):
+        """
+        Construct a render cache.
+
+        :param max_size: The maximum total length of the markup in the in-process cache; 0 to disable it.
+        :type max_size: int
+        :param alias: The alias of the Django cache to use as the second tier, if any.
+        :type alias: str|None
+        """
+        self.local = (LRUCache(max_size) if max_size else None)
+        self.shared = (caches[alias] if alias else None)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def get(self, image_map_id, digest, variant=None):
+        """
+        Get cached markup.
+
+        :param image_map_id: The ID of the image map.
+        :type image_map_id: int
+        :param digest: The render digest of the image map.
+        :type digest: str
+        :param variant: The (site ID, language) of the variant, or ('fragment', hash) of a block, if any.
+        :type variant: tuple[int|str, str]|None
+        :return: The markup, or None if it's not cached.
+        :rtype: str|None
+        """
+        key = (image_map_id, digest, variant)
+        markup = (self.local.get(key) if self.local is not None else None)
+        if markup is not None:
+            self._count('local_hits')
+            return markup
+        if self.shared is not None:
+            markup = self.shared.get(self._get_shared_key(key))
+            if markup is not None:
+                self._count('shared_hits')
+                if self.local is not None:
+                    self.local.set(key, markup)
+                return markup
+        self._count('misses')
+        return None
+
+    def set(self, image_map_id, digest, markup, variant=None):
+        """
+        Cache markup (in all of the tiers).
+
+        :param image_map_id: The ID of the image map.
+        :type image_map_id: int
+        :param digest: The render digest of the image map.
+        :type digest: str
+        :param markup: The markup.
+        :type markup: str
+        :param variant: The (site ID, language) of the variant, or ('fragment', hash) of a block, if any.
+        :type variant: tuple[int|str, str]|None
+        """
+        key = (image_map_id, digest, variant)
+        if self.local is not None:
+            self.local.set(key, markup)
+        if self.shared is not None:
+            self.shared.set(self._get_shared_key(key), markup)
+
+    def invalidate(self, image_map_id, digest=None):
+        """
+        Drop the cached markup of an image map (e.g. because it was rerendered).
+
+        The entries of the variants (if any) are only dropped from the in-process cache, as their keys
+        aren't known; with the digest in their keys, they won't be served for the new render, though.
+
+        :param image_map_id: The ID of the image map.
+        :type image_map_id: int
+        :param digest: The render digest of the entries to drop from the shared cache, if any.
+        :type digest: str|None
+        """
+        if self.local is not None:
+            self.local.delete_matching(lambda key: key[0] == image_map_id)
+        if self.shared is not None and digest:
+            self.shared.delete(self._get_shared_key((image_map_id, digest, None)))
+
+    @property
+    def stats(self):
+        """
+        Get the hit and miss counters.
+
+        :return: Dict of `local_hits`, `shared_hits` and `misses`.
+        :rtype: dict[str, int]
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def _get_shared_key(self, key):
+        (image_map_id, digest, variant) = key
+        shared_key = 'wagtail_svgmap:render:%s:%s' % (image_map_id, digest)
+        if variant:
+            shared_key += ':%s:%s' % variant
+        return shared_key
+
+
+_render_cache_cache = {}
+
+
+def get_render_cache():
+    """
+    Get the render cache instance, as configured in the settings.
+
+    :rtype: RenderCache
+    """
+    config = (
+        getattr(settings, 'WAGTAIL_SVGMAP_RENDER_CACHE_SIZE', 8 * 1024 * 1024),
+        getattr(settings, 'WAGTAIL_SVGMAP_RENDER_CACHE_ALIAS', None),
+    )
+    render_cache = _render_cache_cache.get(config)
+    if render_cache is None:
+        render_cache = _render_cache_cache[config] = RenderCache(*config)
+    return render_cache
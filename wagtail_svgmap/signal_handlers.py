@@ -1,31 +1,103 @@
 try:
-    from wagtail.core.models import Page
+    from wagtail.core.models import Page, Site
     from wagtail.documents.models import Document
 except ImportError:
-    from wagtail.wagtailcore.models import Page
+    from wagtail.wagtailcore.models import Page, Site
     from wagtail.wagtaildocs.models import Document
 
 from wagtail_svgmap import log
-from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.links import LinkResolver, moved_url_path
+from wagtail_svgmap.models import ImageMap, Region
+from wagtail_svgmap.recache import schedule_recache
 
 
-def handle_recache_imagemap(instance, **kwargs):
+def handle_page_pre_save(instance, raw=False, using=None, update_fields=None, **kwargs):
+    """
+    Django `pre_save` handler to remember the URL path a page had before it's saved (see `handle_recache_imagemap`).
+
+    :param instance: The instance being saved (only Pages are of interest)
+    :param raw: Whether the instance is being loaded from a fixture
+    :param using: The database alias used
+    :param update_fields: The fields being saved, if not all of them
+    :param kwargs: Signal kwargs
+    """
+    if raw or not isinstance(instance, Page) or instance.pk is None:
+        return
+    if update_fields is not None and not ({'slug', 'url_path'} & set(update_fields)):  # The URL can't change
+        return
+    instance._svgmap_old_url_path = (
+        Page.objects.using(using).filter(pk=instance.pk).values_list('url_path', flat=True).first()
+    )
+
+
+def handle_recache_imagemap(instance, raw=False, using=None, **kwargs):
     """
     Django `post_save` handler to automatically recache rendered SVGs.
 
     This is called for ImageMap instances when region link
     dependencies (pages and documents) change.
 
-    :param instance: The changed instance (either a Page or Document)
+    Changes to sites (which are also handled on `post_delete`) may change the URLs of any pages, and which
+    per-site variants of the maps are needed, so all of the image maps linking to pages are recached.
+
+    Only the image maps with a region whose link URL actually changed (compared to the URL it was last rendered
+    with; see `Region.resolved_url`) are recached.  For pages, that's only possible when the page's URL path
+    changes (by a slug change or a move), which also changes the URLs of all of the pages in its subtree.
+
+    The image maps are rerendered when the transaction commits; see `wagtail_svgmap.recache`.
+
+    :param instance: The changed instance (a Page, Document or Site)
+    :param raw: Whether the instance was loaded from a fixture
+    :param using: The database alias used
+    :param kwargs: Signal kwargs
+    """
+    if raw:
+        return
+    if isinstance(instance, Page):
+        _handle_page_save(instance, using)
+    elif isinstance(instance, Document):
+        regions = Region.objects.using(using).filter(link_page__isnull=True, link_document=instance)
+        linked_map_ids = regions.exclude(resolved_url=instance.url).values_list('image_map_id', flat=True)
+        for map_id in set(linked_map_ids):
+            log.info('Recaching image map %s because %s changed', map_id, instance)
+            schedule_recache(map_id, using=using)
+    elif isinstance(instance, Site):
+        linked_maps = ImageMap.objects.using(using).filter(regions__link_page__isnull=False)
+        for map_id in linked_maps.values_list('pk', flat=True).distinct():
+            log.info('Recaching image map %s because %s changed', map_id, instance)
+            schedule_recache(map_id, using=using)
+
+
+def _handle_page_save(page, using):
+    old_url_path = page.__dict__.pop('_svgmap_old_url_path', None)
+    if old_url_path is None or old_url_path == page.url_path:  # Either a new page, or the URL didn't change
+        return
+    # Wagtail updates the URL paths of the page's descendants only after this; `moved_url_path` accounts for that.
+    with moved_url_path(old_url_path, page.url_path):
+        regions = Region.objects.using(using).filter(link_page__path__startswith=page.path).select_related('link_page')
+        resolver = LinkResolver()
+        stale_map_ids = {
+            region.image_map_id
+            for region in regions
+            if (resolver.get_page_url(region.link_page) or '') != region.resolved_url  # (None if unroutable.)
+        }
+        if not stale_map_ids:
+            return
+        log.info('Recaching image maps %s because %s moved', sorted(stale_map_ids), page)
+        # Wagtail saves pages (and updates the descendants) in a transaction, so by the time it commits, the
+        # descendants are up to date.  Were the executor to run right away, it'd still be within this block.
+        for map_id in stale_map_ids:
+            schedule_recache(map_id, using=using)
+
+
+def handle_region_delete(instance, using=None, **kwargs):
+    """
+    Django `post_delete` handler to recache the rendered SVG of a deleted region's image map.
+
+    This also covers regions deleted by cascade (when their linked page or document is deleted).
+
+    :param instance: The deleted Region
+    :param using: The database alias used
     :param kwargs: Signal kwargs
     """
-    if isinstance(instance, Page):  # pragma: no branch
-        linked_maps = ImageMap.objects.filter(regions__link_page=instance)
-    elif isinstance(instance, Document):  # pragma: no branch
-        linked_maps = ImageMap.objects.filter(regions__link_document=instance)
-    else:  # pragma: no cover
-        linked_maps = []
-
-    for map in linked_maps:
-        if map.recache_svg(save=True):  # pragma: no branch
-            log.info('Recached image map %s because %s changed', map.pk, instance)
+    schedule_recache(instance.image_map_id, using=using)
@@ -0,0 +1,847 @@
+"""
+Streaming (event-driven) SVG processing.
+
+The functions in `wagtail_svgmap.svg` operate on complete `ElementTree` trees, which is fine for
+small maps, but for maps that are tens of megabytes in size, the whole tree has to be held in memory
+at once. The functions here instead process an SVG stream with Expat and write their output as they go,
+so memory use is bounded by the nesting depth of the document, not its size.
+
+The output is byte-for-byte the same as that of the tree-based functions (`wrap_elements_in_links`
+followed by `serialize_svg`), since the serialization rules of `ElementTree` are emulated here.
+"""
+import json
+import sys
+from xml.etree import ElementTree as _ElementTree
+from xml.parsers import expat
+
+import six
+
+from wagtail_svgmap.svg import _get_link, ET, Link, SVG_NAMESPACE, VISIBLE_SVG_TAGS, XLINK_NAMESPACE
+
+#: Size of the chunks read from the input stream.
+READ_CHUNK_SIZE = 64 * 1024
+
+#: Number of string pieces buffered before they're encoded and written to the output stream.
+WRITE_BUFFER_PIECES = 4096
+
+# `ElementTree` sorted attributes lexically when serializing until Python 3.8;
+# since then, the insertion order is retained.
+_SORT_ATTRIBUTES = (sys.version_info < (3, 8))
+
+# These are the very same escape functions `ElementTree` uses.
+_escape_attrib = _ElementTree._escape_attrib
+_escape_cdata = _ElementTree._escape_cdata
+
+_A_TAG = '{%s}a' % SVG_NAMESPACE
+
+
+def _fixname(name):
+    # Expat is configured to separate namespaces with `}`; add the `{` to get ElementTree-style names.
+    if '}' in name:
+        return '{' + name
+    return name
+
+
+def _to_attr_list(attrib_items):
+    """
+    Convert ElementTree-style attribute (key, value) pairs to an Expat-style flat list.
+
+    :rtype: list[str]
+    """
+    attr_list = []
+    for key, value in attrib_items:
+        attr_list.append(key[1:] if key[:1] == '{' else key)
+        attr_list.append(value)
+    return attr_list
+
+
+def _get_id(attr_list):
+    for i in range(0, len(attr_list), 2):
+        if attr_list[i] == 'id':
+            return attr_list[i + 1]
+    return None
+
+
+def _get_link_attr_list(link):
+    return _to_attr_list(kv for kv in link.get_element_attribs().items() if kv[0] and kv[1])
+
+
+def _format_attributes(qnames, attr_list):
+    """
+    Format an Expat-style attribute list the way `ElementTree` would after `fixup_unqualified_attributes`.
+
+    That is, unqualified attributes end up after the qualified ones.
+
+    :param qnames: Mapping of qualified names to prefixed names.
+    :type qnames: dict[str, str]
+    :param attr_list: Expat-style flat attribute list.
+    :type attr_list: list[str]
+    :return: The attributes, each with a leading space.
+    :rtype: str
+    """
+    qualified = []
+    unqualified = []
+    for i in range(0, len(attr_list), 2):
+        key = attr_list[i]
+        if '}' in key:
+            key = '{' + key
+            qualified.append((key, qnames[key], attr_list[i + 1]))
+        else:
+            unqualified.append(('{%s}%s' % (SVG_NAMESPACE, key), key, attr_list[i + 1]))
+    items = qualified + unqualified
+    if _SORT_ATTRIBUTES:  # pragma: no cover
+        items.sort()
+    return ''.join([' %s="%s"' % (qname, _escape_attrib(value)) for (key, qname, value) in items])
+
+
+class _ElementMatcher(object):
+    """
+    Figures out which elements are eligible to be wrapped in links (see `wagtail_svgmap.svg._find_link`).
+
+    Whether an element's tag is eligible at all is cached per tag.
+    Calling the matcher returns the ID of an eligible element, or None.
+    """
+
+    def __init__(self, in_elements):
+        self.in_elements = in_elements
+        self.candidate_tags = {}
+
+    def __call__(self, tag, attr_list):
+        candidate = self.candidate_tags.get(tag)
+        if candidate is None:
+            candidate = (not self.in_elements or tag.split('}')[-1] in self.in_elements)
+            self.candidate_tags[tag] = candidate
+        if not candidate:
+            return None
+        return _get_id(attr_list)
+
+
+class _LinkMatcher(_ElementMatcher):
+    """
+    Figures out which elements get wrapped in which links.
+
+    Calling the matcher returns the `Link` to wrap an element in, or None.
+    """
+
+    def __init__(self, id_to_url_map, in_elements):
+        super(_LinkMatcher, self).__init__(in_elements)
+        self.id_to_url_map = id_to_url_map
+
+    def __call__(self, tag, attr_list):
+        element_id = super(_LinkMatcher, self).__call__(tag, attr_list)
+        if element_id is None:
+            return None
+        return _get_link(self.id_to_url_map, element_id)
+
+
+class _NamespaceCollector(object):
+    """
+    Emulates `ElementTree._namespaces()` for a stream of start events.
+
+    The namespace prefixes `ElementTree` assigns depend on the order in which namespaced names are encountered in
+    the whole document, and they're all declared on the root element, so they need to be known before anything
+    can be written out.
+
+    Unqualified attributes are not considered, since `fixup_unqualified_attributes` places them
+    in the default namespace anyway.
+    """
+
+    def __init__(self, match_link, default_namespace=SVG_NAMESPACE):
+        self.match_link = match_link
+        self.default_namespace = default_namespace
+        self.qnames = {}
+        self.namespaces = {default_namespace: ''}
+        self.last_link = None  # The last link seen, and its attribute list (the same link tends to recur)
+        self.last_link_attr_list = None
+
+    def add(self, name):
+        if name in self.qnames:
+            return
+        if name[:1] != '{':
+            raise ValueError('cannot use non-qualified names with default_namespace option')
+        uri, tag = name[1:].rsplit('}', 1)
+        prefix = self.namespaces.get(uri)
+        if prefix is None:
+            prefix = _ElementTree._namespace_map.get(uri)
+            if prefix is None:
+                prefix = 'ns%d' % len(self.namespaces)
+            if prefix != 'xml':
+                self.namespaces[uri] = prefix
+        self.qnames[name] = ('%s:%s' % (prefix, tag) if prefix else tag)
+
+    def add_element(self, tag, attr_list):
+        self.add(tag)
+        for i in range(0, len(attr_list), 2):
+            if '}' in attr_list[i]:
+                self.add('{' + attr_list[i])
+
+    def start(self, tag, attr_list, is_root):
+        if not is_root:
+            link = self.match_link(tag, attr_list)
+            if link:
+                if link is not self.last_link:
+                    self.last_link = link
+                    self.last_link_attr_list = _get_link_attr_list(link)
+                self.add_element(_A_TAG, self.last_link_attr_list)
+        self.add_element(tag, attr_list)
+
+
+def _create_parser():
+    parser = expat.ParserCreate(namespace_separator='}')
+    # These are the same settings `ElementTree.XMLParser` uses.
+    parser.buffer_text = True
+    parser.ordered_attributes = True
+    parser.specified_attributes = True
+    return parser
+
+
+def _parse_stream(parser, stream):
+    while True:
+        data = stream.read(READ_CHUNK_SIZE)
+        if not data:
+            break
+        parser.Parse(data, False)
+    parser.Parse(b'', True)
+
+
+def _transform_root(tag, attr_list, root_transform):
+    root = ET.Element(tag, dict((_fixname(attr_list[i]), attr_list[i + 1]) for i in range(0, len(attr_list), 2)))
+    if root_transform:
+        root_transform(ET.ElementTree(root))
+    return root
+
+
+def _collect_namespaces(svg_stream, collectors, root_transform=None, minifier=None, element_transform=None):
+    depth = [0]
+    skip_depth = [0]  # Depth within an element left out by the minifier
+
+    def start(name, attr_list):
+        if skip_depth[0]:
+            skip_depth[0] += 1
+            return
+        tag = _fixname(name)
+        is_root = (not depth[0])
+        if minifier:
+            if not is_root and minifier.skip_element(tag):
+                skip_depth[0] = 1
+                return
+            attr_list = minifier.filter_attributes(attr_list)
+        if is_root:
+            attr_list = _to_attr_list(_transform_root(tag, attr_list, root_transform).items())
+        elif element_transform:
+            attr_list = element_transform(tag, attr_list)
+        for collector in collectors:
+            collector.start(tag, attr_list, is_root)
+        depth[0] += 1
+
+    def end(name):
+        if skip_depth[0]:
+            skip_depth[0] -= 1
+            return
+        depth[0] -= 1
+
+    parser = _create_parser()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    _parse_stream(parser, svg_stream)
+
+
+def collect_namespaces(
+    svg_stream,
+    id_to_url_map,
+    in_elements=VISIBLE_SVG_TAGS,
+    root_transform=None,
+    minifier=None,
+    element_transform=None
+):
+    """
+    Figure out the namespace prefixes the linkified version of the SVG stream will be serialized with.
+
+    :param svg_stream: The SVG stream to parse.
+    :param id_to_url_map: A mapping from element IDs to URLs (see `stream_wrap_elements_in_links`).
+    :param in_elements: Set of namespace-agnostic element names to consider.
+    :param root_transform: Root element transform (see `stream_wrap_elements_in_links`).
+    :param minifier: Optional minifier (see `stream_wrap_elements_in_links`).
+    :param element_transform: Optional element transform (see `stream_wrap_elements_in_links`).
+    :return: A mapping of qualified names to prefixed names, and a mapping of namespace URIs to prefixes.
+    :rtype: tuple[dict[str, str], dict[str, str]]
+    """
+    collector = _NamespaceCollector(match_link=_LinkMatcher(id_to_url_map, in_elements))
+    _collect_namespaces(
+        svg_stream,
+        [collector],
+        root_transform=root_transform,
+        minifier=minifier,
+        element_transform=element_transform,
+    )
+    return (collector.qnames, collector.namespaces)
+
+
+class _StreamingSerializer(object):
+    """
+    The Expat handler state machine for the streaming functions.
+
+    Elements are written out as soon as they start; the start tag is left open (`pending`),
+    since `ElementTree` writes childless, textless elements in the short `<foo />` form.
+
+    Subclasses decide which elements get wrapped (`start_wrap`) and how the wrapping is closed
+    (`end_wrap`); the tail text of a wrapped element is buffered and passed to `end_wrap`.
+
+    If a minifier (see `wagtail_svgmap.minify`) is set, the elements and attributes it doesn't want are
+    left out, and text is buffered until it's known whether it's insignificant whitespace.
+
+    If an element transform is set, it's called with the tag and attribute list of each non-root element
+    (that isn't left out), and it returns the attribute list to use.
+    """
+
+    def __init__(self, qnames, namespaces, root_transform, minifier=None, element_transform=None):
+        self.qnames = qnames
+        self.namespaces = namespaces
+        self.root_transform = root_transform
+        self.minifier = minifier
+        self.element_transform = element_transform
+        self.root = None
+        self.pieces = []
+        self.write = self.pieces.append
+        self.stack = []  # Stack of (prefixed tag name, wrap token, whether whitespace is significant) tuples
+        self.pending = False  # Whether the last start tag is still missing its `>`
+        self.tail = None  # List of text pieces following a wrapped element, if we're in one
+        self.tail_token = None
+        self.text = None  # List of text pieces that might be insignificant whitespace, if we're minifying
+        self.skip_depth = 0  # Depth within an element left out by the minifier
+
+    def start_wrap(self, tag, attr_list):  # pragma: no cover
+        """
+        Possibly write the start of a wrapper for the element that's about to start.
+
+        :return: A truthy token if the element is being wrapped.
+        """
+        return None
+
+    def end_wrap(self, token, tail):  # pragma: no cover
+        """
+        Write the end of a wrapper for an element (and the element's tail text).
+        """
+
+    def observe(self, tag, attr_list, is_root):
+        """
+        Observe an element that's about to be written (after all transforms).
+        """
+
+    def write_root_start(self, qname, attr_list):
+        self.write('<' + qname)
+        self.write(self.format_namespaces(self.namespaces))
+        self.write(_format_attributes(self.qnames, attr_list))
+
+    def format_namespaces(self, namespaces):
+        return ''.join(
+            ' xmlns%s="%s"' % ((':' + prefix if prefix else ''), _escape_attrib(uri))
+            for (uri, prefix)
+            in sorted(namespaces.items(), key=lambda x: x[1])
+        )
+
+    def after_end(self):
+        pass
+
+    def _flush_tail(self):
+        tail = ''.join(self.tail)
+        token = self.tail_token
+        self.tail = self.tail_token = None
+        if self.minifier and not self.stack[-1][2] and not tail.strip():
+            tail = ''
+        self.end_wrap(token, tail)
+
+    def _flush_text(self):
+        text = ''.join(self.text)
+        self.text = None
+        if text.strip():
+            self._write_text(text)
+
+    def _write_text(self, text):
+        if self.pending:
+            self.write('>')
+            self.pending = False
+        self.write(_escape_cdata(text))
+
+    def start(self, name, attr_list):
+        if self.skip_depth:
+            self.skip_depth += 1
+            return
+        tag = _fixname(name)
+        if self.minifier and self.stack and self.minifier.skip_element(tag):
+            # (Text around the left-out element is joined, as if the element had never been there.)
+            self.skip_depth = 1
+            return
+        if self.tail is not None:
+            self._flush_tail()
+        elif self.text is not None:
+            self._flush_text()
+        preserve_whitespace = True
+        if self.minifier:
+            attr_list = self.minifier.filter_attributes(attr_list)
+            preserve_whitespace = self.minifier.preserves_whitespace(
+                tag, attr_list, (self.stack[-1][2] if self.stack else False)
+            )
+        if self.pending:
+            self.write('>')
+        if not self.stack:  # The root element
+            self.root = _transform_root(tag, attr_list, self.root_transform)
+            attr_list = _to_attr_list(self.root.items())
+            self.observe(tag, attr_list, True)
+            qname = self.qnames[tag]
+            self.write_root_start(qname, attr_list)
+            self.stack.append((qname, None, preserve_whitespace))
+        else:
+            if self.element_transform:
+                attr_list = self.element_transform(tag, attr_list)
+            self.observe(tag, attr_list, False)
+            token = self.start_wrap(tag, attr_list)
+            qname = self.qnames[tag]
+            self.write('<%s%s' % (qname, _format_attributes(self.qnames, attr_list)))
+            self.stack.append((qname, token, preserve_whitespace))
+        self.pending = True
+
+    def end(self, name):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if self.tail is not None:
+            self._flush_tail()
+        elif self.text is not None:
+            self._flush_text()
+        qname, token, preserve_whitespace = self.stack.pop()
+        if self.pending:
+            self.write(' />')
+            self.pending = False
+        else:
+            self.write('</%s>' % qname)
+        if token:
+            self.tail = []
+            self.tail_token = token
+        self.after_end()
+
+    def data(self, text):
+        if self.skip_depth:
+            return
+        if self.tail is not None:
+            self.tail.append(text)
+        elif text and self.stack:
+            if self.text is not None:
+                self.text.append(text)
+            elif self.stack[-1][2]:
+                self._write_text(text)
+            else:
+                self.text = [text]
+
+    def parse(self, svg_stream):
+        parser = _create_parser()
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.data
+        _parse_stream(parser, svg_stream)
+
+
+class _StreamingLinkWrapper(_StreamingSerializer):
+    def __init__(self, out_stream, encoding, match_link, **kwargs):
+        super(_StreamingLinkWrapper, self).__init__(**kwargs)
+        self.out_stream = out_stream
+        self.encoding = encoding
+        self.match_link = match_link
+
+    def start_wrap(self, tag, attr_list):
+        link = self.match_link(tag, attr_list)
+        if link:
+            self.write('<%s%s>' % (self.qnames[_A_TAG], _format_attributes(self.qnames, _get_link_attr_list(link))))
+        return link
+
+    def end_wrap(self, token, tail):
+        # The tail of a wrapped element gets stripped, and it's written within the `<a>`.
+        tail = tail.strip()
+        if tail:
+            self.write(_escape_cdata(tail))
+        self.write('</%s>' % self.qnames[_A_TAG])
+
+    def after_end(self):
+        if len(self.pieces) >= WRITE_BUFFER_PIECES:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            self.out_stream.write(''.join(self.pieces).encode(self.encoding, 'xmlcharrefreplace'))
+            del self.pieces[:]
+
+
+def stream_wrap_elements_in_links(
+    svg_stream,
+    out_stream,
+    id_to_url_map,
+    in_elements=VISIBLE_SVG_TAGS,
+    encoding='UTF-8',
+    xml_declaration=True,
+    root_transform=None,
+    minifier=None,
+    element_transform=None
+):
+    """
+    Wrap elements in `<a>` elements according to `id_to_url_map`, streaming the serialized SVG into `out_stream`.
+
+    This is equivalent to `serialize_svg(wrap_elements_in_links(svg_stream, id_to_url_map))`,
+    but the document is never held in memory as a whole.
+
+    The input stream is read twice (first to figure out the namespaces used, then to actually wrap the elements),
+    so it must be seekable.
+
+    :param svg_stream: The SVG stream to parse.
+    :param out_stream: A binary file-like object to write the serialized SVG into.
+    :param id_to_url_map: A mapping from element IDs to URLs.
+                          Here `URL` may either be a string or a `Link` instance; using `Link`s
+                          makes it possible to set link `target`s among other things.
+    :param in_elements: Set of namespace-agnostic element names to consider.
+    :param encoding: The output encoding.
+    :type encoding: str
+    :param xml_declaration: Whether to emit the XML declaration tag or not
+    :type xml_declaration: bool
+    :param root_transform: Optional callable that is passed an `ElementTree` containing only the (childless)
+                           root element before it is written out. It may modify the root's attributes in-place;
+                           `fix_dimensions` is a good candidate.
+    :param minifier: Optional `wagtail_svgmap.minify.Minifier` to leave unnecessary bits of the SVG out with.
+    :param element_transform: Optional callable that is passed the qualified tag name and Expat-style
+                              attribute list of each non-root element, and returns the attribute list to use.
+                              It's called twice per element, since the stream is read twice.
+    :return: An `ElementTree` containing the childless root element, as written.
+    :rtype: xml.etree.ElementTree.ElementTree
+    """
+    start_position = svg_stream.tell()
+    qnames, namespaces = collect_namespaces(
+        svg_stream,
+        id_to_url_map,
+        in_elements=in_elements,
+        root_transform=root_transform,
+        minifier=minifier,
+        element_transform=element_transform,
+    )
+    svg_stream.seek(start_position)
+
+    wrapper = _StreamingLinkWrapper(
+        out_stream=out_stream,
+        encoding=encoding,
+        match_link=_LinkMatcher(id_to_url_map, in_elements),
+        qnames=qnames,
+        namespaces=namespaces,
+        root_transform=root_transform,
+        minifier=minifier,
+        element_transform=element_transform,
+    )
+    if xml_declaration:
+        wrapper.write("<?xml version='1.0' encoding='%s'?>\n" % encoding)
+    wrapper.parse(svg_stream)
+    wrapper.flush()
+    return ET.ElementTree(wrapper.root)
+
+
+def _iter_chunks(pieces, encoding, chunk_size):
+    """
+    Join string pieces into encoded chunks of about `chunk_size` characters.
+
+    :rtype: Iterator[bytes]
+    """
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode(encoding, 'xmlcharrefreplace')
+            del buffer[:]
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode(encoding, 'xmlcharrefreplace')
+
+
+class CompiledSVG(object):
+    """
+    A "compiled" SVG document: static markup chunks interspersed with link slots for elements with IDs.
+
+    Rendering a compiled SVG with a set of links is just a matter of joining strings -- no XML is parsed --
+    and the result is the same as that of `stream_wrap_elements_in_links(..., xml_declaration=False)`
+    (save for namespace prefixes in some documents; see `_TemplateCompiler.get_root_starts`).
+
+    The `parts` list consists of strings (static markup) and slots:
+    a 1-item list `[element_id]` marks the start of an element that might be wrapped in a link,
+    and a 2-item list `[element_id, tail]` its end (along with its raw tail text, since the tail of a
+    wrapped element is stripped).
+    """
+
+    version = 2
+
+    def __init__(self, root_tag, root_attrib, root_start, root_start_linked, namespaces, parts, options_key=''):
+        """
+        Construct a compiled SVG.
+
+        :param root_tag: The qualified tag name of the root element.
+        :param root_attrib: The attributes of the root element, as (key, value) pairs.
+        :param root_start: The start tag of the root element, when no links are rendered
+                           (or None if the document can't be rendered without links from the compiled form).
+        :param root_start_linked: The start tag of the root element, when links are rendered.
+        :param namespaces: Mapping of namespace URIs to prefixes, when links are rendered.
+        :param parts: List of static markup strings and slots.
+        :param options_key: A key identifying the options (e.g. minification) the SVG was compiled with, if any.
+        """
+        self.root_tag = root_tag
+        self.root_attrib = root_attrib
+        self.root_start = root_start
+        self.root_start_linked = root_start_linked
+        self.namespaces = namespaces
+        self.parts = parts
+        self.options_key = options_key
+
+    def get_root(self):
+        """
+        Get an `ElementTree` containing the childless root element (e.g. for `get_dimensions`).
+
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        return ET.ElementTree(ET.Element(self.root_tag, dict(self.root_attrib)))
+
+    def _format_link(self, link):
+        attr_list = _get_link_attr_list(link)
+        qnames = {}
+        for i in range(0, len(attr_list), 2):
+            if '}' in attr_list[i]:
+                uri, local = attr_list[i].rsplit('}', 1)
+                if uri not in self.namespaces:  # Can't declare new namespaces at this point
+                    return None
+                prefix = self.namespaces[uri]
+                qnames['{' + attr_list[i]] = ('%s:%s' % (prefix, local) if prefix else local)
+        return '<a%s>' % _format_attributes(qnames, attr_list)
+
+    def _get_starts(self, id_to_url_map):
+        """
+        Format the link start tags for the elements of the document that are linked.
+
+        :return: Mapping of element IDs to link start tags (or None), or None if a link can't be rendered
+                 (or the document can't be rendered without links; see `_TemplateCompiler.get_root_starts`).
+        :rtype: dict[str, str|None]|None
+        """
+        starts = {}
+        for part in self.parts:
+            if isinstance(part, six.string_types) or len(part) != 1 or part[0] in starts:
+                continue
+            link = _get_link(id_to_url_map, part[0])
+            start = starts[part[0]] = (self._format_link(link) if link else None)
+            if link and start is None:
+                return None
+        if self.root_start is None and not any(starts.values()):
+            return None
+        return starts
+
+    def _iter_pieces(self, starts):
+        yield (self.root_start_linked if any(starts.values()) else self.root_start)
+        for part in self.parts:
+            if isinstance(part, six.string_types):
+                yield part
+                continue
+            start = starts[part[0]]
+            if len(part) == 1:  # Start slot
+                if start:
+                    yield start
+            else:  # End slot
+                tail = part[1]
+                if start:  # Just like in `wrap_elements_in_links`, the tail gets stripped
+                    yield _escape_cdata(tail.strip()) + '</a>'
+                elif tail:
+                    yield _escape_cdata(tail)
+
+    def render(self, id_to_url_map):
+        """
+        Render the compiled SVG with the given links.
+
+        :param id_to_url_map: A mapping from element IDs to URLs (see `stream_wrap_elements_in_links`).
+        :return: The serialized SVG, or None if one of the links can't be rendered from the compiled form.
+        :rtype: str|None
+        """
+        starts = self._get_starts(id_to_url_map)
+        if starts is None:
+            return None
+        return ''.join(self._iter_pieces(starts))
+
+    def iter_render(self, id_to_url_map, encoding='UTF-8', chunk_size=READ_CHUNK_SIZE):
+        """
+        Render the compiled SVG with the given links, as chunks of encoded bytes.
+
+        The rendered document is never held in memory as a whole.
+
+        :param id_to_url_map: A mapping from element IDs to URLs (see `stream_wrap_elements_in_links`).
+        :param encoding: The output encoding.
+        :param chunk_size: The approximate size (in characters) of the chunks.
+        :return: Iterator of byte strings, or None if one of the links can't be rendered from the compiled form.
+        :rtype: Iterator[bytes]|None
+        """
+        starts = self._get_starts(id_to_url_map)
+        if starts is None:
+            return None
+        return _iter_chunks(self._iter_pieces(starts), encoding, chunk_size)
+
+    def to_json(self):
+        """
+        Serialize the compiled SVG as JSON.
+
+        :rtype: str
+        """
+        return json.dumps({
+            'version': self.version,
+            'root_tag': self.root_tag,
+            'root_attrib': self.root_attrib,
+            'root_start': self.root_start,
+            'root_start_linked': self.root_start_linked,
+            'namespaces': self.namespaces,
+            'parts': self.parts,
+            'options_key': self.options_key,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Deserialize a compiled SVG from JSON.
+
+        :param data: JSON string, as generated by `to_json`.
+        :return: Compiled SVG, or None if the data is in an older format (and the SVG should be recompiled).
+        :rtype: CompiledSVG|None
+        """
+        data = json.loads(data)
+        if not data or data.get('version') != cls.version:
+            return None
+        return cls(
+            root_tag=data['root_tag'],
+            root_attrib=[tuple(kv) for kv in data['root_attrib']],
+            root_start=data['root_start'],
+            root_start_linked=data['root_start_linked'],
+            namespaces=data['namespaces'],
+            parts=data['parts'],
+            options_key=data.get('options_key', ''),
+        )
+
+
+class _TemplateCompiler(_StreamingSerializer):
+    """
+    Compiles a `CompiledSVG` in a single pass.
+
+    Since the root start tag is stored separately in a compiled SVG, it can be formatted after the whole
+    document has been seen, so the namespace prefixes are collected as the document is compiled.
+    """
+
+    def __init__(self, match_element, plain_collector, linked_collector, **kwargs):
+        super(_TemplateCompiler, self).__init__(
+            qnames=linked_collector.qnames,
+            namespaces=linked_collector.namespaces,
+            **kwargs
+        )
+        self.match_element = match_element
+        self.plain_collector = plain_collector
+        self.linked_collector = linked_collector
+        self.root_qname = None
+        self.root_attr_list = None
+        self.parts = []
+
+    def cut(self):
+        if self.pieces:
+            self.parts.append(''.join(self.pieces))
+            del self.pieces[:]
+
+    def observe(self, tag, attr_list, is_root):
+        self.plain_collector.start(tag, attr_list, is_root)
+        self.linked_collector.start(tag, attr_list, is_root)
+
+    def write_root_start(self, qname, attr_list):
+        # The namespaces aren't known yet; see `get_root_starts`.
+        self.root_qname = qname
+        self.root_attr_list = attr_list
+
+    def get_root_starts(self):
+        """
+        Format the root start tag, both without and with links.
+
+        :return: The start tags; the one without links is None if it can't be rendered from the compiled form.
+        :rtype: tuple[str|None, str]
+        """
+        plain_namespaces = self.plain_collector.namespaces
+        linked_namespaces = self.linked_collector.namespaces
+        if (
+            any(linked_namespaces.get(uri) != prefix for (uri, prefix) in plain_namespaces.items()) or
+            set(linked_namespaces) - set(plain_namespaces) - {XLINK_NAMESPACE}
+        ):
+            # Linking elements would shift the generated (`ns0`...) prefixes of namespaces that are first
+            # used after the linked elements, so the exact prefixes would depend on which elements are linked.
+            # The parts are formatted with the prefixes as if all elements were linked; that output is
+            # equivalent, but without any links, it would differ from that of `stream_wrap_elements_in_links`
+            # (and `serialize_svg`) in more than the prefixes (e.g. an unused `xlink` namespace declaration),
+            # so the no-link case isn't rendered from the compiled form at all.
+            plain_namespaces = None
+        attributes = _format_attributes(self.qnames, self.root_attr_list)
+        return tuple(
+            ('<%s%s%s' % (self.root_qname, self.format_namespaces(namespaces), attributes) if namespaces else None)
+            for namespaces in (plain_namespaces, linked_namespaces)
+        )
+
+    def start_wrap(self, tag, attr_list):
+        element_id = self.match_element(tag, attr_list)
+        if element_id is not None:
+            self.cut()
+            self.parts.append([element_id])
+            return [element_id]
+        return None
+
+    def end_wrap(self, token, tail):
+        self.cut()
+        self.parts.append([token[0], tail])
+
+
+def compile_svg(
+    svg_stream,
+    in_elements=VISIBLE_SVG_TAGS,
+    root_transform=None,
+    minifier=None,
+    element_transform=None,
+    options_key=None
+):
+    """
+    Compile an SVG stream into a `CompiledSVG` that can be quickly rendered with different sets of links.
+
+    The stream is read only once.
+
+    :param svg_stream: The SVG stream to parse.
+    :param in_elements: Set of namespace-agnostic element names to consider.
+    :param root_transform: Root element transform (see `stream_wrap_elements_in_links`).
+    :param minifier: Optional minifier (see `stream_wrap_elements_in_links`).
+    :param element_transform: Optional element transform (see `stream_wrap_elements_in_links`).
+    :param options_key: A key identifying the compilation options, for the `CompiledSVG`;
+                        by default, the key of the minifier (if any).
+    :return: The compiled SVG.
+    :rtype: CompiledSVG
+    """
+    match_element = _ElementMatcher(in_elements)
+    dummy_link = Link('#')
+    compiler = _TemplateCompiler(
+        match_element=match_element,
+        plain_collector=_NamespaceCollector(match_link=lambda tag, attr_list: None),
+        linked_collector=_NamespaceCollector(
+            match_link=lambda tag, attr_list: (dummy_link if match_element(tag, attr_list) is not None else None),
+        ),
+        root_transform=root_transform,
+        minifier=minifier,
+        element_transform=element_transform,
+    )
+    compiler.parse(svg_stream)
+    compiler.cut()
+    root_start, root_start_linked = compiler.get_root_starts()
+    if options_key is None:
+        options_key = (minifier.key if minifier else '')
+    return CompiledSVG(
+        root_tag=compiler.root.tag,
+        root_attrib=list(compiler.root.items()),
+        root_start=root_start,
+        root_start_linked=root_start_linked,
+        namespaces=compiler.namespaces,
+        parts=compiler.parts,
+        options_key=options_key,
+    )
@@ -1,11 +1,11 @@
+import codecs
+import mmap
 import re
+import tempfile
 
 from six import BytesIO
 
-try:  # pragma: no cover
-    from xml.etree import cElementTree as ET
-except ImportError:  # pragma: no cover
-    from xml.etree import ElementTree as ET
+from wagtail_svgmap.xml_backends import ET, get_backend, get_tree_backend
 
 SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
 XLINK_NAMESPACE = 'http://www.w3.org/1999/xlink'
@@ -13,6 +13,12 @@ XLINK_NAMESPACE = 'http://www.w3.org/1999/xlink'
 ET.register_namespace('svg', SVG_NAMESPACE)
 ET.register_namespace('xlink', XLINK_NAMESPACE)
 
+#: Size of the chunks yielded by `iter_serialize_svg`.
+SERIALIZE_CHUNK_SIZE = 64 * 1024
+
+#: Serialized documents larger than this are spooled to disk by `iter_serialize_svg`.
+SERIALIZE_SPOOL_SIZE = 1024 * 1024
+
 VISIBLE_SVG_TAGS = frozenset({
     # See https://developer.mozilla.org/en-US/docs/Web/SVG/Element
     'a',
@@ -34,22 +40,176 @@ VISIBLE_SVG_TAGS = frozenset({
 })
 
 
+# A scanner for the bits of XML that `find_ids` needs to care about (start tags, along with their `id` attribute),
+# as well as the bits that could contain things that look like start tags (comments and processing instructions).
+# Start tags the scanner can't make sense of are matched by the last alternative.
+_TAG_SCAN_RE = re.compile(br"""
+    <!--.*?-->
+    |
+    <\?.*?\?>
+    |
+    <(?:[A-Za-z_][\w.\-]*:)?([A-Za-z_][\w.\-]*)
+    (?:\s+(?:
+        id\s*=\s*(?:"([^"]*)"|'([^']*)')
+        |
+        [A-Za-z_][\w.:\-]*\s*=\s*(?:"[^"]*"|'[^']*')
+    ))*
+    \s*/?>
+    |
+    (<[A-Za-z_])
+""", re.DOTALL | re.VERBOSE)
+
+# Constructs that the scanner can't deal with: CDATA sections (which could contain markup-like text) and
+# document type declarations with internal subsets (which could declare entities and default attributes).
+_UNSCANNABLE_RE = re.compile(br'<!\[CDATA\[|<!DOCTYPE[^>\[]*\[')
+
+# The encoding declaration of the XML declaration, if any.
+_ENCODING_DECLARATION_RE = re.compile(br"""^<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._\-]+)["']""")
+
+# Characters that would require entity expansion or whitespace normalization in attribute values.
+_UNSCANNABLE_VALUE_RE = re.compile(br'[&\t\r\n]')
+
+
+class _Unscannable(Exception):
+    pass
+
+
+def _scan_elements(data, in_elements=VISIBLE_SVG_TAGS, start=0):
+    """
+    Scan SVG data for elements with IDs without actually parsing the XML.
+
+    :param data: The SVG data (bytes or a buffer like an mmap).
+    :param in_elements: Set of namespace-agnostic element names to consider.
+    :param start: The offset the SVG document starts at in `data`.
+    :return: List of (ID, namespace-agnostic tag name) tuples (in document order).
+    :raises _Unscannable: if the data contains constructs the scanner can't deal with.
+    :rtype: list[tuple[str, str]]
+    """
+    head = data[start:start + 1024]
+    if head.startswith((b'\xfe\xff', b'\xff\xfe', b'\x00')):  # UTF-16 or UTF-32
+        raise _Unscannable('unsupported encoding')
+    encoding_match = _ENCODING_DECLARATION_RE.match(head.lstrip(b'\xef\xbb\xbf'))
+    if encoding_match and encoding_match.group(1).lower() not in (b'utf-8', b'utf8', b'us-ascii', b'ascii'):
+        raise _Unscannable('unsupported encoding')
+    if _UNSCANNABLE_RE.search(data, start):
+        raise _Unscannable('unsupported constructs')
+
+    if in_elements:
+        in_elements = {name.encode('ascii') for name in in_elements}
+    elements = []
+    for tag, double_quoted_id, single_quoted_id, unscannable in _TAG_SCAN_RE.findall(data, start):
+        if unscannable:
+            raise _Unscannable('unsupported start tag')
+        if in_elements and tag not in in_elements:
+            continue
+        id = (double_quoted_id or single_quoted_id)
+        if id:
+            if _UNSCANNABLE_VALUE_RE.search(id):
+                raise _Unscannable('ID requires normalization')
+            elements.append((id.decode('utf-8'), tag.decode('ascii')))
+    return elements
+
+
+def _scan_ids(data, in_elements=VISIBLE_SVG_TAGS, start=0):
+    """
+    Scan SVG data for element IDs without actually parsing the XML (see `_scan_elements`).
+
+    :return: List of IDs (in document order).
+    :raises _Unscannable: if the data contains constructs the scanner can't deal with.
+    :rtype: list[str]
+    """
+    return [element_id for (element_id, tag) in _scan_elements(data, in_elements=in_elements, start=start)]
+
+
+def _scan_elements_from_file(svg_stream, in_elements=VISIBLE_SVG_TAGS):
+    """
+    Scan a stream backed by a local file for elements with IDs (see `_scan_elements`), via `mmap`.
+
+    :return: List of (ID, tag name) tuples, or None if the stream couldn't be scanned.
+    :rtype: list[tuple[str, str]]|None
+    """
+    try:
+        fileno = svg_stream.fileno()
+        start = svg_stream.tell()
+        data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):  # Not a local file (or an empty one)
+        return None
+    try:
+        return _scan_elements(data, in_elements=in_elements, start=start)
+    except _Unscannable:
+        return None
+    finally:
+        data.close()
+
+
+def _iterparse_elements(svg_stream, in_elements=VISIBLE_SVG_TAGS):
+    """
+    Find elements with IDs in a stream of SVG data by actually parsing it.
+
+    :return: Iterator of (ID, namespace-agnostic tag name) tuples, in document order; uniqueness not guaranteed.
+    :rtype: Iterator[tuple[str, str]]
+    """
+    local_names = {}
+    stack = []
+    for event, elem in get_backend().iterparse(svg_stream, events=('start', 'end')):
+        if event == 'end':
+            stack.pop()
+            if stack:
+                # Drop the finished children of the parent element, so the tree never grows;
+                # only the elements' own attributes are of interest here.
+                del stack[-1][:]
+            continue
+        stack.append(elem)
+        local_name = local_names.get(elem.tag)
+        if local_name is None:
+            local_name = elem.tag.split('}')[-1]
+            local_name = local_names[elem.tag] = (local_name if not in_elements or local_name in in_elements else '')
+        if not local_name:
+            continue
+        id = elem.get('id')
+        if id:
+            yield (id, local_name)
+
+
+def _iterparse_ids(svg_stream, in_elements=VISIBLE_SVG_TAGS):
+    """
+    Find element IDs in a stream of SVG data by actually parsing it.
+
+    :return: Iterator of ids; uniqueness not guaranteed.
+    :rtype: Iterator[str]
+    """
+    return (element_id for (element_id, tag) in _iterparse_elements(svg_stream, in_elements=in_elements))
+
+
+def find_elements(svg_stream, in_elements=VISIBLE_SVG_TAGS):
+    """
+    Find elements with IDs in a stream (file-like) of SVG data.
+
+    Streams backed by local files are quickly scanned without a full XML parse, where possible.
+
+    :param svg_stream: The SVG stream to parse.
+    :param in_elements: Set of namespace-agnostic element names to consider.
+    :return: Iterator of (ID, namespace-agnostic tag name) tuples, in document order; uniqueness not guaranteed.
+    :rtype: Iterator[tuple[str, str]]
+    """
+    elements = _scan_elements_from_file(svg_stream, in_elements=in_elements)
+    if elements is not None:
+        return iter(elements)
+    return _iterparse_elements(svg_stream, in_elements=in_elements)
+
+
 def find_ids(svg_stream, in_elements=VISIBLE_SVG_TAGS):
     """
     Find element IDs in a stream (file-like) of SVG data.
 
+    Streams backed by local files are quickly scanned for IDs without a full XML parse, where possible.
+
     :param svg_stream: The SVG stream to parse.
     :param in_elements: Set of namespace-agnostic element names to consider.
     :return: Iterator of ids; uniqueness not guaranteed.
     :rtype: Iterator[str]
     """
-    for event, elem in ET.iterparse(svg_stream, events=('end',)):
-        tag_without_ns = elem.tag.split('}')[-1]
-        if in_elements and tag_without_ns not in in_elements:
-            continue
-        id = elem.get('id')
-        if id:  # pragma: no branch
-            yield id
+    return (element_id for (element_id, tag) in find_elements(svg_stream, in_elements=in_elements))
 
 
 class Link(object):
@@ -69,13 +229,15 @@ class Link(object):
         self.url = str(url)
         self.target = target
 
-    def get_element(self):
+    def get_element(self, backend=None):
         """
         Render the link as an SVG `<a>` element.
 
+        :param backend: The XML backend to create the element with; defaults to the configured one.
+        :type backend: wagtail_svgmap.xml_backends.ElementTreeBackend|None
         :rtype: xml.etree.ElementTree.Element
         """
-        return ET.Element(
+        return (backend or get_backend()).Element(
             '{%s}a' % SVG_NAMESPACE,
             dict(kv for kv in self.get_element_attribs().items() if kv[0] and kv[1])
         )
@@ -95,12 +257,35 @@ class Link(object):
         }
 
 
+def _find_link(tag, element_id, id_to_url_map, in_elements):
+    """
+    Figure out the link an element should be wrapped in, if any.
+
+    :return: The `Link` to wrap the element in, or None.
+    :rtype: Link|None
+    """
+    tag_without_ns = tag.split('}')[-1]
+    if in_elements and tag_without_ns not in in_elements:
+        return None
+    return _get_link(id_to_url_map, element_id)
+
+
+def _get_link(id_to_url_map, element_id):
+    url = id_to_url_map.get(element_id)
+    if not url:
+        return None
+    if isinstance(url, str):
+        url = Link(url)
+    return url
+
+
 def wrap_elements_in_links(tree, id_to_url_map, in_elements=VISIBLE_SVG_TAGS):
     """
     Wrap elements in `<a>` elements in the tree according to the given `id_to_url_map`.
 
-    :param tree: The tree to process. May be an `ElementTree` object, or a filename, or a SVG stream.
+    :param tree: The tree to process. May be an `ElementTree` (or `lxml`) object, or a filename, or a SVG stream.
                  If a tree is passed in, it will be modified in-place.
+                 Filenames and streams are parsed with the configured XML backend.
     :type tree: xml.etree.ElementTree.ElementTree|str|file
     :param id_to_url_map: A mapping from element IDs to URLs.
                           Here `URL` may either be a string or a `Link` instance; using `Link`s
@@ -110,41 +295,27 @@ def wrap_elements_in_links(tree, id_to_url_map, in_elements=VISIBLE_SVG_TAGS):
     :rtype: xml.etree.ElementTree.ElementTree
     """
     if isinstance(tree, str) or hasattr(tree, 'read'):  # pragma: no branch
-        tree = ET.parse(tree)
-    # h/t http://stackoverflow.com/a/20132342/51685
-    parent_map = {child: parent for parent in tree.iter() for child in parent}
-
-    # First, find the elements that we are interested in wrapping:
-    element_to_url = {}
-    for elem in parent_map.keys():
-        tag_without_ns = elem.tag.split('}')[-1]
-        if in_elements and tag_without_ns not in in_elements:
-            continue
-        url = id_to_url_map.get(elem.get('id'))
-        if not url:
-            continue
+        backend = get_backend()
+        tree = backend.parse(tree)
+    else:
+        backend = get_tree_backend(tree)
 
-        if isinstance(url, str):
-            url = Link(url)
-        element_to_url[elem] = url
+    # First, find the elements that we are interested in wrapping, along with their parents and positions.
+    # (The positions are gathered here so there's no need to look them up in the parent later.)
+    to_wrap = []
+    for parent in tree.iter():
+        for index, elem in enumerate(parent):
+            url = _find_link(elem.tag, elem.get('id'), id_to_url_map, in_elements)
+            if url:
+                to_wrap.append((parent, index, elem, url))
 
     # Then wrap them!
 
-    for elem, url in element_to_url.items():
-        a_element = url.get_element()
-        parent = parent_map[elem]
-
-        # Find the original insertion position
-        for index, test_element in enumerate(parent):
-            if elem is test_element:
-                break
-        else:  # pragma: no cover
-            raise ValueError("tree broken")
-        parent.remove(elem)  # Remove the unwrapped node from the parent
-        a_element.append(elem)  # Wrap the node in the A element
-        elem.tail = (elem.tail or '').strip()  # Remove any trailing spaces from the wrapped element
-        parent.insert(index, a_element)  # Replace the wrapped node into the parent
-        parent_map[elem] = a_element  # Update the parent map
+    for parent, index, elem, url in to_wrap:
+        a_element = url.get_element(backend=backend)
+        tail = elem.tail  # (Replacing an element drops its tail in some backends, so keep it here.)
+        backend.wrap(parent, index, elem, a_element)  # Replace the node with the A element, and wrap it in that
+        elem.tail = (tail or '').strip()  # Remove any trailing spaces from the wrapped element
     return tree
 
 
@@ -165,6 +336,55 @@ def fixup_unqualified_attributes(tree, namespace):
     return tree
 
 
+def write_svg(tree, out_stream, encoding='UTF-8', xml_declaration=True):
+    """
+    Serialize an ElementTree as SVG straight into a binary stream (a file, an `HttpResponse`, ...).
+
+    :param tree: The tree to process.
+    :type tree: xml.etree.ElementTree.ElementTree
+    :param out_stream: A binary file-like object to write the serialized SVG into.
+    :param encoding: The output encoding.
+    :type encoding: str
+    :param xml_declaration: Whether to emit the XML declaration tag or not
+    :type xml_declaration: bool
+    """
+    fixup_unqualified_attributes(tree, namespace=SVG_NAMESPACE)
+    get_tree_backend(tree).write(
+        tree,
+        out_stream,
+        encoding=encoding,
+        xml_declaration=xml_declaration,
+        default_namespace=SVG_NAMESPACE,
+    )
+
+
+def iter_serialize_svg(tree, encoding='UTF-8', xml_declaration=True, chunk_size=SERIALIZE_CHUNK_SIZE):
+    """
+    Serialize an ElementTree as SVG, as chunks of encoded bytes (e.g. for a `StreamingHttpResponse`).
+
+    Large documents are spooled to a temporary file, so the serialized document is never held in memory as a whole.
+
+    :param tree: The tree to process.
+    :type tree: xml.etree.ElementTree.ElementTree
+    :param encoding: The output encoding.
+    :type encoding: str
+    :param xml_declaration: Whether to emit the XML declaration tag or not
+    :type xml_declaration: bool
+    :param chunk_size: The (maximum) size of the chunks.
+    :type chunk_size: int
+    :return: Iterator of byte strings
+    :rtype: Iterator[bytes]
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SERIALIZE_SPOOL_SIZE) as spool:
+        write_svg(tree, spool, encoding=encoding, xml_declaration=xml_declaration)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
 def serialize_svg(tree, encoding='UTF-8', xml_declaration=True):
     """
     Serialize an ElementTree as SVG.
@@ -177,9 +397,24 @@ def serialize_svg(tree, encoding='UTF-8', xml_declaration=True):
     :rtype: str
     """
     bio = BytesIO()
-    fixup_unqualified_attributes(tree, namespace=SVG_NAMESPACE)
-    tree.write(bio, encoding=encoding, xml_declaration=xml_declaration, default_namespace=SVG_NAMESPACE)
-    return bio.getvalue().decode(encoding)
+    write_svg(tree, bio, encoding=encoding, xml_declaration=xml_declaration)
+    return decode_buffer(bio, encoding)
+
+
+def decode_buffer(bio, encoding='UTF-8'):
+    """
+    Decode the contents of a `BytesIO` without copying them into an intermediate byte string first.
+
+    :type bio: io.BytesIO
+    :rtype: str
+    """
+    if hasattr(bio, 'getbuffer'):  # pragma: no branch
+        buffer = bio.getbuffer()
+        try:
+            return codecs.decode(buffer, encoding)
+        finally:
+            buffer.release()
+    return bio.getvalue().decode(encoding)  # pragma: no cover
 
 
 def fix_dimensions(tree):
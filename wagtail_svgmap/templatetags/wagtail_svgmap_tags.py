@@ -0,0 +1,60 @@
+from __future__ import absolute_import, unicode_literals
+
+from django import template
+
+from wagtail_svgmap.blocks import ImageMapBlock
+from wagtail_svgmap.models import ImageMap
+
+register = template.Library()
+
+#: The `ImageMapBlock` attributes that can be overridden with the options of the `svgmap` tag.
+BLOCK_OPTIONS = ('ie_compatibility', 'inline', 'lazy', 'lazy_margin', 'fragment_cache')
+
+_blocks = {}
+
+
+def get_block(**options):
+    """
+    Get an `ImageMapBlock` with some of its attributes overridden.
+
+    :param options: Values for the attributes named in `BLOCK_OPTIONS`.
+    :rtype: ImageMapBlock
+    """
+    for name in options:
+        if name not in BLOCK_OPTIONS:
+            raise template.TemplateSyntaxError(
+                'Unknown svgmap option %r (valid options: %s)' % (name, ', '.join(BLOCK_OPTIONS))
+            )
+    key = tuple(sorted(options.items()))
+    block = _blocks.get(key)
+    if block is None:
+        block = ImageMapBlock()
+        for name, value in options.items():
+            setattr(block, name, value)
+        _blocks[key] = block
+    return block
+
+
+@register.simple_tag(takes_context=True)
+def svgmap(context, image_map, css_class='', **options):
+    """
+    Render an image map just like an `ImageMapBlock` would (fragment caching and all), outside of StreamFields.
+
+    Usage: `{% load wagtail_svgmap_tags %}{% svgmap page.image_map css_class="map" lazy=True %}`
+
+    :param image_map: The image map, or its ID.
+    :type image_map: ImageMap|int|str|None
+    :param css_class: The CSS class of the container.
+    :type css_class: str
+    :param options: Overrides for the block options (see `BLOCK_OPTIONS`).
+    :return: HTML markup (empty if there's no such image map)
+    :rtype: str
+    """
+    block = get_block(**options)
+    if image_map and not isinstance(image_map, ImageMap):
+        image_map = block.child_blocks['map'].to_python(image_map)
+    if not image_map:
+        return ''
+    value = block.to_python({'map': None, 'css_class': css_class})  # (Not querying for the map.)
+    value['map'] = image_map
+    return block.render(value, context=context)
@@ -11,10 +11,29 @@ except ImportError:
     from wagtail.wagtailcore.models import Collection, Page, Site
     from wagtail.wagtaildocs.models import Document
 
+from wagtail_svgmap import recache, render_cache
 from wagtail_svgmap.models import ImageMap
 from wagtail_svgmap.tests.utils import EXAMPLE_SVG_DATA
 
 
+@pytest.fixture(autouse=True)
+def clear_pending_recaches():
+    """
+    Forget about image maps left dirty by a test; the test transaction is rolled back, so they're gone anyway.
+    """
+    yield
+    recache._get_pending().clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_render_caches():
+    """
+    Forget the render caches of a test, as the IDs of its objects are reused by later tests.
+    """
+    yield
+    render_cache._render_cache_cache.clear()
+
+
 @pytest.fixture()
 def root_page():
     """
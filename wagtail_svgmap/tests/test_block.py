@@ -1,15 +1,21 @@
 import json
 
 import pytest
+from django.test import RequestFactory
 from django.utils.encoding import force_text
+from django.utils.html import escapejs
 
 try:
     from wagtail.core.fields import StreamField
+    from wagtail.core.models import Page, Site
 except ImportError:
     from wagtail.wagtailcore.fields import StreamField
+    from wagtail.wagtailcore.models import Page, Site
 
 from wagtail_svgmap.blocks import ImageMapBlock
 from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.render_cache import get_render_cache
+from wagtail_svgmap.tests.utils import commit
 
 stream_field = StreamField([
     ('imagemap', ImageMapBlock()),
@@ -28,3 +34,117 @@ def test_imagemap_block(example_svg_upload):
     assert 'huijui' in stream_content
     assert '/foobar' in stream_content
     assert 'green' in stream_content
+
+
+@pytest.mark.django_db
+def test_imagemap_block_site_variant(root_page, example_imagemap):
+    page = root_page.add_child(instance=Page(title='nnep', slug='nnep'))
+    site = Site.objects.get()
+    Site.objects.create(hostname='other.example.com', root_page=page)
+    example_imagemap.regions.create(element_id='green', link_page=root_page)
+    commit()
+    block = ImageMapBlock()
+    value = block.to_python({'map': example_imagemap.pk, 'css_class': ''})
+    assert 'href="http://' in block.render(value)
+    request = RequestFactory().get('/')
+    request.site = site
+    assert 'href="/"' in block.render(value, context={'request': request})
+
+
+@pytest.mark.django_db
+def test_imagemap_blocks_loaded_in_bulk(example_svg_upload, django_assert_num_queries):
+    maps = [ImageMap.objects.create(title=str(i), svg=example_svg_upload) for i in range(3)]
+    blocks = [{'map': map.pk, 'css_class': str(i)} for (i, map) in enumerate(maps)]
+    blocks.insert(1, {'map': 1000, 'css_class': 'missing'})
+    blocks.append({'map': str(maps[0].pk), 'css_class': 'again'})
+    blocks.append({'css_class': 'none'})
+    stream_value = stream_field.to_python(json.dumps([{'type': 'imagemap', 'value': value} for value in blocks]))
+    with django_assert_num_queries(1):  # (Rendering needs the rendered SVG, which is loaded along with the maps.)
+        values = [child.value for child in stream_value]
+        assert [value['map'] for value in values] == [maps[0], None, maps[1], maps[2], maps[0], None]
+        assert [value['css_class'] for value in values] == ['0', 'missing', '1', '2', 'again', 'none']
+        assert [value['map'].size for value in values if value['map']]
+        assert 'again' in force_text(stream_value)
+
+
+@pytest.mark.django_db
+def test_repeated_imagemap_blocks(rf, example_imagemap):
+    block = ImageMapBlock()
+    context = {'request': rf.get('/')}
+    htmls = [
+        block.render(block.to_python({'map': example_imagemap.pk, 'css_class': str(i)}), context=context)
+        for i in range(3)
+    ]
+    assert htmls[0].count('<svg id="image-map-%s-svg"' % example_imagemap.pk) == 1
+    for i, html in enumerate(htmls[1:], 2):
+        assert 'id="image-map-%s-%d"' % (example_imagemap.pk, i) in html
+        assert '<use xlink:href="#image-map-%s-svg"' % example_imagemap.pk in html
+        assert 'green' not in html  # Not repeating the markup
+    assert ''.join(htmls).count('<style>') == 1
+    # The style is scoped to the containers of the maps (whatever their IDs), not to all elements with similar IDs
+    for i, html in enumerate(htmls):
+        assert 'class="wagtail-svgmap %d"' % i in html
+    assert '<style>.wagtail-svgmap svg{' in htmls[0]
+
+
+@pytest.mark.django_db
+def test_imagemap_block_container_class(rf, example_imagemap):
+    class CustomImageMapBlock(ImageMapBlock):
+        container_class = 'map-container'
+
+        def get_container_id(self, value):
+            return 'map-%s' % value['map'].pk
+
+    block = CustomImageMapBlock()
+    value = block.to_python({'map': example_imagemap.pk, 'css_class': ''})
+    html = block.render(value, context={'request': rf.get('/')})
+    assert 'id="map-%s"' % example_imagemap.pk in html
+    assert 'class="map-container"' in html
+    assert '<style>.map-container svg{' in html
+
+
+@pytest.mark.django_db
+def test_lazy_imagemap_blocks(rf, example_imagemap):
+    class LazyImageMapBlock(ImageMapBlock):
+        lazy = True
+
+    block = LazyImageMapBlock()
+    context = {'request': rf.get('/')}
+    htmls = [
+        block.render(block.to_python({'map': example_imagemap.pk, 'css_class': ''}), context=context)
+        for i in range(2)
+    ]
+    for html in htmls:
+        assert 'data-svgmap-src="%s"' % example_imagemap.svg_url in html
+        assert 'padding-top:100.0%' in html  # The aspect ratio is kept while loading
+        assert '<svg' not in html
+    assert htmls[0].count('IntersectionObserver') and not htmls[1].count('IntersectionObserver')
+    assert 'wagtailSvgmapLoad("%s")' % escapejs('image-map-%s-2' % example_imagemap.pk) in htmls[1]
+
+
+@pytest.mark.django_db
+def test_imagemap_block_fragment_cache(rf, example_imagemap, django_assert_num_queries):
+    block = ImageMapBlock()
+    value = block.to_python({'map': example_imagemap.pk, 'css_class': 'huijui'})
+    html = block.render(value)
+    render_cache = get_render_cache()
+    render_cache.reset_stats()
+    with django_assert_num_queries(0):
+        assert block.render(value) == html
+    assert render_cache.stats == {'local_hits': 1, 'shared_hits': 0, 'misses': 0}
+    # The page render state is a part of the key
+    context = {'request': rf.get('/')}
+    htmls = [block.render(value, context=context) for i in range(2)]
+    assert htmls[0] != html and '<use' in htmls[1]
+    context = {'request': rf.get('/')}
+    assert [block.render(value, context=context) for i in range(2)] == htmls
+    # So are the block values and options
+    assert 'huijui' not in block.render(block.to_python({'map': example_imagemap.pk, 'css_class': 'other'}))
+    object_block = ImageMapBlock()
+    object_block.inline = False
+    assert '<object' in object_block.render(value)
+    # Rerendering the map changes its digest, so the old fragments aren't served
+    example_imagemap.regions.create(element_id='green', link_external='/foobar')
+    commit()
+    value['map'] = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert '/foobar' in block.render(value)
@@ -0,0 +1,76 @@
+import datetime
+import multiprocessing
+
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from wagtail_svgmap.management.commands.svgmap_recache import _init_worker, _recache_chunk, parse_since
+from wagtail_svgmap.models import ImageMap
+
+
+def recache(*args, **options):
+    stdout = StringIO()
+    call_command('svgmap_recache', *args, processes=1, stdout=stdout, **options)
+    return stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_svgmap_recache(example_imagemap):
+    ImageMap.objects.filter(pk=example_imagemap.pk).update(_render_digest='', _svg_digest='')
+    assert '1/1 image maps processed (1 changed, 0 failed)' in recache()
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.rendered_svg_digest == example_imagemap.rendered_svg_digest
+    assert map.ids == example_imagemap.ids
+    assert '1/1 image maps processed (0 changed, 0 failed)' in recache(changed_only=True)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_svgmap_recache_processes(request, example_svg_upload):
+    # (The database is flushed after the test, so the cached content types (of earlier tests) go stale.)
+    request.addfinalizer(ContentType.objects.clear_cache)
+    maps = [ImageMap.objects.create(svg=example_svg_upload) for i in range(3)]
+    ImageMap.objects.update(_render_digest='', _svg_digest='')
+    stdout = StringIO()
+    call_command('svgmap_recache', processes=2, chunk_size=1, stdout=stdout)
+    assert '3/3 image maps processed (3 changed, 0 failed)' in stdout.getvalue()
+    for map in maps:
+        assert ImageMap.objects.get(pk=map.pk).rendered_svg_digest == map.rendered_svg_digest
+
+
+@pytest.mark.skipif(not hasattr(multiprocessing, 'get_context'), reason='start methods need Python 3.4+')
+def test_svgmap_recache_spawned_worker():
+    # Spawned (rather than forked) workers need to set Django up before they can do anything.
+    # (They'd see the settings' database rather than the test one, so no image maps are involved.)
+    pool = multiprocessing.get_context('spawn').Pool(processes=1, initializer=_init_worker)
+    try:
+        assert pool.apply_async(_recache_chunk, [(DEFAULT_DB_ALIAS, [], False)]).get(timeout=60) == (0, 0, [])
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@pytest.mark.django_db
+def test_svgmap_recache_filters(example_imagemap):
+    assert '1/1 image maps' in recache(ids=[example_imagemap.pk])
+    assert 'image maps processed' not in recache(ids=[example_imagemap.pk + 1])
+    # (Passed as arguments, so they're parsed by `parse_since`.)
+    assert '1/1 image maps' in recache('--since', '2000-01-01')
+    assert 'image maps processed' not in recache('--since', '2999-01-01T00:00:00')
+    with pytest.raises(CommandError):
+        recache('--since', 'yesterday')
+    # Image maps saved before the modification time was tracked might have been modified whenever
+    ImageMap.objects.filter(pk=example_imagemap.pk).update(modified_at=None)
+    assert '1/1 image maps' in recache('--since', '2999-01-01T00:00:00')
+
+
+def test_parse_since(settings):
+    settings.TIME_ZONE = 'UTC'
+    assert parse_since('2017-03-04') == timezone.make_aware(datetime.datetime(2017, 3, 4))
+    assert parse_since('2017-03-04T05:06:07') == timezone.make_aware(datetime.datetime(2017, 3, 4, 5, 6, 7))
+    assert parse_since('2017-03-04T05:06:07+02:00') == timezone.make_aware(datetime.datetime(2017, 3, 4, 3, 6, 7))
+    with pytest.raises(CommandError):
+        parse_since('2017-13-01')
@@ -0,0 +1,71 @@
+import gzip
+
+from six import BytesIO
+
+import pytest
+
+from wagtail_svgmap.compression import brotli, choose_encoding, GZIP_LEVEL, GZIP_MAX_LEVEL
+from wagtail_svgmap.executors import run_recache
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.tests.utils import commit
+from wagtail_svgmap.views import svg_response
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('', None),
+    ('gzip, deflate, br', 'br'),
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('br;q=0, GZIP', 'gzip'),
+    ('identity', None),
+    ('*', 'br'),
+    ('*;q=0', None),
+])
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding, ['br', 'gzip']) == expected
+
+
+@pytest.mark.django_db
+def test_precompressed_variants(example_svg_upload):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map.regions.create(element_id='green', link_external='/foobar')
+    map = ImageMap.objects.get(pk=map.pk)
+    variants = map.rendered_svg_variants
+    assert b'/foobar' in variants['identity']
+    assert gzip.GzipFile(fileobj=BytesIO(variants['gzip'])).read() == variants['identity']
+    if brotli:  # pragma: no branch
+        assert brotli.decompress(variants['br']) == variants['identity']
+    assert len(variants['gzip']) < len(variants['identity'])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('accept_encoding', ['', 'gzip', 'gzip, br'])
+def test_svg_response(rf, example_imagemap, accept_encoding):
+    request = rf.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    response = svg_response(request, example_imagemap)
+    encoding = choose_encoding(accept_encoding, [coding for coding in ('br', 'gzip') if coding != 'br' or brotli])
+    assert response.get('Content-Encoding') == encoding
+    if encoding:
+        assert response.content == example_imagemap.rendered_svg_variants[encoding]
+        assert int(response['Content-Length']) == len(response.content)
+    else:  # The uncompressed SVG is streamed
+        assert b''.join(response.streaming_content) == example_imagemap.rendered_svg_variants['identity']
+    assert response['ETag'].startswith('"%s' % example_imagemap.rendered_svg_digest)
+    assert 'Accept-Encoding' in response['Vary']
+
+
+@pytest.mark.django_db
+def test_compression_levels(example_svg_upload, monkeypatch):
+    from wagtail_svgmap import models
+    levels = []
+    monkeypatch.setattr(models, 'compress_gzip', lambda data, level=GZIP_LEVEL: levels.append(level) or b'gz')
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map.regions.create(element_id='green', link_external='/foobar')
+    commit()  # Rerendered right away (by the sync executor)
+    assert levels == [GZIP_LEVEL, GZIP_LEVEL]
+    map = ImageMap.objects.get(pk=map.pk)
+    assert not map.rebuild_caches()  # Nothing changed, but it's compressed the best now
+    assert levels[-1] == GZIP_MAX_LEVEL
+    assert ImageMap.objects.get(pk=map.pk).rendered_svg_variants['gzip'] == b'gz'
+    map.regions.create(element_id='red', link_external='/barfoo')
+    run_recache(map.pk)  # As a background job would
+    assert levels[-1] == GZIP_MAX_LEVEL
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from wagtail_svgmap.executors import (
+    get_executor, RecacheExecutor, RENDER_FAILED, RENDER_PENDING, RENDER_READY, run_recache,
+    SyncRecacheExecutor, ThreadPoolRecacheExecutor
+)
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.recache import pop_pending
+
+
+class QueueExecutor(RecacheExecutor):
+    """
+    Stand-in for an external task queue executor.
+    """
+
+    def __init__(self):
+        super(QueueExecutor, self).__init__()
+        self.queue = []
+
+    def dispatch(self, key):
+        self.queue.append(key)
+
+
+class InProcessQueueExecutor(QueueExecutor):
+    """
+    Stand-in for an in-process queue executor, whose jobs are run with `run`.
+    """
+
+    deduplicate = True
+
+
+def test_get_executor(settings):
+    assert isinstance(get_executor(), SyncRecacheExecutor)
+    settings.WAGTAIL_SVGMAP_RECACHE_EXECUTOR = 'wagtail_svgmap.tests.test_executors.QueueExecutor'
+    assert isinstance(get_executor(), QueueExecutor)
+    assert get_executor() is get_executor()
+
+
+@pytest.mark.django_db
+def test_queued_recache(example_imagemap):
+    executor = InProcessQueueExecutor()
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    assert pop_pending(example_imagemap.pk)  # (As if the transaction had been committed.)
+    assert executor.submit(example_imagemap.pk)
+    assert not executor.submit(example_imagemap.pk)  # Deduplicated
+    assert len(executor.queue) == 1
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.render_state == RENDER_PENDING
+    assert '/foobar' not in map.rendered_svg  # The last good render is served meanwhile
+    assert executor.run(executor.queue.pop())
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.render_state == RENDER_READY
+    assert '/foobar' in map.rendered_svg
+    assert executor.submit(example_imagemap.pk)  # Once started, a new job may be queued
+
+
+@pytest.mark.django_db
+def test_external_queued_recache(example_imagemap):
+    # The tasks of external queues call `run_recache`, so the executor can't tell when a job has started.
+    executor = QueueExecutor()
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    assert pop_pending(example_imagemap.pk)  # (As if the transaction had been committed.)
+    assert executor.submit(example_imagemap.pk)
+    assert run_recache(*reversed(executor.queue.pop()))
+    assert '/foobar' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    example_imagemap.regions.create(element_id='green', link_external='/barfoo')
+    assert pop_pending(example_imagemap.pk)
+    assert executor.submit(example_imagemap.pk)  # Not dropped as a duplicate
+    assert run_recache(*reversed(executor.queue.pop()))
+    assert '/barfoo' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+
+
+@pytest.mark.django_db
+def test_failed_recache(example_imagemap, monkeypatch):
+    rendered_svg = example_imagemap.rendered_svg
+
+    def explode(self, save=False):
+        raise ValueError('nope')
+
+    monkeypatch.setattr(ImageMap, 'recache_svg', explode)
+    assert not run_recache(example_imagemap.pk)
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.render_state == RENDER_FAILED
+    assert map.rendered_svg == rendered_svg
+
+
+def test_thread_pool_executor(monkeypatch):
+    executor = ThreadPoolRecacheExecutor(max_workers=1)
+    threads = []
+    monkeypatch.setattr(executor, 'run', lambda key: threads.append(threading.current_thread()))
+    monkeypatch.setattr('wagtail_svgmap.executors._set_render_state', lambda *args: None)
+    assert executor.submit(42)
+    executor.pool.shutdown(wait=True)
+    assert threads and threads[0] is not threading.current_thread()
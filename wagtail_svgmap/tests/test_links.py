@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import pytest
+from django.conf.urls import include, url
+from django.conf.urls.i18n import i18n_patterns
+
+try:
+    from wagtail.core import urls as wagtail_urls
+    from wagtail.core.models import Page, Site
+except ImportError:
+    from wagtail.wagtailcore import urls as wagtail_urls
+    from wagtail.wagtailcore.models import Page, Site
+
+from wagtail_svgmap.links import get_variant_keys, LinkResolver, moved_url_path
+from wagtail_svgmap.models import ImageMap, ImageMapVariant, Region
+from wagtail_svgmap.tests.utils import commit
+
+# For `test_language_variants`
+urlpatterns = i18n_patterns(url(r'', include(wagtail_urls)))
+
+
+@pytest.fixture
+def pages(root_page):
+    parent = root_page.add_child(instance=Page(title='a', slug='a'))
+    return [
+        parent,
+        parent.add_child(instance=Page(title='b', slug='b')),
+        parent.add_child(instance=Page(title='\xe5\xe4\xf6', slug='\xe5\xe4\xf6')),
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('append_slash', (False, True))
+def test_page_urls(settings, pages, append_slash):
+    settings.WAGTAIL_APPEND_SLASH = append_slash
+    resolver = LinkResolver()
+    expected_urls = ['/a/', '/a/b/', '/a/%C3%A5%C3%A4%C3%B6/']
+    if not append_slash:
+        expected_urls = [url.rstrip('/') for url in expected_urls]
+    assert [resolver.get_page_url(Page.objects.get(pk=page.pk)) for page in pages] == expected_urls
+    if not append_slash:  # (Wagtail only reads the setting at startup.)
+        assert [page.url for page in pages] == expected_urls
+
+
+@pytest.mark.django_db
+def test_multi_site_page_urls(pages):
+    Site.objects.create(hostname='other.example.com', root_page=pages[1])
+    resolver = LinkResolver()
+    for page in pages:
+        page = Page.objects.get(pk=page.pk)
+        assert resolver.get_page_url(page) == page.url
+        assert resolver.get_page_url(page).startswith('http://')
+
+
+@pytest.mark.django_db
+def test_unroutable_page_url(pages):
+    site = Site.objects.get(is_default_site=True)
+    site.root_page = pages[0]
+    site.save()
+    page = Page.objects.get(pk=pages[1].pk)
+    page.url_path = '/nowhere/'
+    assert LinkResolver().get_page_url(page) is None
+
+
+@pytest.mark.django_db
+def test_moved_url_path(pages):
+    page = Page.objects.get(pk=pages[1].pk)
+    with moved_url_path('/a/', '/c/a/'):
+        assert LinkResolver().get_page_url(page) == '/c/a/b'
+    assert page.url_path == '/c/a/b/'  # (The in-memory instance was fixed up.)
+
+
+@pytest.mark.django_db
+def test_resolve(pages, dummy_wagtail_doc):
+    resolver = LinkResolver()
+    for region in (
+        Region(link_page=pages[1]),
+        Region(link_document=dummy_wagtail_doc),
+        Region(link_external='https://example.com/'),
+        Region(),
+    ):
+        assert resolver.resolve(region) == region.link
+
+
+@pytest.mark.django_db
+def test_render_resolves_links_in_bulk(example_imagemap, pages, django_assert_num_queries):
+    for element_id, page in zip(('red', 'green', 'blue'), pages):
+        example_imagemap.regions.create(element_id=element_id, link_page=page)
+    example_imagemap.recache_svg(save=True)
+    example_imagemap.compiled_svg  # (Loading the template isn't of interest here.)
+    with django_assert_num_queries(1):  # Just the regions (and their pages); the site root paths are cached
+        example_imagemap._render()
+
+
+@pytest.mark.django_db
+def test_single_site_has_no_variants(example_imagemap, pages):
+    assert not get_variant_keys()
+    example_imagemap.regions.create(element_id='red', link_page=pages[1])
+    example_imagemap.recache_svg(save=True)
+    assert not ImageMap.objects.get(pk=example_imagemap.pk)._has_variants
+    assert not ImageMapVariant.objects.exists()
+    site = Site.objects.get()
+    assert example_imagemap.get_rendered_svg(site=site) == example_imagemap.rendered_svg
+
+
+@pytest.mark.django_db
+def test_site_variants(example_imagemap, pages):
+    default_site = Site.objects.get()
+    default_site.hostname = 'localhost'
+    default_site.save()
+    other_site = Site.objects.create(hostname='other.example.com', root_page=pages[1])
+    example_imagemap.regions.create(element_id='red', link_page=pages[0])
+    example_imagemap.regions.create(element_id='green', link_page=pages[1])
+    example_imagemap.regions.create(element_id='blue', link_external='https://example.com/')
+    commit()
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map._has_variants
+    assert 'href="http://localhost/a"' in map.rendered_svg  # Absolute links, when the site isn't known
+    assert 'href="http://other.example.com/"' in map.rendered_svg
+    default_svg = map.get_rendered_svg(site=default_site)
+    assert 'href="/a"' in default_svg and 'href="http://other.example.com/"' in default_svg
+    other_svg = map.get_rendered_svg(site=other_site, language='fi')
+    assert 'href="http://localhost/a"' in other_svg and 'href="/"' in other_svg
+    assert 'https://example.com/' in other_svg
+
+    other_site.delete()  # All of the maps with page links are recached
+    commit()
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert 'href="/a"' in map.rendered_svg
+    assert not map._has_variants
+    assert not map.variants.exists()
+
+
+@pytest.mark.django_db
+def test_language_variants(settings, example_imagemap, pages):
+    settings.ROOT_URLCONF = __name__
+    settings.LANGUAGE_CODE = 'en'
+    settings.LANGUAGES = [('en', 'English'), ('fi', 'Finnish')]
+    site = Site.objects.get()
+    assert get_variant_keys() == [(site.pk, 'en'), (site.pk, 'fi')]
+    example_imagemap.regions.create(element_id='red', link_page=pages[0])
+    commit()
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert 'href="/en/a"' in map.rendered_svg
+    assert list(map.variants.values_list('site', 'language')) == [(site.pk, 'fi')]  # (English is the default)
+    assert 'href="/fi/a"' in map.get_rendered_svg(site=site, language='fi')
+    assert 'href="/en/a"' in map.get_rendered_svg(site=site, language='en')
@@ -0,0 +1,82 @@
+import re
+
+from six import BytesIO
+
+import pytest
+
+from wagtail_svgmap.minify import Minifier
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.pipeline import get_pipeline
+from wagtail_svgmap.streaming import compile_svg, stream_wrap_elements_in_links
+from wagtail_svgmap.svg import ET, find_ids, fix_dimensions, SVG_NAMESPACE
+from wagtail_svgmap.tests.test_streaming import LINKS
+
+EDITOR_SVG_DATA = b'''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+     width="100" height="50" inkscape:version="0.92" sodipodi:docname="map.svg">
+    <!-- A comment -->
+    <metadata id="metadata"><rdf:RDF><rdf:Description about="map" /></rdf:RDF></metadata>
+    <sodipodi:namedview id="namedview" sodipodi:pagecolor="#ffffff"><inkscape:grid /></sodipodi:namedview>
+    <g id="layer" inkscape:label="Layer" inkscape:groupmode="layer">
+        <path id="green" d="M0 0"/> some <sodipodi:guide /> tail
+        <text id="text" xml:space="default">hello <tspan id="blue">world</tspan> <tspan>!</tspan></text>
+        <g xml:space="preserve">   <rect id="red" x="1"/>   </g>
+    </g>
+</svg>'''
+
+
+def _stream(links, minifier):
+    output = BytesIO()
+    stream_wrap_elements_in_links(
+        BytesIO(EDITOR_SVG_DATA),
+        output,
+        links,
+        xml_declaration=False,
+        root_transform=fix_dimensions,
+        minifier=minifier,
+    )
+    return output.getvalue().decode('UTF-8')
+
+
+@pytest.mark.parametrize('links', [LINKS, {}], ids=['links', 'no-links'])
+def test_minify(links):
+    minifier = Minifier()
+    svg = _stream(links, minifier)
+    unminified_svg = _stream(links, None)
+    assert len(svg) < len(unminified_svg) * 0.6
+    for junk in ('inkscape', 'sodipodi', 'metadata', 'rdf', 'namedview', '>\n'):
+        assert junk not in svg
+    # Text content whitespace is significant, as is whitespace within `xml:space="preserve"`
+    assert re.search('<text.+</text>', svg).group(0) == re.search('<text.+</text>', unminified_svg).group(0)
+    assert '<g xml:space="preserve">   <' in svg
+    # The IDs and the links should be untouched
+    root = ET.fromstring(svg)
+    assert {elem.get('id') for elem in root.iter() if elem.get('id')} == set(find_ids(BytesIO(EDITOR_SVG_DATA)))
+    assert {link[0].get('id') for link in root.iter('{%s}a' % SVG_NAMESPACE)} == set(links)
+    # Compiled templates are minified the same way
+    compiled = compile_svg(BytesIO(EDITOR_SVG_DATA), root_transform=fix_dimensions, minifier=minifier)
+    assert compiled.options_key == minifier.key
+    assert compiled.render(links) == svg
+
+
+def test_minify_options():
+    minifier = Minifier(strip_whitespace=False, remove_metadata=False, remove_namespaces=())
+    assert _stream(LINKS, minifier) == _stream(LINKS, None)
+
+
+@pytest.mark.django_db
+def test_minify_setting(settings, example_imagemap):
+    settings.WAGTAIL_SVGMAP_MINIFY = False
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    unminified_svg = map.rendered_svg
+    settings.WAGTAIL_SVGMAP_MINIFY = {'strip_whitespace': True}
+    map.recache_svg(save=True)  # The template is recompiled, since the settings changed
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert len(map.rendered_svg) < len(unminified_svg)
+    assert ET.fromstring(map.rendered_svg).findall('.//{%s}path' % SVG_NAMESPACE)
+    pipeline = get_pipeline()
+    assert pipeline.minifier.key == Minifier().key
+    assert map.compiled_svg.options_key == pipeline.key
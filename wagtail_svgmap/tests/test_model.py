@@ -1,13 +1,22 @@
+from six import BytesIO
+
 import pytest
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 try:
     from wagtail.core.models import Page
 except ImportError:
     from wagtail.wagtailcore.models import Page
 
-from wagtail_svgmap.models import ImageMap
-from wagtail_svgmap.tests.utils import EXAMPLE2_SVG_DATA, IDS_IN_EXAMPLE2_SVG, IDS_IN_EXAMPLE_SVG
+from wagtail_svgmap import recache
+from wagtail_svgmap.models import ImageMap, ImageMapArtifacts
+from wagtail_svgmap.pipeline import Pipeline
+from wagtail_svgmap.svg import fix_dimensions, serialize_svg, wrap_elements_in_links
+from wagtail_svgmap.tests.test_streaming import INKSCAPE_SVG_DATA
+from wagtail_svgmap.tests.utils import EXAMPLE2_SVG_DATA, EXAMPLE_SVG_DATA, IDS_IN_EXAMPLE2_SVG, IDS_IN_EXAMPLE_SVG
 
 
 @pytest.mark.django_db
@@ -60,6 +69,18 @@ def test_rendering(root_page, example_svg_upload, dummy_wagtail_doc):
     assert ('documents/%s' % dummy_wagtail_doc.pk) in svg
 
 
+@pytest.mark.django_db
+def test_rendering_without_links():
+    # The compiled form can't render this one without links (see `test_compiled_namespaces_without_links`)
+    map = ImageMap.objects.create(svg=SimpleUploadedFile('inkscape.svg', INKSCAPE_SVG_DATA))
+    tree = wrap_elements_in_links(BytesIO(INKSCAPE_SVG_DATA), {})
+    fix_dimensions(tree)
+    assert map.rendered_svg == serialize_svg(tree, xml_declaration=False)
+    assert 'xmlns:xlink' not in map.rendered_svg
+    map.regions.create(element_id='green', link_external='/foobar')
+    assert '/foobar' in ImageMap.objects.get(pk=map.pk).rendered_svg
+
+
 @pytest.mark.django_db
 def test_auto_recache(root_page, example_svg_upload):
     page = Page(title="nnep", slug="nnep")
@@ -75,3 +96,128 @@ def test_auto_recache(root_page, example_svg_upload):
     page.slug = 'ffflop'
     page.save()  # The `post_save` triggers will get called...
     assert 'ffflop' in ImageMap.objects.get(pk=map.pk).rendered_svg
+
+
+@pytest.mark.django_db
+def test_region_change_uses_compiled_svg(example_svg_upload):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map = ImageMap.objects.get(pk=map.pk)
+
+    def explode():  # pragma: no cover
+        raise AssertionError('the original SVG should not need to be opened')
+
+    map._open_original = explode
+    map.regions.create(element_id='green', link_external='/foobar')
+    map.regions.create(element_id='red', link_external='/barfoo')
+    assert '/foobar' in map.rendered_svg
+    assert '/barfoo' in ImageMap.objects.get(pk=map.pk).rendered_svg
+
+
+@pytest.mark.django_db
+def test_artifacts_not_loaded_with_image_maps(example_svg_upload, django_assert_num_queries):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map.regions.create(element_id='green', link_external='/foobar')
+    recache.flush()  # (As if the transaction had been committed.)
+    assert 'render_cache' not in str(ImageMap.objects.all().query)
+    map = ImageMap.objects.get(pk=map.pk)
+    with django_assert_num_queries(1):  # Just the artifact row; the template and precompressed data are deferred
+        assert '/foobar' in map.rendered_svg
+    assert map.ids == IDS_IN_EXAMPLE_SVG
+    # Unless they're selected along with the image map
+    map = ImageMap.objects.select_related('artifacts_row').get(pk=map.pk)
+    with django_assert_num_queries(0):
+        assert '/foobar' in map.rendered_svg
+    ImageMapArtifacts.objects.all().delete()
+    map = ImageMap.objects.select_related('artifacts_row').get(pk=map.pk)
+    assert map.artifacts._state.adding  # (A missing row is created anew.)
+    map.delete()
+    assert not ImageMapArtifacts.objects.exists()
+
+
+@pytest.mark.django_db
+def test_save_writes_once(example_svg_upload):
+    with CaptureQueriesContext(connection) as context:
+        map = ImageMap.objects.create(svg=example_svg_upload)
+    writes = [query['sql'] for query in context.captured_queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+    assert len(writes) == 3  # The image map, its artifacts and its elements
+    assert map.ids == IDS_IN_EXAMPLE_SVG
+    assert map.size == (588, 588)
+    with CaptureQueriesContext(connection) as context:
+        ImageMap.objects.get(pk=map.pk).save(update_fields=['title'])
+    assert 'artifacts' not in ''.join(query['sql'] for query in context.captured_queries)
+
+
+@pytest.mark.django_db
+def test_element_table(example_svg_upload, django_assert_num_queries):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    other_map = ImageMap.objects.create(svg=SimpleUploadedFile('example2.svg', EXAMPLE2_SVG_DATA))
+    map = ImageMap.objects.get(pk=map.pk)
+    with django_assert_num_queries(1):  # The IDs are memoized
+        assert map.ids == IDS_IN_EXAMPLE_SVG
+        assert map.ids == IDS_IN_EXAMPLE_SVG
+    assert all(tag == 'path' for (element_id, tag) in map.element_list)
+    assert set(ImageMap.objects.with_element('red')) == {map}
+    assert set(ImageMap.objects.with_element('red', 'punainen', 'nope')) == {map, other_map}
+    assert not ImageMap.objects.with_element('nope').exists()
+
+
+@pytest.mark.django_db
+def test_unchanged_svg_not_reparsed(example_svg_upload, monkeypatch):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+
+    def explode(self, svg_stream):  # pragma: no cover
+        raise AssertionError('the SVG should not need to be parsed')
+
+    monkeypatch.setattr(Pipeline, 'run', explode)
+    map = ImageMap.objects.get(pk=map.pk)
+    map.title = 'new title'
+    map.save()
+    assert map.ids == IDS_IN_EXAMPLE_SVG
+
+
+@pytest.mark.django_db
+def test_id_diff(example_svg_upload):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map.regions.create(element_id='red', link_external='/foobar')
+    map.svg.save('example2.svg', ContentFile(EXAMPLE2_SVG_DATA))  # (This saves the map too.)
+    assert map.last_id_diff == (IDS_IN_EXAMPLE2_SVG, IDS_IN_EXAMPLE_SVG)
+    assert map.regions.get(element_id='red').orphaned
+    map.svg.save('example.svg', ContentFile(EXAMPLE_SVG_DATA))
+    assert map.last_id_diff == (IDS_IN_EXAMPLE_SVG, IDS_IN_EXAMPLE2_SVG)
+    assert not map.regions.get(element_id='red').orphaned
+
+
+@pytest.mark.django_db
+def test_recache_ids_scans(example_svg_upload, monkeypatch):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    map.regions.create(element_id='red', link_external='/foobar')
+    compiled_elements = map.element_list
+
+    def explode(self, svg_stream):  # pragma: no cover
+        raise AssertionError('the SVG should not need to be compiled')
+
+    monkeypatch.setattr(Pipeline, 'run', explode)
+    map = ImageMap.objects.get(pk=map.pk)
+    assert not map.recache_ids(save=True)
+    assert map.element_list == compiled_elements
+    with open(map.svg.path, 'wb') as outfp:
+        outfp.write(EXAMPLE2_SVG_DATA)
+    assert map.recache_ids(save=True)
+    assert map.last_id_diff == (IDS_IN_EXAMPLE2_SVG, IDS_IN_EXAMPLE_SVG)
+    assert ImageMap.objects.get(pk=map.pk).ids == IDS_IN_EXAMPLE2_SVG
+    assert map.regions.get(element_id='red').orphaned
+
+
+@pytest.mark.django_db
+def test_region_save_checks_element(example_svg_upload):
+    map = ImageMap.objects.create(svg=example_svg_upload)
+    region = ImageMap.objects.get(pk=map.pk).regions.create(element_id='red', link_external='/foobar')
+    assert not region.orphaned
+    region = map.regions.get(pk=region.pk)
+    region.element_id = 'nonexistent'
+    with CaptureQueriesContext(connection) as context:
+        region.save()
+    assert region.orphaned
+    # The element is looked up by its (unique) index; neither the map nor all of its elements are loaded
+    assert not any('"wagtail_svgmap_imagemap"."' in query['sql'] for query in context.captured_queries)
+    assert any('LIMIT 1' in query['sql'] for query in context.captured_queries)
@@ -0,0 +1,56 @@
+from six import BytesIO
+
+import pytest
+
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.pipeline import CollectIDsStage, get_pipeline, Pipeline, Stage
+from wagtail_svgmap.streaming import compile_svg
+from wagtail_svgmap.svg import find_ids, fix_dimensions
+from wagtail_svgmap.tests.test_streaming import INKSCAPE_SVG_DATA, LINKS
+from wagtail_svgmap.tests.utils import EXAMPLE_SVG_DATA, IDS_IN_EXAMPLE_SVG
+
+
+class ClassifyStage(Stage):
+    name = 'classify'
+    handles_elements = True
+
+    def element(self, tag, attr_list):
+        if tag.endswith('}path'):
+            return attr_list + ['class', 'region']
+        return attr_list
+
+
+class _UnseekableStream(object):
+    def __init__(self, data):
+        self.stream = BytesIO(data)
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+@pytest.mark.parametrize('data', [EXAMPLE_SVG_DATA, INKSCAPE_SVG_DATA], ids=['example', 'inkscape'])
+def test_pipeline(data):
+    # The document is only read once
+    result = Pipeline().run(_UnseekableStream(data))
+    assert sorted(element_id for (element_id, tag) in result.results['elements']) == sorted(find_ids(BytesIO(data)))
+    assert set(result.timings) == {'elements', 'dimensions', 'compile'}
+    expected = compile_svg(BytesIO(data), root_transform=fix_dimensions)
+    for links in (LINKS, {}):
+        assert result.compiled.render(links) == expected.render(links)
+
+
+def test_collect_ids_stage():
+    result = Pipeline(stages=[CollectIDsStage]).run(BytesIO(EXAMPLE_SVG_DATA))
+    assert set(result.results['ids']) == IDS_IN_EXAMPLE_SVG
+
+
+@pytest.mark.django_db
+def test_pipeline_stage_setting(settings, example_imagemap):
+    assert example_imagemap.ids == IDS_IN_EXAMPLE_SVG
+    assert 'region' not in example_imagemap.rendered_svg
+    settings.WAGTAIL_SVGMAP_PIPELINE_STAGES = ['wagtail_svgmap.tests.test_pipeline.ClassifyStage']
+    assert get_pipeline().stages[-1] is ClassifyStage
+    example_imagemap.recache_svg(save=True)  # The template is recompiled, since the pipeline changed
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.rendered_svg.count('class="region"') == len(IDS_IN_EXAMPLE_SVG)
+    assert map.ids == IDS_IN_EXAMPLE_SVG
@@ -0,0 +1,233 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models.signals import post_save, pre_save
+from django.test.utils import CaptureQueriesContext
+
+try:
+    from wagtail.core.models import Page, Site
+except ImportError:
+    from wagtail.wagtailcore.models import Page, Site
+
+from wagtail_svgmap import recache
+from wagtail_svgmap.executors import RENDER_READY, SyncRecacheExecutor
+from wagtail_svgmap.models import ImageMap, Region
+from wagtail_svgmap.signal_handlers import Document, handle_page_pre_save, handle_recache_imagemap
+from wagtail_svgmap.tests.utils import commit
+from wsm_test.models import TestPage
+
+
+@pytest.fixture
+def recache_counter(monkeypatch):
+    calls = []
+    original_recache_svg = ImageMap.recache_svg
+
+    def recache_svg(self, *args, **kwargs):
+        calls.append(self.pk)
+        return original_recache_svg(self, *args, **kwargs)
+
+    monkeypatch.setattr(ImageMap, 'recache_svg', recache_svg)
+    return calls
+
+
+@pytest.mark.django_db
+def test_coalesced_recache(example_imagemap, recache_counter):
+    for element_id in ('red', 'green', 'blue'):
+        example_imagemap.regions.create(element_id=element_id, link_external='/%s' % element_id)
+    assert not recache_counter  # Nothing is rendered until the transaction commits...
+    commit()
+    assert recache_counter == [example_imagemap.pk]  # ... and then just once.
+    rendered_svg = ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert all(('/%s' % element_id) in rendered_svg for element_id in ('red', 'green', 'blue'))
+
+
+@pytest.mark.django_db
+def test_recache_on_delete(example_imagemap, dummy_wagtail_doc):
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    example_imagemap.regions.create(element_id='blue', link_document=dummy_wagtail_doc)
+    commit()
+    rendered_svg = ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert '/foobar' in rendered_svg and ('documents/%s' % dummy_wagtail_doc.pk) in rendered_svg
+    example_imagemap.regions.get(element_id='red').delete()
+    dummy_wagtail_doc.delete()  # The region is deleted by cascade
+    commit()
+    rendered_svg = ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert '/foobar' not in rendered_svg and ('documents/%s' % dummy_wagtail_doc.pk) not in rendered_svg
+
+
+@pytest.mark.django_db
+def test_recache_batch(example_imagemap, recache_counter):
+    with recache.batch():
+        example_imagemap.regions.create(element_id='red', link_external='/foobar')
+        example_imagemap.regions.create(element_id='green', link_external='/barfoo')
+        assert not recache_counter
+    commit()
+    assert recache_counter == [example_imagemap.pk]
+    assert '/barfoo' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+
+
+@pytest.mark.django_db
+def test_pending_recache_on_access(example_imagemap, recache_counter):
+    # Before the transaction is committed, the changes are rendered (in memory) when the SVG is accessed.
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    example_imagemap.regions.create(element_id='green', link_external='/barfoo')
+    with CaptureQueriesContext(connection) as context:
+        assert '/barfoo' in example_imagemap.rendered_svg
+        assert example_imagemap.rendered_svg_digest
+        assert '/barfoo' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert not any(query['sql'].startswith(('INSERT', 'UPDATE')) for query in context.captured_queries)
+    assert recache_counter == [example_imagemap.pk] * 2  # (Once per instance.)
+    example_imagemap.regions.create(element_id='blue', link_external='/bazfoo')
+    assert '/bazfoo' in example_imagemap.rendered_svg
+    commit()  # Saved only now
+    assert recache_counter == [example_imagemap.pk] * 4
+    assert '/bazfoo' in ImageMap.objects.get(pk=example_imagemap.pk).artifacts.render_cache
+
+
+@pytest.mark.django_db
+def test_pending_recache_rollback(example_imagemap, recache_counter):
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    try:
+        with transaction.atomic():
+            example_imagemap.regions.create(element_id='green', link_external='/barfoo')
+            assert '/barfoo' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+            raise ZeroDivisionError
+    except ZeroDivisionError:
+        pass
+    # The change within the savepoint is gone, but the one before isn't
+    assert recache.get_pending(example_imagemap.pk)
+    rendered_svg = ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert '/foobar' in rendered_svg and '/barfoo' not in rendered_svg
+    connection.run_on_commit = []  # (As if the whole transaction had been rolled back.)
+    assert not recache.get_pending(example_imagemap.pk)
+    del recache_counter[:]
+    assert '/foobar' not in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert not recache_counter
+
+
+@pytest.mark.django_db
+def test_pending_recache_cleared_after_request(example_imagemap, client):
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    client.get('/')
+    assert recache.get_pending(example_imagemap.pk)  # The (test) transaction is still going on
+    connection.run_on_commit = []  # (As if the transaction had been rolled back.)
+    client.get('/')
+    assert not recache._get_pending()
+
+
+@pytest.fixture
+def page_tree(root_page):
+    """
+    Create the pages /a/, /a/b/ and /c/.
+    """
+    pages = {}
+    for slug, parent in (('a', root_page), ('b', 'a'), ('c', root_page)):
+        parent = pages.get(parent, parent)
+        pages[slug] = parent.add_child(instance=Page(title=slug, slug=slug))
+    return pages
+
+
+@pytest.mark.django_db
+def test_page_save_without_url_change(example_imagemap, page_tree, recache_counter):
+    example_imagemap.regions.create(element_id='red', link_page=page_tree['b'])
+    commit()
+    del recache_counter[:]
+    page = Page.objects.get(pk=page_tree['b'].pk).specific
+    page.title = 'Bee'
+    page.save()
+    commit()
+    assert not recache_counter
+
+
+@pytest.mark.django_db
+def test_subtree_slug_change(example_imagemap, page_tree, recache_counter):
+    example_imagemap.regions.create(element_id='red', link_page=page_tree['b'])
+    example_imagemap.regions.create(element_id='green', link_page=page_tree['c'])
+    commit()
+    assert '"/a/b"' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    del recache_counter[:]
+    page = Page.objects.get(pk=page_tree['a'].pk)
+    page.slug = 'aaa'
+    page.save()
+    commit()
+    assert recache_counter == [example_imagemap.pk]
+    assert '"/aaa/b"' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+    assert Region.objects.get(element_id='red').resolved_url == '/aaa/b'
+
+
+@pytest.mark.django_db
+def test_subtree_move(example_imagemap, page_tree):
+    example_imagemap.regions.create(element_id='red', link_page=page_tree['b'])
+    commit()
+    Page.objects.get(pk=page_tree['a'].pk).move(page_tree['c'], pos='last-child')
+    commit()
+    assert '"/c/a/b"' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+
+
+@pytest.mark.django_db
+def test_subtree_slug_change_recached_right_away(example_imagemap, page_tree, monkeypatch):
+    example_imagemap.regions.create(element_id='red', link_page=page_tree['b'])
+    commit()
+    submitted = []
+    original_submit = SyncRecacheExecutor.submit
+    monkeypatch.setattr(SyncRecacheExecutor, 'submit', lambda self, *args, **kwargs: (
+        submitted.append(args) or original_submit(self, *args, **kwargs)
+    ))
+    monkeypatch.setattr(transaction, 'on_commit', lambda func, using=None: func())  # (As if in autocommit mode.)
+    page = Page.objects.get(pk=page_tree['a'].pk)
+    page.slug = 'aaa'
+    page.save()
+    # Rerendered (by the executor) right away, before Wagtail got to update the URL path of /a/b/
+    assert submitted == [(example_imagemap.pk,)]
+    assert '"/aaa/b"' in ImageMap.objects.get(pk=example_imagemap.pk).artifacts.render_cache
+
+
+@pytest.mark.django_db
+def test_document_save(example_imagemap, dummy_wagtail_doc, recache_counter):
+    example_imagemap.regions.create(element_id='red', link_document=dummy_wagtail_doc)
+    commit()
+    del recache_counter[:]
+    dummy_wagtail_doc.title = 'goodbye'
+    dummy_wagtail_doc.save()  # The URL doesn't depend on the title
+    commit()
+    assert not recache_counter
+    dummy_wagtail_doc.file.name = 'documents/bar.txt'
+    dummy_wagtail_doc.save()
+    commit()
+    assert recache_counter == [example_imagemap.pk]
+    assert 'bar.txt' in ImageMap.objects.get(pk=example_imagemap.pk).rendered_svg
+
+
+def test_signal_senders():
+    for model in (Page, TestPage):
+        assert handle_page_pre_save in pre_save._live_receivers(model)
+        assert handle_recache_imagemap in post_save._live_receivers(model)
+    assert handle_recache_imagemap in post_save._live_receivers(Document)
+    # Saving other models doesn't need the handlers to figure that out
+    assert handle_page_pre_save not in pre_save._live_receivers(Document)
+    assert handle_recache_imagemap not in post_save._live_receivers(ContentType)
+    assert handle_recache_imagemap not in post_save._live_receivers(ImageMap)
+
+
+@pytest.mark.django_db
+def test_unroutable_page_link(example_imagemap, root_page, recache_counter):
+    site = Site.objects.get()
+    site.root_page = root_page.add_child(instance=Page(title='home', slug='home'))
+    site.save()
+    page = root_page.add_child(instance=Page(title='outside', slug='outside'))  # (Outside every site root.)
+    del recache_counter[:]
+    region = example_imagemap.regions.create(element_id='red', link_page=page)
+    example_imagemap.regions.create(element_id='green', link_external='/foobar')
+    commit()
+    assert recache_counter == [example_imagemap.pk]
+    image_map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert image_map.render_state == RENDER_READY
+    assert '/foobar' in image_map.rendered_svg and 'None' not in image_map.rendered_svg
+    assert Region.objects.get(pk=region.pk).resolved_url == ''
+    # Moving the page around outside the sites doesn't change its URL (there is none)
+    del recache_counter[:]
+    page = Page.objects.get(pk=page.pk)
+    page.slug = 'still-outside'
+    page.save()
+    commit()
+    assert not recache_counter
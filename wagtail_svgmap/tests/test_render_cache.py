@@ -0,0 +1,55 @@
+import pytest
+
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.render_cache import get_render_cache, LRUCache, RenderCache
+from wagtail_svgmap.tests.utils import commit
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=10)
+    cache.set('a', 'aaaa')
+    cache.set('b', 'bbbb')
+    assert cache.get('a') == 'aaaa'  # `b` is now the least recently used one...
+    cache.set('c', 'cccc')  # ... so it's evicted to make room
+    assert cache.get('b') is None
+    assert (len(cache), cache.size) == (2, 8)
+    cache.set('c', 'cc')
+    assert (len(cache), cache.size) == (2, 6)
+    cache.set('d', 'd' * 11)  # Too big to cache at all
+    assert cache.get('d') is None and len(cache) == 2
+    cache.delete_matching(lambda key: key in 'ac')
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_tiered_render_cache():
+    shared_cache = RenderCache(alias='default')
+    cache = RenderCache(max_size=1000, alias='default')
+    assert cache.get(1, 'abc') is None
+    shared_cache.set(1, 'abc', '<svg/>')
+    shared_cache.set(1, 'abc', '<svg id="fi"/>', variant=(1, 'fi'))
+    assert cache.get(1, 'abc') == '<svg/>'  # From the shared cache...
+    assert cache.get(1, 'abc') == '<svg/>'  # ... and then from the local one
+    assert cache.get(1, 'abc', variant=(1, 'fi')) == '<svg id="fi"/>'
+    assert cache.stats == {'local_hits': 1, 'shared_hits': 2, 'misses': 1}
+    cache.invalidate(1, 'abc')
+    assert cache.get(1, 'abc') is None
+    cache.reset_stats()
+    assert cache.stats == {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+@pytest.mark.django_db
+def test_cached_rendered_svg(settings, example_imagemap, django_assert_num_queries):
+    settings.WAGTAIL_SVGMAP_RENDER_CACHE_ALIAS = 'default'
+    render_cache = get_render_cache()
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    assert map.get_rendered_svg() == example_imagemap.rendered_svg
+    map = ImageMap.objects.get(pk=example_imagemap.pk)
+    with django_assert_num_queries(0):  # The render cache (keyed by the digest on the row) has it
+        assert map.get_rendered_svg() == example_imagemap.rendered_svg
+    assert render_cache.stats == {'local_hits': 1, 'shared_hits': 0, 'misses': 1}
+
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    commit()  # Rerendered, which drops the old markup
+    assert not len(render_cache.local)
+    assert render_cache.shared.get('wagtail_svgmap:render:%s:%s' % (map.pk, map.rendered_svg_digest)) is None
+    assert '/foobar' in ImageMap.objects.get(pk=example_imagemap.pk).get_rendered_svg()
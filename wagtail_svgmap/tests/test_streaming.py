@@ -0,0 +1,101 @@
+from io import BytesIO
+
+import pytest
+
+from wagtail_svgmap.streaming import compile_svg, CompiledSVG, stream_wrap_elements_in_links
+from wagtail_svgmap.svg import (
+    ET, fix_dimensions, get_dimensions, Link, serialize_svg, SVG_NAMESPACE, wrap_elements_in_links
+)
+from wagtail_svgmap.tests.utils import EXAMPLE_SVG_DATA
+
+INKSCAPE_SVG_DATA = b'''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     width="100" height="50">
+    <!-- A comment -->
+    <g id="layer" inkscape:label="Layer &amp; stuff">
+        <path id="green" d="M0 0"/> some &lt;tail&gt;
+        <text id="text">hello <tspan id="blue">world</tspan> after</text>
+    </g>
+    <sodipodi:namedview id="namedview" sodipodi:pagecolor="#ffffff"/>
+    <rect id="red" x="1"/>
+</svg>'''
+
+LINKS = {
+    'green': '/hello',
+    'blue': Link('/world?a=1&b="2"', target='_blank'),
+    'layer': '/layer',
+    'red': '/red',
+}
+
+
+@pytest.mark.parametrize('data', [EXAMPLE_SVG_DATA, INKSCAPE_SVG_DATA], ids=['example', 'inkscape'])
+@pytest.mark.parametrize('links', [LINKS, {}], ids=['links', 'no-links'])
+@pytest.mark.parametrize('xml_declaration', [True, False])
+def test_streaming_parity(data, links, xml_declaration):
+    tree = wrap_elements_in_links(BytesIO(data), links)
+    fix_dimensions(tree)
+    dimensions = get_dimensions(tree)
+    expected = serialize_svg(tree, xml_declaration=xml_declaration).encode('UTF-8')
+
+    output = BytesIO()
+    root = stream_wrap_elements_in_links(
+        BytesIO(data),
+        output,
+        links,
+        xml_declaration=xml_declaration,
+        root_transform=fix_dimensions,
+    )
+    assert output.getvalue() == expected
+    assert get_dimensions(root) == dimensions
+
+
+def test_streaming_flat_map():
+    n_paths = 5000
+    data = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10">%s</svg>' %
+        '\n'.join('<path id="p%d" d="M0 0"/>' % i for i in range(n_paths))
+    ).encode('UTF-8')
+    links = {'p%d' % i: '/%d' % i for i in range(0, n_paths, 3)}
+    output = BytesIO()
+    stream_wrap_elements_in_links(BytesIO(data), output, links)
+    assert output.getvalue().decode('UTF-8') == serialize_svg(wrap_elements_in_links(BytesIO(data), links))
+
+
+@pytest.mark.parametrize('links', [LINKS, {}, {'green': '/hello'}], ids=['links', 'no-links', 'one-link'])
+def test_compiled_parity(links):
+    compiled = CompiledSVG.from_json(compile_svg(BytesIO(EXAMPLE_SVG_DATA), root_transform=fix_dimensions).to_json())
+    output = BytesIO()
+    root = stream_wrap_elements_in_links(
+        BytesIO(EXAMPLE_SVG_DATA),
+        output,
+        links,
+        xml_declaration=False,
+        root_transform=fix_dimensions,
+    )
+    assert compiled.render(links) == output.getvalue().decode('UTF-8')
+    assert b''.join(compiled.iter_render(links, chunk_size=100)) == output.getvalue()
+    assert get_dimensions(compiled.get_root()) == get_dimensions(root)
+
+
+def test_compiled_namespaces():
+    compiled = compile_svg(BytesIO(INKSCAPE_SVG_DATA))
+    rendered = compiled.render(LINKS)
+    # The output should be well-formed and carry the links no matter the namespace juggling
+    ids = {link[0].get('id') for link in ET.fromstring(rendered).iter('{%s}a' % SVG_NAMESPACE)}
+    assert ids == set(LINKS)
+
+
+@pytest.mark.parametrize('links', [{}, {'nonexistent': '/foo'}], ids=['no-links', 'no-matching-links'])
+def test_compiled_namespaces_without_links(links):
+    # Linking would shift the prefix of the Inkscape namespace, so the compiled form can't render
+    # the document without links byte-for-byte like the other serializers; it must say so.
+    compiled = CompiledSVG.from_json(compile_svg(BytesIO(INKSCAPE_SVG_DATA)).to_json())
+    assert compiled.render(links) is None
+    assert compiled.iter_render(links) is None
+    output = BytesIO()
+    stream_wrap_elements_in_links(BytesIO(INKSCAPE_SVG_DATA), output, links, xml_declaration=False)
+    rendered = output.getvalue().decode('UTF-8')
+    assert rendered == serialize_svg(wrap_elements_in_links(BytesIO(INKSCAPE_SVG_DATA), links), xml_declaration=False)
+    assert 'xmlns:xlink' not in rendered
@@ -1,5 +1,26 @@
-from wagtail_svgmap.svg import find_ids, Link, serialize_svg, SVG_NAMESPACE, wrap_elements_in_links, XLINK_NAMESPACE
-from wagtail_svgmap.tests.utils import EXAMPLE_SVG_PATH, IDS_IN_EXAMPLE_SVG
+from six import BytesIO
+
+import pytest
+
+from wagtail_svgmap.svg import (
+    _iterparse_elements, _iterparse_ids, _scan_elements, _scan_ids, _Unscannable, find_ids, iter_serialize_svg, Link,
+    serialize_svg, SVG_NAMESPACE, wrap_elements_in_links, write_svg, XLINK_NAMESPACE
+)
+from wagtail_svgmap.tests.utils import EXAMPLE_SVG_DATA, EXAMPLE_SVG_PATH, IDS_IN_EXAMPLE_SVG
+
+TRICKY_SVG_DATA = b'''<?xml version="1.0"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:foo="urn:foo">
+    <!-- <path id="commented"/> -->
+    <?pi <path id="instructed"?>
+    <svg:g xmlns:svg="http://www.w3.org/2000/svg" id='single' title="a > b">
+        <path id="green" d="M0 0"/>
+        <text id = "text">x</text>
+        <path foo:id="namespaced"/>
+        <path data-id="data"/>
+    </svg:g>
+    <foo:bar id="bar"/>
+    <rect id="" />
+</svg>'''
 
 
 def test_find_ids():
@@ -7,6 +28,32 @@ def test_find_ids():
         assert set(find_ids(infp)) == IDS_IN_EXAMPLE_SVG
 
 
+def test_find_ids_stream():
+    assert set(find_ids(BytesIO(EXAMPLE_SVG_DATA))) == IDS_IN_EXAMPLE_SVG
+
+
+@pytest.mark.parametrize('data', [EXAMPLE_SVG_DATA, TRICKY_SVG_DATA], ids=['example', 'tricky'])
+def test_scan_ids_parity(data):
+    assert sorted(_scan_ids(data)) == sorted(_iterparse_ids(BytesIO(data)))
+    assert _scan_elements(data) == list(_iterparse_elements(BytesIO(data)))
+
+
+@pytest.mark.parametrize('data', [
+    b'<svg><![CDATA[<path id="x"/>]]></svg>',
+    b'<!DOCTYPE svg [<!ENTITY e "x">]><svg><path id="&e;"/></svg>',
+    b'<svg><path id="a&amp;b"/></svg>',
+    b'<?xml version="1.0" encoding="ISO-8859-1"?><svg><path id="\xe4"/></svg>',
+    b'<svg><path \xc3\xa4="1" id="x"/></svg>',
+], ids=['cdata', 'doctype', 'entity', 'encoding', 'attribute'])
+def test_scan_ids_fallback(tmpdir, data):
+    with pytest.raises(_Unscannable):
+        _scan_ids(data)
+    path = tmpdir.join('unscannable.svg')
+    path.write_binary(data)
+    with path.open('rb') as infp:  # `find_ids` should fall back to actually parsing the file
+        assert list(find_ids(infp)) == list(_iterparse_ids(BytesIO(data)))
+
+
 def test_wrap_elements_in_links():
     with open(EXAMPLE_SVG_PATH, 'rb') as infp:
         tree = wrap_elements_in_links(infp, {
@@ -22,3 +69,14 @@ def test_wrap_elements_in_links():
     assert '/hello' in svg
     assert '/world' in svg
     assert '_blank' in svg
+
+
+def test_chunked_serialization():
+    links = {'green': '/hello', 'blue': Link('/world', target='_blank')}
+    expected = serialize_svg(wrap_elements_in_links(BytesIO(EXAMPLE_SVG_DATA), links)).encode('UTF-8')
+    chunks = list(iter_serialize_svg(wrap_elements_in_links(BytesIO(EXAMPLE_SVG_DATA), links), chunk_size=100))
+    assert max(len(chunk) for chunk in chunks) == 100
+    assert b''.join(chunks) == expected
+    output = BytesIO()
+    write_svg(wrap_elements_in_links(BytesIO(EXAMPLE_SVG_DATA), links), output)
+    assert output.getvalue() == expected
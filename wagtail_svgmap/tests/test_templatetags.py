@@ -0,0 +1,38 @@
+import pytest
+from django.template import engines, TemplateSyntaxError
+
+from wagtail_svgmap.models import ImageMap
+from wagtail_svgmap.tests.utils import commit
+
+
+def render(template_code, **context):
+    template = engines['django'].from_string('{% load wagtail_svgmap_tags %}' + template_code)
+    return template.render(context)
+
+
+@pytest.mark.django_db
+def test_svgmap_tag(rf, example_imagemap):
+    example_imagemap.regions.create(element_id='green', link_external='/foobar')
+    commit()
+    example_imagemap = ImageMap.objects.get(pk=example_imagemap.pk)
+    html = render('{% svgmap image_map css_class="huijui" %}', image_map=example_imagemap)
+    assert 'class="wagtail-svgmap huijui"' in html
+    assert '/foobar' in html
+    assert render('{% svgmap image_map_id %}', image_map_id=example_imagemap.pk).count('/foobar') == 1
+    assert render('{% svgmap image_map %}', image_map=None) == ''
+    assert render('{% svgmap 1000 %}') == ''
+    # Repeated maps are referenced within the page (request), like in StreamFields
+    html = render('{% svgmap image_map %}{% svgmap image_map %}', image_map=example_imagemap, request=rf.get('/'))
+    assert html.count('/foobar') == 1
+    assert '<use' in html
+
+
+@pytest.mark.django_db
+def test_svgmap_tag_options(example_imagemap):
+    html = render('{% svgmap image_map inline=False %}', image_map=example_imagemap)
+    assert '<object data="%s"' % example_imagemap.svg_url in html
+    html = render('{% svgmap image_map lazy=True lazy_margin="50px" %}', image_map=example_imagemap)
+    assert 'data-svgmap-src' in html
+    assert 'rootMargin:"50px"' in html
+    with pytest.raises(TemplateSyntaxError):
+        render('{% svgmap image_map huijui=True %}', image_map=example_imagemap)
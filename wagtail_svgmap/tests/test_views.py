@@ -0,0 +1,113 @@
+import pytest
+from django.urls import reverse
+
+try:
+    from wagtail.core.models import Page, Site
+except ImportError:
+    from wagtail.wagtailcore.models import Page, Site
+
+from wagtail_svgmap.blocks import ImageMapBlock
+from wagtail_svgmap.models import ImageMap, SVG_URL_VERSION_LENGTH
+from wagtail_svgmap.tests.utils import commit
+from wagtail_svgmap.views import serve_svg
+
+
+@pytest.mark.django_db
+def test_serve_svg(client, example_imagemap):
+    url = example_imagemap.svg_url
+    assert url.startswith('/svgmap/%d/' % example_imagemap.pk)
+    response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('image/svg+xml')
+    assert response['Content-Encoding'] == 'gzip'
+    assert response['ETag'] == '"%s-gzip"' % example_imagemap.rendered_svg_digest
+    assert 'immutable' in response['Cache-Control']
+    assert response['Last-Modified']
+
+    # Conditional requests are answered without the SVG
+    response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+    assert not response.content
+    latest_url = reverse('wagtail_svgmap_svg_latest', kwargs={'image_map_id': example_imagemap.pk})
+    response = client.get(latest_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+    assert response.status_code == 304
+    assert 'no-cache' in response['Cache-Control']
+
+
+@pytest.mark.django_db
+def test_serve_outdated_svg(client, example_imagemap):
+    url = example_imagemap.svg_url
+    example_imagemap.regions.create(element_id='red', link_external='/foobar')
+    commit()
+    response = client.get(url)
+    assert response.status_code == 302
+    new_url = ImageMap.objects.get(pk=example_imagemap.pk).svg_url
+    assert response['Location'].endswith(new_url) and new_url != url
+    response = client.get(new_url, HTTP_IF_NONE_MATCH='"%s"' % example_imagemap.rendered_svg_digest)
+    assert response.status_code == 200
+    assert b'/foobar' in b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_serve_truncated_version(client, rf, example_imagemap):
+    # Only the canonical (full-length) versioned URL may be cached forever
+    url = example_imagemap.svg_url
+    digest = example_imagemap.rendered_svg_digest
+    assert url.endswith('/%s.svg' % digest[:SVG_URL_VERSION_LENGTH])
+    truncated_url = url.replace(digest[:SVG_URL_VERSION_LENGTH], digest[:4])
+    assert client.get(truncated_url).status_code == 404
+    response = serve_svg(rf.get(truncated_url), example_imagemap.pk, version=digest[:4])
+    assert response.status_code == 302
+    assert response['Location'] == url
+    assert 'immutable' not in response.get('Cache-Control', '')
+
+
+@pytest.mark.django_db
+def test_serve_missing_svg(client):
+    assert client.get(reverse('wagtail_svgmap_svg_latest', kwargs={'image_map_id': 42})).status_code == 404
+
+
+class ReferencingImageMapBlock(ImageMapBlock):
+    inline = False
+
+
+@pytest.mark.django_db
+def test_imagemap_block_by_reference(example_imagemap):
+    block = ReferencingImageMapBlock()
+    html = block.render(block.to_python({'map': example_imagemap.pk, 'css_class': ''}))
+    assert '<object data="%s"' % example_imagemap.svg_url in html
+    assert '<svg' not in html
+
+
+@pytest.mark.django_db
+def test_serve_svg_site_variant(client, rf, root_page, example_imagemap):
+    page = root_page.add_child(instance=Page(title='nnep', slug='nnep'))
+    site = Site.objects.get()
+    Site.objects.create(hostname='other.example.com', root_page=page)
+    example_imagemap.regions.create(element_id='green', link_page=root_page)
+    commit()
+    image_map = ImageMap.objects.get(pk=example_imagemap.pk)
+
+    class LazyImageMapBlock(ImageMapBlock):
+        lazy = True
+
+    # Lazily loaded (and referenced) maps are fetched in the variant for the site, just like inlined ones
+    request = rf.get('/')
+    request.site = site
+    url = image_map.get_svg_url(site=site)
+    assert url != image_map.svg_url
+    assert image_map.get_svg_url(site=site, language='fi') == url  # (The URLs aren't language-prefixed.)
+    for block in (LazyImageMapBlock(), ReferencingImageMapBlock()):
+        html = block.render(block.to_python({'map': image_map.pk, 'css_class': ''}), context={'request': request})
+        assert '"%s"' % url in html and image_map.svg_url not in html
+    response = client.get(url)
+    assert response.status_code == 200
+    assert b'href="/"' in response.content
+    assert b'href="/"' not in b''.join(client.get(image_map.svg_url).streaming_content)
+    etag = response['ETag']
+    assert etag != '"%s"' % image_map.rendered_svg_digest
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    # Outdated variants are redirected to the current one
+    response = client.get(url.replace(image_map.rendered_svg_digest[:16], '0' * 16))
+    assert response.status_code == 302 and response['Location'].endswith(url)
+    assert client.get(url.replace('/%d.svg' % site.pk, '/12345.svg')).status_code == 404
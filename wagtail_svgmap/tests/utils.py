@@ -1,5 +1,7 @@
 import os
 
+from django.db import connection
+
 EXAMPLE_SVG_PATH = os.path.join(os.path.dirname(__file__), 'example.svg')
 IDS_IN_EXAMPLE_SVG = {'red', 'yellow', 'blue', 'green'}
 IDS_IN_EXAMPLE2_SVG = {'punainen', 'keltainen', 'sininen', 'vihrea'}
@@ -14,3 +16,13 @@ EXAMPLE2_SVG_DATA = (
     .replace(b'"blue"', b'"sininen"')
     .replace(b'"yellow"', b'"keltainen"')
 )
+
+
+def commit():
+    """
+    Run the `on_commit` callbacks, as if the test transaction had been committed.
+    """
+    callbacks = connection.run_on_commit
+    connection.run_on_commit = []
+    for callback in callbacks:
+        callback[1]()
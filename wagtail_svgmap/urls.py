@@ -0,0 +1,23 @@
+from django.conf.urls import url
+
+from wagtail_svgmap.models import SVG_URL_VERSION_LENGTH
+from wagtail_svgmap.views import serve_svg
+
+# Only full-length versions are accepted, since versioned responses may be cached forever.
+_VERSION_PATTERN = r'(?P<version>[0-9a-f]{%d})' % SVG_URL_VERSION_LENGTH
+
+# Include these in your URLconf (e.g. `url(r'^svgmap/', include('wagtail_svgmap.urls'))`)
+# to serve the rendered SVGs as standalone documents; see `ImageMap.svg_url`.
+urlpatterns = [
+    url(r'^(?P<image_map_id>\d+)/' + _VERSION_PATTERN + r'\.svg$', serve_svg, name='wagtail_svgmap_svg'),
+    url(r'^(?P<image_map_id>\d+)\.svg$', serve_svg, name='wagtail_svgmap_svg_latest'),
+    # The variants for sites (and languages); see `ImageMap.get_svg_url`.
+    url(
+        r'^(?P<image_map_id>\d+)/' + _VERSION_PATTERN + r'/(?P<site_id>\d+)\.svg$',
+        serve_svg, name='wagtail_svgmap_svg_variant',
+    ),
+    url(
+        r'^(?P<image_map_id>\d+)/' + _VERSION_PATTERN + r'/(?P<site_id>\d+)/(?P<language>[\w-]+)\.svg$',
+        serve_svg, name='wagtail_svgmap_svg_variant',
+    ),
+]
@@ -0,0 +1,129 @@
+import calendar
+
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+try:
+    from wagtail.core.models import Site
+except ImportError:
+    from wagtail.wagtailcore.models import Site
+
+from wagtail_svgmap.compression import choose_encoding
+from wagtail_svgmap.models import ImageMap, SVG_URL_VERSION_LENGTH
+
+SVG_CONTENT_TYPE = 'image/svg+xml; charset=utf-8'
+
+#: Precompressed content codings, in order of preference.
+PRECOMPRESSED_ENCODINGS = ('br', 'gzip')
+
+#: How long (in seconds) the versioned SVG URLs may be cached for: a year, i.e. forever.
+SVG_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def svg_response(request, image_map, site=None, language=None):
+    """
+    Build a response serving the rendered SVG of an image map as a standalone document.
+
+    The precompressed variant of the SVG best matching the request's `Accept-Encoding` is served as-is,
+    so no compression work is done per request.  If none is acceptable, the SVG is streamed uncompressed.
+    The variants for sites (see `ImageMap.get_rendered_svg`) aren't precompressed, so they're served uncompressed.
+
+    :param request: The request being served.
+    :type request: django.http.HttpRequest
+    :param image_map: The image map to serve.
+    :type image_map: wagtail_svgmap.models.ImageMap
+    :param site: The site to serve the variant of, if any.
+    :type site: wagtail.core.models.Site|None
+    :param language: The active language (only matters if page URLs are language-prefixed).
+    :type language: str|None
+    :rtype: django.http.HttpResponse|django.http.StreamingHttpResponse
+    """
+    if site is not None and image_map._has_variants:
+        content = force_bytes(image_map.get_rendered_svg(site=site, language=language))
+        response = HttpResponse(content, content_type=SVG_CONTENT_TYPE)
+        response['Content-Length'] = str(len(content))
+        response['ETag'] = _get_etag(_get_variant_digest(image_map, site, language))
+        return response
+    variants = image_map.precompressed_svg_variants
+    encoding = choose_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        [coding for coding in PRECOMPRESSED_ENCODINGS if coding in variants],
+    )
+    if encoding:
+        content = variants[encoding]
+        response = HttpResponse(content, content_type=SVG_CONTENT_TYPE)
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+    else:
+        response = StreamingHttpResponse(image_map.iter_rendered_svg(), content_type=SVG_CONTENT_TYPE)
+    # Each variant is a different representation, so they get different entity tags.
+    response['ETag'] = _get_etag(image_map.rendered_svg_digest, encoding)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def _get_etag(digest, encoding=None):
+    return '"%s%s"' % (digest, ('-%s' % encoding if encoding else ''))
+
+
+def _get_variant_digest(image_map, site=None, language=None):
+    # (The variants are rendered along with the main render, so its digest identifies them too.)
+    digest = image_map.rendered_svg_digest
+    if site is None or not image_map._has_variants:
+        return digest
+    return '%s-%s%s' % (digest, site.pk, ('-%s' % language if language else ''))
+
+
+@require_safe
+def serve_svg(request, image_map_id, version=None, site_id=None, language=None):
+    """
+    Serve the rendered SVG of an image map as a standalone document (see `ImageMap.svg_url`).
+
+    With a version (a prefix of the render digest) in the URL, the response may be cached forever;
+    requests for an outdated (or truncated) version are redirected to the current one.  Without one, caches must
+    revalidate the response, which conditional requests (`If-None-Match`/`If-Modified-Since`) make cheap:
+    they're answered without loading the SVG.
+
+    :param request: The request being served.
+    :type request: django.http.HttpRequest
+    :param image_map_id: The ID of the image map.
+    :type image_map_id: str
+    :param version: The version of the SVG (a prefix of its render digest), if any.
+    :type version: str|None
+    :param site_id: The ID of the site to serve the variant of (see `ImageMap.get_svg_url`), if any.
+    :type site_id: str|None
+    :param language: The language to serve the variant of, if any.
+    :type language: str|None
+    :rtype: django.http.HttpResponse|django.http.StreamingHttpResponse
+    """
+    image_map = get_object_or_404(ImageMap, pk=image_map_id)
+    site = (get_object_or_404(Site, pk=site_id) if site_id else None)
+    digest = image_map.rendered_svg_digest
+    if version and (len(version) != SVG_URL_VERSION_LENGTH or not digest.startswith(version)):
+        return redirect(image_map.get_svg_url(site=site, language=language))
+    rendered_at = image_map.rendered_at
+    last_modified = (calendar.timegm(rendered_at.utctimetuple()) if rendered_at else None)
+
+    response = None
+    # The client may hold any of the representations (see `svg_response`); they're all current if the digest is.
+    variant_digest = _get_variant_digest(image_map, site, language)
+    for encoding in (None,) + PRECOMPRESSED_ENCODINGS:
+        etag = _get_etag(variant_digest, encoding)
+        if isinstance(get_conditional_response(request, etag, last_modified), HttpResponseNotModified):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept-Encoding',))
+            break
+    if response is None:
+        response = svg_response(request, image_map, site=site, language=language)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    if version:
+        patch_cache_control(response, public=True, max_age=SVG_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
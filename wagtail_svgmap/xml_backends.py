@@ -0,0 +1,221 @@
+"""
+XML backends for `wagtail_svgmap.svg`.
+
+A backend knows how to parse SVG documents into trees, how to create new elements for those trees,
+and how to serialize them again.  The built-in `ElementTree` backend is used by default; the `lxml` backend
+(if `lxml` is installed) may be chosen with the `WAGTAIL_SVGMAP_XML_BACKEND` setting, either by name (`etree`
+or `lxml`) or by the dotted path of a backend class.  Mind that `lxml` trees have to be converted for
+serialization, so as a whole, processing large maps with `lxml` is slower (see `benchmarks/svg_bench.py`).
+
+No matter the backend, serialized output is identical, since it is always written by `ElementTree`.
+"""
+import six
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+if six.PY2:  # pragma: no cover
+    from xml.etree import cElementTree as ET
+else:  # pragma: no cover
+    from xml.etree import ElementTree as ET
+
+try:  # pragma: no cover
+    from lxml import etree as lxml_etree
+except ImportError:  # pragma: no cover
+    lxml_etree = None
+
+# (`ET.Element` is a factory function, not a class, in Python 2's `cElementTree`.)
+_ETREE_ELEMENT_TYPE = type(ET.Element('svg'))
+
+
+class ElementTreeBackend(object):
+    """
+    XML backend using the standard library's `xml.etree.ElementTree`.
+    """
+
+    name = 'etree'
+
+    def parse(self, source):
+        """
+        Parse a SVG document.
+
+        :param source: A filename or a file-like object.
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        return ET.parse(source)
+
+    def iterparse(self, source, events=('end',)):
+        """
+        Incrementally parse a SVG document, the way `ElementTree.iterparse` does.
+
+        Comments and processing instructions are never reported.
+
+        :param source: A filename or a file-like object.
+        :param events: The events to report.
+        :return: Iterator of (event, element) pairs.
+        """
+        return ET.iterparse(source, events=events)
+
+    def Element(self, tag, attrib):  # noqa: N802
+        """
+        Create a new element for trees of this backend.
+        """
+        return ET.Element(tag, attrib)
+
+    def ElementTree(self, root):  # noqa: N802
+        """
+        Wrap an element of this backend in a tree.
+        """
+        return ET.ElementTree(root)
+
+    def is_element(self, element):
+        """
+        Figure out whether the given element belongs to this backend.
+
+        :rtype: bool
+        """
+        return isinstance(element, _ETREE_ELEMENT_TYPE)
+
+    def wrap(self, parent, index, element, wrapper):
+        """
+        Wrap a child element in another (new) element, in place.
+
+        :param parent: The parent element.
+        :param index: The index of the element in the parent.
+        :type index: int
+        :param element: The element to wrap.
+        :param wrapper: The element to wrap it in; it takes the element's place in the parent.
+        """
+        parent[index] = wrapper
+        wrapper.append(element)
+
+    def to_etree(self, tree):
+        """
+        Convert a tree of this backend into an `ElementTree` tree (for serialization).
+
+        :rtype: xml.etree.ElementTree.ElementTree
+        """
+        return tree
+
+    def write(self, tree, stream, encoding='UTF-8', xml_declaration=True, default_namespace=None):
+        """
+        Serialize a tree of this backend into a binary stream, the way `ElementTree.write` does.
+        """
+        self.to_etree(tree).write(
+            stream,
+            encoding=encoding,
+            xml_declaration=xml_declaration,
+            default_namespace=default_namespace,
+        )
+
+
+class LXMLBackend(ElementTreeBackend):
+    """
+    XML backend using `lxml`.
+
+    The parsers are configured to behave like `ElementTree`'s: comments and processing instructions
+    are dropped, and external entities are never loaded.
+    """
+
+    name = 'lxml'
+
+    def __init__(self):
+        if lxml_etree is None:  # pragma: no cover
+            raise ImproperlyConfigured('The lxml XML backend for wagtail_svgmap requires lxml to be installed.')
+        self.parser_options = {
+            'remove_comments': True,
+            'remove_pis': True,
+            'no_network': True,
+        }
+        # Internal entities are expanded like `ElementTree` does, but external ones (e.g. `SYSTEM "file:///..."`)
+        # must never be, lest uploaded SVGs read files off the server.  Before lxml 5, that's only possible
+        # by not expanding any entities at all.
+        self.parser_options['resolve_entities'] = ('internal' if lxml_etree.LXML_VERSION >= (5,) else False)
+
+    def parse(self, source):
+        return lxml_etree.parse(source, parser=lxml_etree.XMLParser(**self.parser_options))
+
+    def iterparse(self, source, events=('end',)):
+        return lxml_etree.iterparse(source, events=events, **self.parser_options)
+
+    def Element(self, tag, attrib):  # noqa: N802
+        return lxml_etree.Element(tag, attrib)
+
+    def ElementTree(self, root):  # noqa: N802
+        return lxml_etree.ElementTree(root)
+
+    def is_element(self, element):
+        return isinstance(element, lxml_etree._Element)
+
+    def wrap(self, parent, index, element, wrapper):
+        # (Setting `parent[index]` means a linear walk of the children in lxml, i.e. quadratic wrapping.)
+        element.addprevious(wrapper)
+        wrapper.append(element)
+
+    def to_etree(self, tree):
+        # Round-tripping through a string is the fastest way to get there, since both ends are in C.
+        return ET.ElementTree(ET.fromstring(lxml_etree.tostring(tree.getroot())))
+
+
+BACKENDS = {
+    'etree': ElementTreeBackend,
+    'lxml': LXMLBackend,
+}
+
+_backend_cache = {}
+
+
+def get_backend_name():
+    """
+    Get the name (or class path) of the XML backend to use, according to settings.
+
+    :rtype: str
+    """
+    if settings.configured:  # pragma: no branch
+        name = getattr(settings, 'WAGTAIL_SVGMAP_XML_BACKEND', None)
+        if name:
+            return name
+    return 'etree'
+
+
+def get_backend(name=None):
+    """
+    Get an XML backend instance.
+
+    :param name: A backend name or class path; if not set, the configured backend is returned.
+    :type name: str|None
+    :rtype: ElementTreeBackend
+    """
+    if not name:
+        name = get_backend_name()
+    backend = _backend_cache.get(name)
+    if backend is None:
+        if name in BACKENDS:
+            backend_class = BACKENDS[name]
+        else:
+            try:
+                backend_class = import_string(name)
+            except ImportError as ie:
+                raise ImproperlyConfigured('Invalid wagtail_svgmap XML backend %r: %s' % (name, ie))
+        backend = _backend_cache[name] = backend_class()
+    return backend
+
+
+def get_tree_backend(tree):
+    """
+    Get the XML backend the given tree belongs to.
+
+    :param tree: An `ElementTree` (or `lxml`) tree.
+    :rtype: ElementTreeBackend
+    """
+    root = tree.getroot()
+    configured_backend = get_backend()
+    if configured_backend.is_element(root):
+        return configured_backend
+    for name in BACKENDS:
+        if name == 'lxml' and lxml_etree is None:  # pragma: no cover
+            continue
+        backend = get_backend(name)
+        if backend.is_element(root):
+            return backend
+    raise ValueError('No XML backend for %r' % tree)  # pragma: no cover
@@ -100,6 +100,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(VAR_DIR, 'wsm_test.sqlite3'),
+        # (On disk, rather than in memory, so the worker processes of `svgmap_recache` see the test database.)
+        'TEST': {'NAME': os.path.join(VAR_DIR, 'wsm_test_test.sqlite3')},
     }
 }
 LANGUAGE_CODE = 'en-us'
@@ -18,6 +18,7 @@ urlpatterns = [
     url(r'^django-admin/', admin.site.urls),
     url(r'^admin/', include(wagtailadmin_urls)),
     url(r'^documents/', include(wagtaildocs_urls)),
+    url(r'^svgmap/', include('wagtail_svgmap.urls')),
     url(r'', include(wagtail_urls)),
 ]
 